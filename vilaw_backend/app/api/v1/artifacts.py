@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+from app.db.session import run_db
+from app.services.artifact_store import ArtifactStore
+
+router = APIRouter()
+store = ArtifactStore()
+
+
+@router.get("/{sha256}")
+async def get_artifact(sha256: str, request: Request):
+    """
+    Tải file đã sinh (DOCX...). Nội dung không đổi theo URL nên ETag là sha256 và được cache lâu dài;
+    hỗ trợ If-None-Match (304) và Range / If-Range (206).
+    """
+    return await _artifact_response(sha256, request)
+
+
+@router.head("/{sha256}", operation_id="head_artifact")
+async def head_artifact(sha256: str, request: Request):
+    """Như GET nhưng chỉ trả header (kích thước, ETag) để client kiểm tra file trước khi tải."""
+    return await _artifact_response(sha256, request)
+
+
+async def _artifact_response(sha256: str, request: Request) -> Response:
+    artifact = await run_db(store.get, sha256)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy file")
+
+    etag = f'"{artifact.sha256}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(
+        store.path_for(artifact.sha256),
+        media_type=artifact.content_type,
+        filename=artifact.filename,
+        headers=headers,
+    )
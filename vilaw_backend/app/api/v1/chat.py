@@ -1,4 +1,5 @@
-from fastapi import APIRouter
+import uuid
+from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 from app.schemas.chat_schema import ChatRequest
 from app.services.rag_service import RAGService
@@ -11,11 +12,19 @@ async def chat_endpoint(request: ChatRequest):
     """
     API Chat tư vấn luật (Streaming).
     """
-    conversation_id = request.conversation_id or '1'
+    # Chờ index/LLM (warm-up nền có thể chưa xong) trước khi mở stream để còn trả được mã lỗi
+    try:
+        await rag_service.ensure_ready()
+    except Exception as e:
+        print(f"RAGService: failed to init resources: {e}")
+        raise HTTPException(status_code=503, detail="Dịch vụ tra cứu pháp luật chưa sẵn sàng, vui lòng thử lại sau.",
+                            headers={"Retry-After": "10"})
+    conversation_id = request.conversation_id or uuid.uuid4().hex
     return StreamingResponse(
         rag_service.chat_stream(
             message=request.message,
             conversation_id=conversation_id
         ),
-        media_type="text/event-stream"
+        media_type="text/event-stream",
+        headers={"X-Conversation-Id": conversation_id},
     )
\ No newline at end of file
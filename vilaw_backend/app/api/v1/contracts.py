@@ -1,11 +1,22 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from typing import Literal
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import Response, StreamingResponse
+from urllib.parse import quote
 from app.services.drafter import DrafterService
-from app.schemas.contract_schema import ContractDraftRequest, ContractDraftResponse, RiskAnalysisRequest, RiskAnalysisResponse
+from app.schemas.contract_schema import (
+    ContractDraftRequest, ContractDraftResponse, DocxExportRequest, RiskAnalysisRequest, RiskAnalysisResponse,
+    BatchRiskRequest, BatchRiskJobResponse,
+)
 from app.services.risk_checker import RiskCheckerService
+from app.services.batch_risk import BatchRiskService, parse_batch_upload
+from app.services.upload_pipeline import receive_upload
+from app.services.docx_renderer import render_docx
+from app.core.config import settings
+from app.core.exceptions import UploadRejected
 
+# Service (kèm LLM client) được tạo ở request đầu tiên, không phải lúc import router
 router = APIRouter()
-drafter_service = DrafterService()
-risk_service = RiskCheckerService()
 
 @router.post("/draft", response_model=ContractDraftResponse)
 async def draft_endpoint(request: ContractDraftRequest):
@@ -13,11 +24,38 @@ async def draft_endpoint(request: ContractDraftRequest):
     POST /api/v1/contracts/draft
     """
     try:
-        return await drafter_service.draft_contract(request)
+        return await DrafterService().draft_contract(request)
     except Exception as e:
         print(f"Error: {e}")
         raise HTTPException(status_code=500, detail="Lỗi hệ thống khi soạn thảo.")
 
+@router.post("/draft/stream")
+async def draft_stream_endpoint(request: ContractDraftRequest):
+    """
+    POST /api/v1/contracts/draft/stream (SSE)
+    Event `token` trả từng đoạn văn bản; `risk` trả kết quả rà soát mỗi Điều ngay khi Điều đó
+    sinh xong (song song với phần còn lại); `done` kèm download_url và risk_report.
+    """
+    return StreamingResponse(
+        DrafterService().draft_stream(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/export-docx")
+async def export_docx_endpoint(request: DocxExportRequest):
+    """
+    POST /api/v1/contracts/export-docx
+    Render DOCX trong RAM và trả thẳng về client (không ghi file lên server).
+    """
+    data = await asyncio.to_thread(render_docx, request.content)
+    filename = f"ViLaw_{request.document_type.replace(' ', '_')}.docx"
+    return Response(
+        content=data,
+        media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"},
+    )
+
 @router.post("/check-risk", response_model=RiskAnalysisResponse)
 async def check_risk_endpoint(request: RiskAnalysisRequest):
     """
@@ -25,7 +63,7 @@ async def check_risk_endpoint(request: RiskAnalysisRequest):
     Input: Nội dung văn bản text.
     Output: Báo cáo rủi ro chi tiết (JSON).
     """
-    result = await risk_service.analyze_document(request)
+    result = await RiskCheckerService().analyze_document(request)
     # Sanitize output to match response model: ensure `legal_basis` is a string
     try:
         risks = result.get("risks") if isinstance(result, dict) else None
@@ -36,3 +74,68 @@ async def check_risk_endpoint(request: RiskAnalysisRequest):
     except Exception:
         pass
     return result
+
+
+@router.post("/check-risk/batch", response_model=BatchRiskJobResponse, status_code=202)
+async def create_batch_risk_job(request: BatchRiskRequest):
+    """
+    Rà soát rủi ro hàng loạt: trả về job_id ngay, kết quả lấy qua `results_url` (NDJSON).
+    """
+    try:
+        job = await BatchRiskService().create_job(
+            [doc.dict() for doc in request.documents], request.contract_type, request.screening
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.to_dict()
+
+
+@router.post("/check-risk/batch/upload", response_model=BatchRiskJobResponse, status_code=202)
+async def upload_batch_risk_job(
+    contract_type: str = Form(...),
+    screening: Literal["full", "hybrid", "fast"] = Form("full"),
+    file: UploadFile = File(...),
+):
+    """
+    Tạo batch job từ file .zip (các file .txt/.md) hoặc .ndjson (mỗi dòng một văn bản).
+    """
+    try:
+        stored = await receive_upload(
+            file, max_bytes=settings.BATCH_UPLOAD_MAX_BYTES, extensions={".zip", ".ndjson", ".jsonl"}
+        )
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    try:
+        documents = await asyncio.to_thread(parse_batch_upload, stored.path, stored.filename)
+        job = await BatchRiskService().create_job(documents, contract_type, screening)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"File batch không hợp lệ: {e}")
+    except Exception as e:
+        print(f"Error: {e}")
+        raise HTTPException(status_code=400, detail="Không đọc được file batch.")
+    finally:
+        await asyncio.to_thread(stored.remove)
+    return job.to_dict()
+
+
+@router.get("/check-risk/batch/{job_id}", response_model=BatchRiskJobResponse)
+async def get_batch_risk_job(job_id: str):
+    job = await BatchRiskService().get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Không tìm thấy batch job")
+    return job.to_dict()
+
+
+@router.get("/check-risk/batch/{job_id}/results")
+async def stream_batch_risk_results(
+    job_id: str,
+    offset: int = Query(0, ge=0, description="Bỏ qua `offset` kết quả đầu (dùng `seq` cuối cùng + 1 để nối tiếp)"),
+    follow: bool = Query(True, description="Giữ kết nối và stream tiếp cho tới khi job hoàn tất"),
+):
+    job = await BatchRiskService().get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Không tìm thấy batch job")
+    return StreamingResponse(
+        BatchRiskService().iter_results(job.job_id, offset=offset, follow=follow),
+        media_type="application/x-ndjson",
+    )
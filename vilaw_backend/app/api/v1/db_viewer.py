@@ -1,72 +1,190 @@
 import os
-import shutil
 import json
-from fastapi import APIRouter, Depends, UploadFile, File, BackgroundTasks, HTTPException
+import asyncio
+import base64
+from datetime import datetime
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, tuple_
 from sqlalchemy.orm import Session
-from app.db.session import SessionLocal
+from app.db.session import AsyncDB, SessionLocal, db_stats, get_async_db, get_db, run_db
 from app.db.models import LawChunk, OCRDocument, LawDocument
-from app.services.rag_service import RAGService
+from app.services.upload_pipeline import receive_upload, safe_filename
+from app.services.pdf_ingest import PdfIngestService
+from app.services.job_queue import JobQueue, job_to_dict
+from app.core.exceptions import UploadRejected
 
 router = APIRouter()
 UPLOAD_DIR = "static/docs"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
-def get_db():
-    db = SessionLocal()
+
+# --- Danh sách cho Admin Dashboard: phân trang keyset, chỉ lấy cột cần thiết ---
+# Trang JSON trả về list như cũ, cursor trang sau nằm ở header X-Next-Cursor (không có = trang cuối).
+# format=ndjson: stream toàn bộ kết quả (từ cursor) theo lô, mỗi dòng một bản ghi.
+
+PREVIEW_CHARS = 100
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 500
+_STREAM_BATCH = 500
+# created_at nullable (chỉ có default): bản ghi cũ NULL được coi như mốc này khi sắp xếp/phân trang => nằm cuối danh sách
+_NULL_CREATED_AT = datetime(1970, 1, 1)
+
+
+def _encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: Optional[str], parse) -> Optional[tuple]:
+    """`parse` chuyển list trong cursor về giá trị khoá sắp xếp (kiểm tra kiểu luôn)."""
+    if not cursor:
+        return None
     try:
-        yield db
-    finally:
-        db.close()
+        return parse(json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))))
+    except (ValueError, TypeError, IndexError, KeyError):
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+
 
+def _stream_ndjson(fetch, to_item, cursor_of, parse_cursor, after):
+    """Mỗi lô dùng session/transaction ngắn riêng: không giữ read transaction suốt lúc client tải."""
+    while True:
+        db = SessionLocal()
+        try:
+            rows = fetch(db, after, _STREAM_BATCH)
+        finally:
+            db.close()
+        for row in rows:
+            yield json.dumps(jsonable_encoder(to_item(row)), ensure_ascii=False) + "\n"
+        if len(rows) < _STREAM_BATCH:
+            return
+        after = parse_cursor(cursor_of(rows[-1]))
+
+
+def _list_page(db: Session, response: Response, fetch, to_item, cursor_of, parse_cursor, cursor, limit, format):
+    after = _decode_cursor(cursor, parse_cursor)
+    if format == "ndjson":
+        return StreamingResponse(_stream_ndjson(fetch, to_item, cursor_of, parse_cursor, after), media_type="application/x-ndjson")
+    rows = fetch(db, after, limit + 1)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(cursor_of(rows[-1]))
+    return [to_item(row) for row in rows]
+
+
+def _ocr_document_item(row) -> dict:
+    ext = None
+    if row.filename and "." in row.filename:
+        ext = row.filename.rsplit('.', 1)[-1].lower()
+    return {
+        "id": row.id,
+        "filename": row.filename,
+        "filetype": ext,
+        "created_at": row.created_at,
+        "ocr_text_preview": row.preview + "..." if row.preview else "Chưa có nội dung"
+    }
 
 
 @router.get("/db/ocr-documents", tags=["Admin Dashboard"])
-def list_ocr_documents(db: Session = Depends(get_db)):
-    docs = db.query(OCRDocument).order_by(OCRDocument.created_at.desc()).all()
-    result = []
-    for doc in docs:
-        ext = None
-        if doc.filename and "." in doc.filename:
-            ext = doc.filename.rsplit('.', 1)[-1].lower()
-        result.append({
-            "id": doc.id,
-            "filename": doc.filename,
-            "filetype": ext,
-            "created_at": doc.created_at,
-            "ocr_text_preview": doc.ocr_text[:100] + "..." if doc.ocr_text else "Chưa có nội dung"
-        })
-    return result
+def list_ocr_documents(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    q: Optional[str] = Query(None, description="Lọc theo tên file (không phân biệt hoa thường)"),
+    filetype: Optional[str] = Query(None, description="Đuôi file, vd: pdf, png"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    format: Literal["json", "ndjson"] = "json",
+    db: Session = Depends(get_db),
+):
+    """Tài liệu OCR mới nhất trước (created_at, id giảm dần; created_at NULL xếp cuối); preview cắt bằng substr() trong SQL."""
+    sort_key = func.coalesce(OCRDocument.created_at, _NULL_CREATED_AT)
+
+    def fetch(session: Session, after: Optional[tuple], size: int):
+        query = session.query(
+            OCRDocument.id, OCRDocument.filename, OCRDocument.created_at, sort_key.label("sort_key"),
+            func.substr(OCRDocument.ocr_text, 1, PREVIEW_CHARS).label("preview"),
+        )
+        if q:
+            query = query.filter(OCRDocument.filename.icontains(q, autoescape=True))
+        if filetype:
+            query = query.filter(OCRDocument.filename.iendswith("." + filetype.lstrip("."), autoescape=True))
+        if created_from:
+            query = query.filter(OCRDocument.created_at >= created_from)
+        if created_to:
+            query = query.filter(OCRDocument.created_at < created_to)
+        if after:
+            query = query.filter(tuple_(sort_key, OCRDocument.id) < after)
+        return query.order_by(sort_key.desc(), OCRDocument.id.desc()).limit(size).all()
+
+    return _list_page(db, response, fetch, _ocr_document_item,
+                      cursor_of=lambda row: [row.sort_key.isoformat(), row.id],
+                      parse_cursor=lambda v: (datetime.fromisoformat(v[0]), int(v[1])),
+                      cursor=cursor, limit=limit, format=format)
+
+@router.get("/db/stats", tags=["Admin Dashboard"])
+def database_stats():
+    """Trạng thái pool connection và thời gian query theo loại câu lệnh (từ lúc process khởi động)."""
+    return db_stats()
 
 @router.get("/db/laws", tags=["Admin Dashboard"])
-def list_laws(db: Session = Depends(get_db)):
-    laws = db.query(LawChunk).order_by(LawChunk.id.desc()).all()
-    return [
-        {
-            "id": law.id,
-            "title": law.title,
-            "content_preview": law.content[:100] + "..." if law.content else "",
-            "document_id": law.document_id
+def list_laws(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    document_id: Optional[int] = None,
+    q: Optional[str] = Query(None, description="Lọc theo tiêu đề điều luật"),
+    format: Literal["json", "ndjson"] = "json",
+    db: Session = Depends(get_db),
+):
+    """Điều luật mới nhất trước (id giảm dần); preview cắt bằng substr() trong SQL."""
+    def fetch(session: Session, after: Optional[tuple], size: int):
+        query = session.query(
+            LawChunk.id, LawChunk.title, LawChunk.document_id,
+            func.substr(LawChunk.content, 1, PREVIEW_CHARS).label("preview"),
+        )
+        if document_id is not None:
+            query = query.filter(LawChunk.document_id == document_id)
+        if q:
+            query = query.filter(LawChunk.title.icontains(q, autoescape=True))
+        if after:
+            query = query.filter(LawChunk.id < after[0])
+        return query.order_by(LawChunk.id.desc()).limit(size).all()
+
+    def to_item(row) -> dict:
+        return {
+            "id": row.id,
+            "title": row.title,
+            "content_preview": row.preview + "..." if row.preview else "",
+            "document_id": row.document_id
         }
-        for law in laws
-    ]
+
+    return _list_page(db, response, fetch, to_item,
+                      cursor_of=lambda row: [row.id],
+                      parse_cursor=lambda v: (int(v[0]),),
+                      cursor=cursor, limit=limit, format=format)
 
 
 @router.post("/db/upload", tags=["Admin Dashboard"])
 async def upload_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncDB = Depends(get_async_db)
 ):
     """
     Upload file để dạy cho AI.
     - .json: Import vào bảng LawDocument & LawChunk (Dùng cho RAG).
     - .pdf: Import vào bảng OCRDocument (Lưu trữ file thô/OCR).
     """
-    # 1. Lưu file vật lý
-    file_path = os.path.join(UPLOAD_DIR, file.filename)
-    with open(file_path, "wb+") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # 1. Lưu file vật lý (ghi theo chunk ngoài event loop). PDF được job nền đọc sau => lưu tạm với tên
+    # duy nhất (hai PDF trùng tên upload liên tiếp không ghi đè nhau), job xoá file khi xong
+    is_pdf = (file.filename or "").lower().endswith(".pdf")
+    file_path = None if is_pdf else os.path.join(UPLOAD_DIR, safe_filename(file.filename))
+    try:
+        stored = await receive_upload(file, dest_path=file_path, extensions={".json", ".pdf"})
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
     imported_count = 0
     skipped_count = 0
@@ -75,103 +193,89 @@ async def upload_document(
 
     # JSON file processing
     if file.filename.lower().endswith(".json"):
+        doc_name = file.filename.rsplit('.', 1)[0].replace("_", " ")
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = await asyncio.to_thread(_read_json, stored.path)
             items = data if isinstance(data, list) else [data]
-            
-
-            doc_name = file.filename.rsplit('.', 1)[0].replace("_", " ")
-            
-            law_doc = db.query(LawDocument).filter(LawDocument.name == doc_name).first()
-            if not law_doc:
-                law_doc = LawDocument(name=doc_name, code_number="N/A")
-                db.add(law_doc)
-                db.commit()
-                db.refresh(law_doc) # Lấy ID thật sự từ DB
-
-
-            existing_chunks = db.query(LawChunk.title).filter(LawChunk.document_id == law_doc.id).all()
-            existing_titles = {chunk.title for chunk in existing_chunks}
-
-
-            new_chunks = []
-            for item in items:
-                title = item.get("title", "Không tiêu đề")
-                content = item.get("content", "")
-                
-                if title in existing_titles:
-                    skipped_count += 1
-                    continue
-
-                if content.strip():
-                    new_chunk = LawChunk(
-                        title=title,
-                        content=content,
-                        document_id=law_doc.id
-                    )
-                    new_chunks.append(new_chunk)
-                    imported_count += 1
-            
-            if new_chunks:
-                db.add_all(new_chunks)
-                db.commit()
-                trigger_rag = True # Có dữ liệu mới thì mới cần học lại
-
+            imported_count, skipped_count = await db.run(_import_law_chunks, doc_name, items)
+            trigger_rag = imported_count > 0 # Có dữ liệu mới thì mới cần học lại
             action_msg = f"Đã import {imported_count} điều luật vào '{doc_name}'. Bỏ qua {skipped_count} trùng lặp."
 
         except json.JSONDecodeError:
             return {"status": "error", "message": "File JSON sai cú pháp."}
         except Exception as e:
-            db.rollback()
             return {"status": "error", "message": f"Lỗi xử lý JSON: {str(e)}"}
 
 
-    # PDF file processing
-    elif file.filename.lower().endswith(".pdf"):
-        text_content = ""
-        try:
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    extract = page.extract_text()
-                    if extract: text_content += extract + "\n"
-        except Exception as e:
-            print(f"Lỗi đọc PDF: {e}")
-            
-        if not text_content.strip():
-            return {"status": "warning", "message": "File PDF không có text (ảnh scan)."}
-            
-        # Lưu vào bảng OCRDocument riêng biệt
-        new_doc = OCRDocument(
-            filename=file.filename,
-            ocr_text=text_content,
-            # filetype="pdf" # (Bỏ comment nếu model OCRDocument có cột này)
-        )
-        db.add(new_doc)
-        db.commit()
-        action_msg = "Đã lưu file PDF và nội dung OCR."
+    # PDF file processing: trích xuất theo trang trong background job, trả về job_id ngay
+    elif is_pdf:
+        job = await PdfIngestService().submit(stored)
+        return {**job_to_dict(job), "message": "Đã nhận file PDF, đang trích xuất nội dung từng trang."}
 
 
     else:
         return {"status": "error", "message": "Chỉ hỗ trợ .json hoặc .pdf"}
 
-    # Trigger RAG refresh
+    # Trigger RAG refresh (job nền, gộp với job đang chờ nếu có)
+    refresh_job_id = None
     if trigger_rag:
-        background_tasks.add_task(RAGService.refresh_knowledge)
+        refresh_job = await run_db(JobQueue().enqueue, "rag_refresh", None, unique=True)
+        refresh_job_id = refresh_job.id
         action_msg += " AI đang cập nhật dữ liệu..."
 
     return {
         "status": "success",
         "message": action_msg,
         "imported_count": imported_count,
-        "skipped_count": skipped_count
+        "skipped_count": skipped_count,
+        "job_id": refresh_job_id,
     }
 
 
+def _read_json(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _import_law_chunks(db: Session, doc_name: str, items: list):
+    """Thêm các điều luật chưa có (theo title) vào LawDocument `doc_name`; trả về (số đã thêm, số trùng)."""
+    imported_count = skipped_count = 0
+    try:
+        law_doc = db.query(LawDocument).filter(LawDocument.name == doc_name).first()
+        if not law_doc:
+            law_doc = LawDocument(name=doc_name, code_number="N/A")
+            db.add(law_doc)
+            db.commit()
+            db.refresh(law_doc) # Lấy ID thật sự từ DB
+
+        existing_chunks = db.query(LawChunk.title).filter(LawChunk.document_id == law_doc.id).all()
+        existing_titles = {chunk.title for chunk in existing_chunks}
+
+        new_chunks = []
+        for item in items:
+            title = item.get("title", "Không tiêu đề")
+            content = item.get("content", "")
+
+            if title in existing_titles:
+                skipped_count += 1
+                continue
+
+            if content.strip():
+                new_chunks.append(LawChunk(title=title, content=content, document_id=law_doc.id))
+                imported_count += 1
+
+        if new_chunks:
+            db.add_all(new_chunks)
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return imported_count, skipped_count
+
+
 @router.delete("/db/law-documents/{doc_id}", tags=["Admin Dashboard"])
 def delete_law_document(
     doc_id: int, 
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -189,6 +293,6 @@ def delete_law_document(
     db.commit()
 
     # Refresh RAG index
-    background_tasks.add_task(RAGService.refresh_knowledge)
+    refresh_job = JobQueue().enqueue("rag_refresh", unique=True)
 
-    return {"status": "success", "message": f"Đã xóa bộ luật '{doc.name}' và cập nhật lại AI."}
\ No newline at end of file
+    return {"status": "success", "message": f"Đã xóa bộ luật '{doc.name}' và cập nhật lại AI.", "job_id": refresh_job.id}
\ No newline at end of file
@@ -0,0 +1,47 @@
+import os
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse
+from app.core.profiling import RequestProfiler
+from app.core.tracing import TraceSink, trace_to_dict
+from app.schemas.diagnostics_schema import ProfileRequest
+
+# Mọi endpoint ở đây cần X-Admin-Token (gắn dependency require_admin lúc include router)
+router = APIRouter()
+
+
+@router.post("/profile")
+def arm_profile(data: ProfileRequest):
+    """Profile `count` request tiếp theo khớp `route` (mỗi lần một request) trong process nhận lệnh này."""
+    try:
+        target = RequestProfiler().arm(data.route, data.count, data.mode, data.method)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "armed", "target": vars(target)}
+
+
+@router.delete("/profile")
+def disarm_profile():
+    RequestProfiler().disarm()
+    return {"status": "disarmed"}
+
+
+@router.get("/profile")
+def profile_status():
+    """Lệnh profile đang chờ và danh sách kết quả gần nhất (không kèm nội dung)."""
+    return RequestProfiler().status()
+
+
+@router.get("/profile/{capture_id}")
+def get_profile(capture_id: str, download: bool = Query(False, description="Tải file .prof / .folded gốc")):
+    capture = RequestProfiler().get(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy kết quả profile")
+    if download:
+        return FileResponse(capture["file"], filename=os.path.basename(capture["file"]))
+    return capture
+
+
+@router.get("/traces/slow")
+def slow_traces(limit: int = Query(20, ge=1, le=50)):
+    """Các request chậm gần nhất (vượt TRACE_SLOW_MS) kèm toàn bộ span."""
+    return [trace_to_dict(root) for root in list(TraceSink().recent_slow)[-limit:][::-1]]
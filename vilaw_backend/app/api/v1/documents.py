@@ -1,20 +1,44 @@
+import asyncio
+import json
+from typing import List
 from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.responses import StreamingResponse
 from app.services.ocr_service import OCRService
 from app.schemas.document_schema import DocumentAnalysisResponse, DocumentMetadataResponse
-from app.db.session import SessionLocal
+from app.db.session import run_db, SessionLocal
 from app.db.models import OCRDocument
+from app.core.exceptions import OCRQueueFull, UploadRejected
+from app.services.ocr_pool import OCRWorkerPool
+from app.services.doc_classifier import DocumentClassifier
+from app.core.config import settings
+from app.services.upload_pipeline import IMAGE_TYPES, receive_upload
 
 router = APIRouter()
 ocr_service = OCRService()
 
 @router.get("/metadata/{metadata_id}", response_model=DocumentMetadataResponse)
 async def get_document_metadata(metadata_id: int):
+    doc = await run_db(_get_ocr_document, metadata_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Metadata not found")
+    ext = doc.filename.rsplit('.', 1)[-1].lower() if doc.filename and "." in doc.filename else None
+    return {
+        "id": doc.id,
+        "external_id": doc.file_hash,
+        "filename": doc.filename,
+        "filetype": ext,
+        "uploader_id": doc.uploader_id,
+        "ocr_text": doc.ocr_text or "",
+        "created_at": doc.created_at.isoformat() if doc.created_at else None,
+        "conversation_id": None,
+        "message_id": None,
+    }
+
+
+def _get_ocr_document(metadata_id: int):
     db = SessionLocal()
     try:
-        doc = db.query(DocumentMetadata).filter(DocumentMetadata.id == metadata_id).first()
-        if not doc:
-            raise HTTPException(status_code=404, detail="Metadata not found")
-        return doc
+        return db.query(OCRDocument).filter(OCRDocument.id == metadata_id).first()
     finally:
         db.close()
 
@@ -27,12 +51,25 @@ async def analyze_document_endpoint(file: UploadFile = File(...)):
     """
     if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
         raise HTTPException(status_code=400, detail="Hiện tại bản Demo chỉ hỗ trợ file ảnh (JPG/PNG).")
-    result = await ocr_service.process_document(file)
+    try:
+        result = await ocr_service.process_document(file)
+    except OCRQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Hệ thống OCR đang quá tải, vui lòng thử lại sau.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return _normalize_result(result, getattr(file, 'filename', ''))
+
+
+def _normalize_result(result, filename: str) -> dict:
     # Ensure response contains required fields matching DocumentAnalysisResponse
     if not isinstance(result, dict):
         result = {}
     # Fill defaults
-    result.setdefault("filename", getattr(file, 'filename', ''))
+    result.setdefault("filename", filename)
     result.setdefault("file_hash", "")
     result.setdefault("blockchain_status", "")
     result.setdefault("document_type", "Không xác định")
@@ -46,3 +83,66 @@ async def analyze_document_endpoint(file: UploadFile = File(...)):
             del result[k]
 
     return result
+
+
+@router.post("/analyze/batch")
+async def analyze_documents_batch(files: List[UploadFile] = File(...)):
+    """
+    Phân tích nhiều ảnh trong một request (VD: cả bộ hồ sơ CCCD, hộ khẩu, chứng chỉ...).
+    Các file được OCR song song (giới hạn OCR_BATCH_CONCURRENCY), dùng chung cache/dedup theo sha256.
+    Kết quả trả về dạng NDJSON, mỗi file một dòng ngay khi xử lý xong (không theo thứ tự upload):
+    {"index": 0, "filename": "...", "status": "ok" | "error", "result": {...} | "detail": "..."}
+    """
+    if len(files) > settings.OCR_BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Tối đa {settings.OCR_BATCH_MAX_FILES} file mỗi lần.")
+
+    # Ghi tất cả file ra đĩa trước khi trả response (UploadFile bị đóng sau khi handler return)
+    stored, rejected = {}, {}
+    for index, file in enumerate(files):
+        try:
+            stored[index] = await receive_upload(file, extensions=IMAGE_TYPES)
+        except UploadRejected as e:
+            rejected[index] = e.detail
+
+    semaphore = asyncio.Semaphore(settings.OCR_BATCH_CONCURRENCY)
+
+    async def analyze(index: int) -> dict:
+        upload = stored[index]
+        line = {"index": index, "filename": upload.filename}
+        async with semaphore:
+            try:
+                result = await ocr_service.process_stored(upload)
+            except OCRQueueFull as e:
+                return dict(line, status="error", detail="Hệ thống OCR đang quá tải", retry_after=e.retry_after)
+            finally:
+                await asyncio.to_thread(upload.remove)
+        if "error" in result:
+            return dict(line, status="error", detail=result["error"])
+        return dict(line, status="ok", result=_normalize_result(result, upload.filename))
+
+    async def stream():
+        tasks = [asyncio.create_task(analyze(index)) for index in stored]
+        try:
+            for index, detail in rejected.items():
+                line = {"index": index, "filename": files[index].filename, "status": "error", "detail": detail}
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished, ensure_ascii=False, default=str) + "\n"
+        finally:
+            # Client ngắt kết nối giữa chừng: huỷ các file chưa xử lý và dọn file tạm
+            for task in tasks:
+                task.cancel()
+            for upload in stored.values():
+                await asyncio.to_thread(upload.remove)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@router.get("/ocr/stats")
+async def ocr_pool_stats():
+    """Trạng thái OCR worker pool: độ sâu hàng đợi, số job đang chạy, thời gian chờ/xử lý."""
+    stats = OCRWorkerPool().stats()
+    stats["preprocess"] = dict(OCRService.preprocess_stats)
+    if settings.DOC_CLASSIFIER_ENABLED:
+        stats["classifier"] = dict(DocumentClassifier().stats)
+    return stats
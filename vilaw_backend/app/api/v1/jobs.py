@@ -0,0 +1,33 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from app.services.job_queue import JobQueue, job_to_dict
+
+router = APIRouter()
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    """Trạng thái, tiến độ (0..1), số lần thử và kết quả của một job nền."""
+    job = JobQueue().get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job")
+    return job_to_dict(job)
+
+
+@router.get("")
+def list_jobs(
+    status: Optional[str] = Query(None, description="queued | running | succeeded | failed | cancelled"),
+    type: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+):
+    return [job_to_dict(job) for job in JobQueue().list(status, type, limit)]
+
+
+@router.post("/{job_id}/cancel")
+def cancel_job(job_id: str):
+    if not JobQueue().cancel(job_id):
+        job = JobQueue().get(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Không tìm thấy job")
+        raise HTTPException(status_code=409, detail=f"Job đang ở trạng thái '{job.status}', không huỷ được")
+    return job_to_dict(JobQueue().get(job_id))
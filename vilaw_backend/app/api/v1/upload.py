@@ -1,21 +1,18 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
 import os
-from app.db.session import SessionLocal
+from app.db.session import AsyncDB, get_async_db
 from app.db.models import UserProcedure
 from app.services.ocr_service import ocr_image
+from app.services.upload_pipeline import IMAGE_TYPES, receive_upload
+from app.core.exceptions import OCRQueueFull, UploadRejected
 
 router = APIRouter()
 UPLOAD_DIR = "uploaded_docs"
+ALLOWED_EXTENSIONS = set(IMAGE_TYPES) | {".pdf"}
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 
 @router.post("/dashboard/upload_doc")
 async def upload_document(
@@ -23,39 +20,53 @@ async def upload_document(
     procedure_id: int = Form(...),
     document_name: str = Form(...),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncDB = Depends(get_async_db)
 ):
-    # Ensure upload dir exists
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    # Save file
-    file_ext = os.path.splitext(file.filename)[-1]
+    # Save file (ghi theo chunk ngoài event loop, kiểm tra dung lượng/định dạng)
+    file_ext = os.path.splitext(file.filename)[-1].lower()
     # Loại bỏ ký tự không hợp lệ khỏi document_name để tránh lỗi đường dẫn
     safe_doc_name = document_name.replace('/', '_').replace('\\', '_')
     save_path = os.path.join(UPLOAD_DIR, f"user{user_id}_proc{procedure_id}_{safe_doc_name}{file_ext}")
-    with open(save_path, "wb") as f:
-        f.write(await file.read())
+    try:
+        stored = await receive_upload(file, dest_path=save_path, extensions=ALLOWED_EXTENSIONS)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     file_url = f"/{UPLOAD_DIR}/{os.path.basename(save_path)}"
 
     # OCR recognition
-    ocr_result = await ocr_image(save_path)
+    try:
+        ocr_result = await ocr_image(save_path, stored.sha256)
+    except OCRQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Hệ thống OCR đang quá tải, vui lòng thử lại sau.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     detected_type = ocr_result.get("type", "Unknown")
 
     # Find procedure in DB
-    up = db.query(UserProcedure).filter(UserProcedure.id == procedure_id, UserProcedure.user_id == user_id).first()
-    if not up:
+    def update_documents(session: Session):
+        up = session.query(UserProcedure).filter(UserProcedure.id == procedure_id, UserProcedure.user_id == user_id).first()
+        if not up:
+            return None
+        doc_list = up.data.get("required_documents", [])
+        matched = False
+        for doc in doc_list:
+            if doc["name"] == document_name:
+                doc["file_url"] = file_url
+                if detected_type.lower() in document_name.lower():
+                    doc["status"] = "Đã có"
+                    matched = True
+                else:
+                    doc["status"] = "Sai loại giấy tờ"
+        up.data["required_documents"] = doc_list
+        flag_modified(up, "data")  # Cột JSON sửa tại chỗ, SQLAlchemy không tự phát hiện
+        session.commit()
+        return matched
+
+    matched = await db.run(update_documents)
+    if matched is None:
         raise HTTPException(status_code=404, detail="Procedure not found")
-    doc_list = up.data.get("required_documents", [])
-    matched = False
-    for doc in doc_list:
-        if doc["name"] == document_name:
-            doc["file_url"] = file_url
-            if detected_type.lower() in document_name.lower():
-                doc["status"] = "Đã có"
-                matched = True
-            else:
-                doc["status"] = "Sai loại giấy tờ"
-    up.data["required_documents"] = doc_list
-    db.commit()
     if matched:
         return {"status": "success", "message": "Đã nhận diện đúng loại giấy tờ", "file_url": file_url}
     else:
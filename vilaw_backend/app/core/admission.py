@@ -0,0 +1,103 @@
+import ipaddress
+from functools import lru_cache
+from fastapi.responses import JSONResponse
+from app.core.config import settings
+from app.core.exceptions import AdmissionRejected
+from app.services.scheduler import RequestScheduler
+
+# (method, path) -> tên pool trong RequestScheduler
+ADMISSION_ROUTES = {
+    ("POST", "/api/v1/chat/stream"): "chat",
+    ("POST", "/api/v1/contracts/draft"): "draft",
+    ("POST", "/api/v1/contracts/draft/stream"): "draft",
+    ("POST", "/api/v1/contracts/check-risk"): "risk",
+    ("POST", "/api/v1/contracts/check-risk/batch"): "batch",
+    ("POST", "/api/v1/contracts/check-risk/batch/upload"): "batch",
+    ("POST", "/api/v1/documents/analyze"): "ocr",
+    ("POST", "/api/v1/documents/analyze/batch"): "ocr",
+    ("POST", "/api/v1/dashboard/upload_doc"): "ocr",
+    ("GET", "/api/v1/procedures/guide"): "procedure",
+}
+
+
+@lru_cache(maxsize=4)
+def _parse_networks(raw: str) -> tuple:
+    networks = []
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            print(f"WARNING: TRUSTED_PROXIES có giá trị không hợp lệ, bỏ qua: {item}")
+    return tuple(networks)
+
+
+def _is_trusted(ip: str) -> bool:
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in _parse_networks(settings.TRUSTED_PROXIES))
+
+
+def _user_key(scope) -> str:
+    """
+    Khoá token bucket của người gửi. Header do client tự đặt không được tin: X-Forwarded-For và header
+    định danh (ADMISSION_USER_HEADER, do reverse proxy đặt sau khi xác thực) chỉ được đọc khi kết nối đến
+    từ proxy nằm trong TRUSTED_PROXIES.
+    """
+    client = scope.get("client")
+    peer = client[0] if client else None
+    if peer is None or not _is_trusted(peer):
+        return "ip:" + peer if peer else "anonymous"
+
+    user_header = settings.ADMISSION_USER_HEADER.lower().encode("latin-1")
+    forwarded = []
+    for name, value in scope.get("headers", []):
+        if user_header and name == user_header and value:
+            return "user:" + value.decode("latin-1")
+        if name == b"x-forwarded-for":
+            forwarded.extend(part.strip() for part in value.decode("latin-1").split(","))
+    # Đi từ phải sang trái (phần do proxy của mình thêm vào), IP đầu tiên không phải proxy là client
+    for ip in reversed(forwarded):
+        if ip and not _is_trusted(ip):
+            return "ip:" + ip
+    return "ip:" + peer
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware: giữ slot của scheduler trong suốt vòng đời request
+    (kể cả khi StreamingResponse còn đang stream).
+    """
+
+    def __init__(self, app, routes: dict = None):
+        self.app = app
+        self.routes = routes or ADMISSION_ROUTES
+
+    async def __call__(self, scope, receive, send):
+        pool = None
+        if scope["type"] == "http" and settings.SCHEDULER_ENABLED:
+            pool = self.routes.get((scope["method"], scope["path"].rstrip("/")))
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+
+        admission = RequestScheduler().admit(pool, _user_key(scope))
+        try:
+            await admission.__aenter__()
+        except AdmissionRejected as e:
+            response = JSONResponse(
+                {"detail": e.detail},
+                status_code=e.status_code,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await admission.__aexit__(None, None, None)
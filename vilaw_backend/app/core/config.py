@@ -4,6 +4,8 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 class Settings(BaseSettings):
     PROJECT_NAME: str = os.getenv("PROJECT_NAME", "ViLaw")
     
@@ -20,4 +22,135 @@ class Settings(BaseSettings):
     PINECONE_INDEX_NAME: str = os.getenv("PINECONE_INDEX_NAME")
     PINECONE_HOST: str = os.getenv("PINECONE_HOST")
 
+    # Database: URL (mặc định file SQLite cạnh chỗ chạy server) và profile PRAGMA áp cho mỗi connection SQLite
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///vilaw_db.sqlite3")
+    SQLITE_TUNED: bool = os.getenv("SQLITE_TUNED", "true").lower() == "true"
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE_KB: int = int(os.getenv("SQLITE_CACHE_SIZE_KB", 64 * 1024))
+    # Database: pool connection, executor DB cho code async (mặc định = pool_size), ngưỡng log query chậm
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 8))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 8))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_EXECUTOR_WORKERS: int = int(os.getenv("DB_EXECUTOR_WORKERS", os.getenv("DB_POOL_SIZE", 8)))
+    DB_SLOW_QUERY_MS: float = float(os.getenv("DB_SLOW_QUERY_MS", 200))
+
+    # Warm-up lúc khởi động (index RAG, LLM client, template DOCX): background | blocking | off
+    STARTUP_WARMUP: str = os.getenv("STARTUP_WARMUP", "background")
+    # Ngân sách thời gian `import main` (ms) cho tools/check_startup_budget.py
+    STARTUP_IMPORT_BUDGET_MS: int = int(os.getenv("STARTUP_IMPORT_BUDGET_MS", 2500))
+
+    # Admission control / Scheduler cho các endpoint tốn tài nguyên
+    SCHEDULER_ENABLED: bool = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+    SCHEDULER_GLOBAL_CONCURRENCY: int = int(os.getenv("SCHEDULER_GLOBAL_CONCURRENCY", 24))
+    SCHEDULER_MAX_WAIT: float = float(os.getenv("SCHEDULER_MAX_WAIT", 10))
+    # JSON ghi đè cấu hình từng pool, VD: {"draft": {"concurrency": 2, "max_queue": 10}}
+    SCHEDULER_POOLS: str = os.getenv("SCHEDULER_POOLS", "")
+    # Rate limit theo IP client; sau reverse proxy: liệt kê IP/CIDR của proxy (VD: "127.0.0.1,10.0.0.0/8")
+    # để lấy IP thật từ X-Forwarded-For. ADMISSION_USER_HEADER (VD: X-User-Id) chỉ được tin khi do
+    # proxy tin cậy gửi tới (proxy phải ghi đè header này bằng danh tính đã xác thực)
+    TRUSTED_PROXIES: str = os.getenv("TRUSTED_PROXIES", "")
+    ADMISSION_USER_HEADER: str = os.getenv("ADMISSION_USER_HEADER", "")
+
+    # Risk Checker: phân tích theo từng điều khoản
+    RISK_MAX_PARALLEL: int = int(os.getenv("RISK_MAX_PARALLEL", 4))
+    RISK_BATCH_CHARS: int = int(os.getenv("RISK_BATCH_CHARS", 3000))
+    RISK_BATCH_CLAUSES: int = int(os.getenv("RISK_BATCH_CLAUSES", 6))
+    # Giới hạn output của LLM risk và ước lượng token output cho mỗi điều khoản (+ 1 token / 8 ký tự
+    # điều khoản cho phần trích dẫn): batch được chia sao cho tổng ước lượng không vượt ~80% giới hạn
+    RISK_MAX_OUTPUT_TOKENS: int = int(os.getenv("RISK_MAX_OUTPUT_TOKENS", 2048))
+    RISK_OUTPUT_TOKENS_PER_CLAUSE: int = int(os.getenv("RISK_OUTPUT_TOKENS_PER_CLAUSE", 300))
+    RISK_CLAUSE_CACHE_SIZE: int = int(os.getenv("RISK_CLAUSE_CACHE_SIZE", 2000))
+    RISK_RULES_PATH: str = os.getenv("RISK_RULES_PATH", os.path.join(APP_DIR, "data", "risk_rules.json"))
+
+    # Batch check-risk (chạy như job "batch_risk" của hàng đợi job nền)
+    BATCH_RISK_CONCURRENCY: int = int(os.getenv("BATCH_RISK_CONCURRENCY", 4))
+    BATCH_RISK_MAX_DOCUMENTS: int = int(os.getenv("BATCH_RISK_MAX_DOCUMENTS", 10000))
+    BATCH_JOBS_DIR: str = os.getenv("BATCH_JOBS_DIR", "jobs/batch_risk")
+
+    # Upload: ghi file theo từng chunk ra đĩa (ngoài event loop), giới hạn dung lượng
+    UPLOAD_MAX_BYTES: int = int(os.getenv("UPLOAD_MAX_BYTES", 20 * 1024 * 1024))
+    UPLOAD_CHUNK_SIZE: int = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+    UPLOAD_TMP_DIR: str = os.getenv("UPLOAD_TMP_DIR", "uploaded_docs/tmp")
+    BATCH_UPLOAD_MAX_BYTES: int = int(os.getenv("BATCH_UPLOAD_MAX_BYTES", 200 * 1024 * 1024))
+    # Tổng dung lượng sau giải nén của các file trong zip batch (chống zip bomb)
+    BATCH_UPLOAD_MAX_UNCOMPRESSED: int = int(os.getenv("BATCH_UPLOAD_MAX_UNCOMPRESSED", 500 * 1024 * 1024))
+
+    # OCR worker pool (Gemini + decode ảnh + ghi DB chạy ngoài event loop)
+    OCR_WORKERS: int = int(os.getenv("OCR_WORKERS", 4))
+    OCR_MAX_QUEUE: int = int(os.getenv("OCR_MAX_QUEUE", 32))
+    OCR_JOB_TIMEOUT: float = float(os.getenv("OCR_JOB_TIMEOUT", 60))
+    OCR_CACHE_SIZE: int = int(os.getenv("OCR_CACHE_SIZE", 512))
+    OCR_BATCH_MAX_FILES: int = int(os.getenv("OCR_BATCH_MAX_FILES", 20))
+    OCR_BATCH_CONCURRENCY: int = int(os.getenv("OCR_BATCH_CONCURRENCY", 4))
+    # Tiền xử lý ảnh trước khi gửi Gemini (giảm kích thước payload)
+    OCR_PREPROCESS: bool = os.getenv("OCR_PREPROCESS", "true").lower() == "true"
+    OCR_MAX_SIDE: int = int(os.getenv("OCR_MAX_SIDE", 2048))
+    OCR_GRAYSCALE: bool = os.getenv("OCR_GRAYSCALE", "true").lower() == "true"
+    OCR_IMAGE_FORMAT: str = os.getenv("OCR_IMAGE_FORMAT", "JPEG")
+    OCR_IMAGE_QUALITY: int = int(os.getenv("OCR_IMAGE_QUALITY", 85))
+    # Hàng đợi job nền (bảng jobs trong SQLite) và worker
+    JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", 60))
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", 1.0))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+    JOB_RETRY_BACKOFF: float = float(os.getenv("JOB_RETRY_BACKOFF", 5))
+    JOB_WORKER_CONCURRENCY: int = int(os.getenv("JOB_WORKER_CONCURRENCY", 2))
+    # true: process API tự chạy worker (1 process); false: chạy riêng `python worker.py`
+    JOB_INPROCESS_WORKER: bool = os.getenv("JOB_INPROCESS_WORKER", "true").lower() == "true"
+    RAG_SNAPSHOT_PATH: str = os.getenv("RAG_SNAPSHOT_PATH", "data/rag_snapshot.pkl")
+    # serve_prefork.py: số worker, heartbeat từ event loop của worker, timeout treo / tắt êm
+    PREFORK_WORKERS: int = int(os.getenv("PREFORK_WORKERS", os.cpu_count() or 1))
+    PREFORK_HEARTBEAT_INTERVAL: int = int(os.getenv("PREFORK_HEARTBEAT_INTERVAL", 2))
+    PREFORK_WORKER_TIMEOUT: float = float(os.getenv("PREFORK_WORKER_TIMEOUT", 30))
+    PREFORK_GRACEFUL_TIMEOUT: float = float(os.getenv("PREFORK_GRACEFUL_TIMEOUT", 30))
+    # Master tự nạp lại index (và thay worker lần lượt) khi job rag_refresh ghi snapshot mới
+    PREFORK_WATCH_SNAPSHOT: bool = os.getenv("PREFORK_WATCH_SNAPSHOT", "true").lower() == "true"
+    # Bộ nhớ hội thoại chat: cửa sổ lịch sử trong prompt (token ước lượng), cache và ghi sau theo lô
+    CONVERSATION_HISTORY_TOKENS: int = int(os.getenv("CONVERSATION_HISTORY_TOKENS", 1500))
+    CONVERSATION_SUMMARY_WORDS: int = int(os.getenv("CONVERSATION_SUMMARY_WORDS", 250))
+    CONVERSATION_CACHE_SIZE: int = int(os.getenv("CONVERSATION_CACHE_SIZE", 1024))
+    CONVERSATION_FLUSH_INTERVAL: float = float(os.getenv("CONVERSATION_FLUSH_INTERVAL", 0.5))
+    CONVERSATION_FLUSH_BATCH: int = int(os.getenv("CONVERSATION_FLUSH_BATCH", 64))
+    # Kho file sinh ra (DOCX): lưu theo sha256, dọn theo TTL (tính từ lần truy cập cuối) và tổng dung lượng
+    ARTIFACT_DIR: str = os.getenv("ARTIFACT_DIR", "data/artifacts")
+    ARTIFACT_TTL_DAYS: float = float(os.getenv("ARTIFACT_TTL_DAYS", 30))
+    ARTIFACT_MAX_BYTES: int = int(os.getenv("ARTIFACT_MAX_BYTES", 1024 * 1024 * 1024))
+    ARTIFACT_SWEEP_INTERVAL: int = int(os.getenv("ARTIFACT_SWEEP_INTERVAL", 3600))
+    ARTIFACT_TOUCH_INTERVAL: int = int(os.getenv("ARTIFACT_TOUCH_INTERVAL", 300))
+
+    # Ingest PDF: trích xuất text song song theo trang trong process pool
+    PDF_INGEST_WORKERS: int = int(os.getenv("PDF_INGEST_WORKERS", min(4, os.cpu_count() or 1)))
+    PDF_PAGES_PER_TASK: int = int(os.getenv("PDF_PAGES_PER_TASK", 4))
+    PDF_OCR_FALLBACK: bool = os.getenv("PDF_OCR_FALLBACK", "true").lower() == "true"
+    PDF_OCR_MIN_CHARS: int = int(os.getenv("PDF_OCR_MIN_CHARS", 20))
+    PDF_OCR_RESOLUTION: int = int(os.getenv("PDF_OCR_RESOLUTION", 200))
+    # Phân loại giấy tờ cục bộ (perceptual hash + màu + tỉ lệ) trước khi gọi Gemini
+    DOC_CLASSIFIER_ENABLED: bool = os.getenv("DOC_CLASSIFIER_ENABLED", "true").lower() == "true"
+    DOC_CLASSIFIER_TEMPLATES_PATH: str = os.getenv("DOC_CLASSIFIER_TEMPLATES_PATH", os.path.join(APP_DIR, "data", "doc_templates.json"))
+    DOC_CLASSIFIER_THRESHOLD: float = float(os.getenv("DOC_CLASSIFIER_THRESHOLD", 0.85))
+    DOC_CLASSIFIER_MARGIN: float = float(os.getenv("DOC_CLASSIFIER_MARGIN", 0.08))
+    DOC_CLASSIFIER_CACHE_SIZE: int = int(os.getenv("DOC_CLASSIFIER_CACHE_SIZE", 1024))
+    DOC_CLASSIFIER_HASH_DISTANCE: int = int(os.getenv("DOC_CLASSIFIER_HASH_DISTANCE", 4))
+    DOC_CLASSIFIER_CACHE_HIST_MATCH: float = float(os.getenv("DOC_CLASSIFIER_CACHE_HIST_MATCH", 0.9))
+    # Ảnh có texture thấp hơn (trang chữ trắng, ảnh trống đồng màu) không phân loại cục bộ, không cache
+    DOC_CLASSIFIER_MIN_TEXTURE: float = float(os.getenv("DOC_CLASSIFIER_MIN_TEXTURE", 0.015))
+
+    # Metrics dạng Prometheus tại GET /metrics (mỗi process/worker prefork có bộ đếm riêng)
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    # Tracing theo request: span ghi ra JSONL khi request chậm (luôn ghi + log cây span) hoặc được lấy mẫu
+    TRACE_ENABLED: bool = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+    TRACE_SINK_PATH: str = os.getenv("TRACE_SINK_PATH", "logs/traces.jsonl")
+    TRACE_SINK_MAX_BYTES: int = int(os.getenv("TRACE_SINK_MAX_BYTES", 100 * 1024 * 1024))
+    TRACE_SAMPLE_RATE: float = float(os.getenv("TRACE_SAMPLE_RATE", 0.05))
+    TRACE_SLOW_MS: float = float(os.getenv("TRACE_SLOW_MS", 5000))
+    TRACE_MAX_SPANS: int = int(os.getenv("TRACE_MAX_SPANS", 500))
+    # Endpoint /api/v1/diagnostics (profile theo yêu cầu, trace chậm) cần header X-Admin-Token; rỗng = tắt
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", "logs/profiles")
+    PROFILE_MAX_REQUESTS: int = int(os.getenv("PROFILE_MAX_REQUESTS", 20))
+    PROFILE_SAMPLE_INTERVAL_MS: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", 5))
+    PROFILE_KEEP: int = int(os.getenv("PROFILE_KEEP", 50))
+
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,29 @@
+class AdmissionRejected(Exception):
+    """Request bị từ chối bởi scheduler (quá tải hoặc vượt rate limit)."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int = 1):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class OCRQueueFull(Exception):
+    """Hàng đợi OCR đã đầy, client nên thử lại sau `retry_after` giây."""
+
+    def __init__(self, retry_after: int = 5):
+        super().__init__("Hàng đợi OCR đang đầy")
+        self.retry_after = retry_after
+
+
+class OCRTimeout(Exception):
+    """Job OCR vượt quá deadline (đã bị huỷ)."""
+
+
+class UploadRejected(Exception):
+    """File upload bị từ chối: quá dung lượng (413) hoặc sai định dạng (415)."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
@@ -0,0 +1,318 @@
+import bisect
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from app.core.config import settings
+
+# Bucket (giây) cho độ trễ: từ vài ms (tách từ, BM25, query SQLite) tới hàng chục giây (LLM, OCR)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Metric có nhãn: mỗi bộ giá trị nhãn là một series riêng (tạo ở lần dùng đầu tiên)."""
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: cần nhãn {self.labelnames}, nhận {values}")
+        key = tuple(str(v) for v in values)
+        child = self._series.get(key)
+        if child is None:
+            with self._lock:
+                child = self._series.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _ValueMetric(_Metric):
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for key, child in list(self._series.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"
+
+
+class Counter(_ValueMetric):
+    type_name = "counter"
+
+
+class Gauge(_ValueMetric):
+    type_name = "gauge"
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _samples(self):
+        for key, child in list(self._series.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+# Collector: hàm gọi lúc scrape, trả về [(name, type, help, [(labels dict, value)])]
+# cho các giá trị đã có sẵn ở chỗ khác (độ sâu hàng đợi, pool DB, kích thước index...).
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[dict, float]]]]]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} đã được đăng ký với kiểu {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collector: Collector):
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Định dạng text của Prometheus (exposition format 0.0.4)."""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        for collector in list(self._collectors):
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"Metrics: collector {getattr(collector, '__name__', collector)} lỗi: {e}")
+                continue
+            for name, type_name, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {type_name}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# --- Metric dùng chung giữa các service ---
+
+HTTP_REQUESTS = REGISTRY.counter("vilaw_http_requests_total", "Số request HTTP theo route và mã trạng thái", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram("vilaw_http_request_duration_seconds", "Thời gian xử lý request (tới byte cuối của response, kể cả stream)", ("method", "route"))
+HTTP_IN_PROGRESS = REGISTRY.gauge("vilaw_http_requests_in_progress", "Số request đang xử lý", ("method",))
+OPERATION_LATENCY = REGISTRY.histogram("vilaw_operation_duration_seconds", "Thời gian các thao tác chính của service", ("operation", "outcome"))
+CHAT_STAGE_LATENCY = REGISTRY.histogram("vilaw_chat_stage_seconds", "Thời gian từng giai đoạn của chat_stream", ("stage",))
+CACHE_REQUESTS = REGISTRY.counter("vilaw_cache_requests_total", "Số lần tra cache theo kết quả hit/miss", ("cache", "result"))
+
+
+def cache_hit(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def timed(operation: str):
+    """Decorator cho hàm async: ghi thời gian vào vilaw_operation_duration_seconds (outcome=ok|error)."""
+    def decorator(fn):
+        ok = OPERATION_LATENCY.labels(operation, "ok")
+        error = OPERATION_LATENCY.labels(operation, "error")
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = await fn(*args, **kwargs)
+            except BaseException:
+                error.observe(time.perf_counter() - started)
+                raise
+            ok.observe(time.perf_counter() - started)
+            return result
+        return wrapper
+    return decorator
+
+
+# --- HTTP ---
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: đếm request và đo thời gian theo route template (VD: /api/v1/jobs/{job_id}, không theo
+    path thật để số series không tăng theo ID). Thời gian tính tới khi gửi xong phần body cuối,
+    nên StreamingResponse (chat, NDJSON) được đo cả lúc stream.
+    `known_paths`: các (method, path) cố định dùng làm nhãn khi request bị middleware bên trong trả lời
+    trước khi tới router (VD: 429/503 của AdmissionMiddleware).
+    """
+
+    def __init__(self, app, known_paths: Iterable[Tuple[str, str]] = ()):
+        self.app = app
+        self.known_paths = set(known_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        started = time.perf_counter()
+        status = 500
+        finished = False
+        # Route chưa biết trước khi router match => in-progress chỉ chia theo method
+        in_progress = HTTP_IN_PROGRESS.labels(method)
+        in_progress.inc()
+
+        def record():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            in_progress.dec()
+            route = route_template(scope, self.known_paths)
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, status).inc()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
+
+
+def route_template(scope, known_paths: Iterable[Tuple[str, str]] = ()) -> str:
+    # FastAPI mới giữ route gốc của router con (path chưa có prefix) trong scope["route"];
+    # path đầy đủ nằm ở effective_route_context
+    context = (scope.get("fastapi") or {}).get("effective_route_context")
+    path = getattr(context, "path_format", None) or getattr(scope.get("route"), "path", None)
+    if path is not None:
+        return path
+    path = scope["path"].rstrip("/")
+    # Không match route nào (404, path tuỳ ý): gộp chung một nhãn
+    return path if (scope["method"], path) in known_paths else "unmatched"
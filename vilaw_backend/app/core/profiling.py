@@ -0,0 +1,218 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Optional
+
+from app.core.config import settings
+
+PROFILE_MODES = ("cprofile", "sampling")
+_SAMPLE_MAX_DEPTH = 64
+
+
+def _route_pattern(route: str) -> "re.Pattern":
+    """/api/v1/jobs/{job_id} -> khớp mọi path cùng dạng."""
+    parts = ["[^/]+" if p.startswith("{") and p.endswith("}") else re.escape(p) for p in route.rstrip("/").split("/")]
+    return re.compile("/".join(parts) + "/?")
+
+
+class _StackSampler:
+    """
+    Lấy mẫu stack mọi thread mỗi PROFILE_SAMPLE_INTERVAL_MS bằng sys._current_frames(): thấy cả
+    phần chạy trong executor DB, pool OCR, asyncio.to_thread mà cProfile (chỉ thread event loop) bỏ sót.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None and len(frames) < _SAMPLE_MAX_DEPTH:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(frames))] += 1
+            self.samples += 1
+
+
+@dataclass
+class ProfileTarget:
+    route: str
+    method: Optional[str]
+    mode: str
+    remaining: int
+    armed_at: float
+
+
+class ProfileCapture:
+    def __init__(self, profiler: "RequestProfiler", target: ProfileTarget, capture_id: str, method: str, path: str, trace_id: str):
+        self.profiler = profiler
+        self.target = target
+        self.capture_id = capture_id
+        self.method = method
+        self.path = path
+        self.trace_id = trace_id
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[_StackSampler] = None
+
+    def start(self):
+        if self.target.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = _StackSampler(settings.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+            self._sampler.start()
+
+    async def finish(self, status: int, duration: float):
+        # cProfile phải tắt trên đúng thread đã bật (event loop); ghi file/tổng hợp thì làm trong thread
+        if self._profile is not None:
+            self._profile.disable()
+        try:
+            if self._sampler is not None:
+                await asyncio.to_thread(self._sampler.stop)
+            record = await asyncio.to_thread(self._save, status, duration)
+        finally:
+            self.profiler._release(self)
+        self.profiler._store(record)
+
+    def _save(self, status: int, duration: float) -> dict:
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        out = io.StringIO()
+        if self._profile is not None:
+            path = os.path.join(settings.PROFILE_DIR, f"{self.capture_id}.prof")
+            self._profile.dump_stats(path)
+            pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(40)
+        else:
+            # Định dạng folded stack (flamegraph.pl / speedscope đọc trực tiếp)
+            path = os.path.join(settings.PROFILE_DIR, f"{self.capture_id}.folded")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in self._sampler.stacks.items():
+                    f.write(f"{stack} {count}\n")
+            self_samples = Counter()
+            for stack, count in self._sampler.stacks.items():
+                self_samples[stack.rsplit(";", 1)[-1]] += count
+            out.write(f"{self._sampler.samples} lần lấy mẫu, mỗi {settings.PROFILE_SAMPLE_INTERVAL_MS} ms\n")
+            for frame, count in self_samples.most_common(40):
+                out.write(f"{count:8d}  {frame}\n")
+        return {
+            "id": self.capture_id,
+            "mode": self.target.mode,
+            "route": self.target.route,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "duration_ms": round(duration * 1000, 1),
+            "trace_id": self.trace_id,
+            "file": path,
+            "created_at": time.time(),
+            "summary": out.getvalue(),
+        }
+
+
+class RequestProfiler:
+    """
+    Profile N request tiếp theo của một route theo lệnh của admin (/api/v1/diagnostics/profile).
+    - cprofile: cProfile trên thread event loop trong lúc request chạy (gồm cả request khác chạy xen kẽ).
+    - sampling: lấy mẫu stack mọi thread, file .folded để vẽ flamegraph.
+    Mỗi lúc chỉ profile một request; request khớp route trong lúc đó chạy bình thường, không bị trừ lượt.
+    Kết quả lưu ở PROFILE_DIR, giữ PROFILE_KEEP bản gần nhất trong RAM.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(RequestProfiler, cls).__new__(cls)
+            cls._instance._lock = threading.Lock()
+            cls._instance.target: Optional[ProfileTarget] = None
+            cls._instance._pattern = None
+            cls._instance._active: Optional[ProfileCapture] = None
+            cls._instance._seq = 0
+            cls._instance.captures = deque(maxlen=settings.PROFILE_KEEP)
+        return cls._instance
+
+    def arm(self, route: str, count: int, mode: str = "cprofile", method: Optional[str] = None) -> ProfileTarget:
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode phải là một trong {PROFILE_MODES}")
+        if not 1 <= count <= settings.PROFILE_MAX_REQUESTS:
+            raise ValueError(f"count phải từ 1 tới {settings.PROFILE_MAX_REQUESTS}")
+        if not route.startswith("/"):
+            raise ValueError("route phải bắt đầu bằng '/', VD: /api/v1/chat/stream")
+        with self._lock:
+            self.target = ProfileTarget(route, method.upper() if method else None, mode, count, time.time())
+            self._pattern = _route_pattern(route)
+            return self.target
+
+    def disarm(self):
+        with self._lock:
+            self.target = None
+            self._pattern = None
+
+    def claim(self, method: str, path: str, trace_id: str) -> Optional[ProfileCapture]:
+        """Gọi ở đầu mỗi request: trả về capture nếu request này cần profile (trừ một lượt)."""
+        target = self.target
+        if target is None:
+            return None
+        with self._lock:
+            target = self.target
+            if target is None or self._active is not None:
+                return None
+            if target.method and target.method != method:
+                return None
+            if not self._pattern.fullmatch(path):
+                return None
+            target.remaining -= 1
+            if target.remaining <= 0:
+                self.target = None
+                self._pattern = None
+            self._seq += 1
+            capture_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._seq}"
+            self._active = ProfileCapture(self, target, capture_id, method, path, trace_id)
+            return self._active
+
+    def _release(self, capture: ProfileCapture):
+        with self._lock:
+            if self._active is capture:
+                self._active = None
+
+    def _store(self, record: dict):
+        self.captures.append(record)
+        print(f"Profile {record['id']} ({record['mode']}) {record['method']} {record['path']}: "
+              f"{record['duration_ms']:.0f} ms -> {record['file']}")
+
+    def get(self, capture_id: str) -> Optional[dict]:
+        return next((c for c in self.captures if c["id"] == capture_id), None)
+
+    def status(self) -> dict:
+        target = self.target
+        return {
+            "target": vars(target).copy() if target else None,
+            "active": self._active.capture_id if self._active else None,
+            "captures": [{k: v for k, v in c.items() if k != "summary"} for c in reversed(self.captures)],
+        }
@@ -0,0 +1,12 @@
+import hmac
+from typing import Optional
+from fastapi import Header, HTTPException
+from app.core.config import settings
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependency cho endpoint quản trị: so header X-Admin-Token với ADMIN_TOKEN (chưa cấu hình => tắt)."""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Endpoint quản trị chưa được bật (thiếu ADMIN_TOKEN)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode("utf-8"), settings.ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Sai hoặc thiếu X-Admin-Token")
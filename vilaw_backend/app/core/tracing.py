@@ -0,0 +1,283 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Optional
+
+from app.core.config import settings
+from app.core.metrics import route_template
+
+# Không trace các path này (scrape metrics, file tĩnh)
+_UNTRACED_PREFIXES = ("/metrics", "/static")
+
+
+class Trace:
+    """Một request: các span chung trace_id; số span giới hạn bởi TRACE_MAX_SPANS (VD: stream NDJSON nhiều lô)."""
+    __slots__ = ("trace_id", "started_at", "span_count", "dropped", "root")
+
+    def __init__(self):
+        self.trace_id = os.urandom(8).hex()
+        self.started_at = time.time()
+        self.span_count = 0
+        self.dropped = 0
+        self.root: Optional["Span"] = None
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "name", "parent", "start", "duration", "attributes", "error", "children")
+
+    def __init__(self, trace: Trace, name: str, parent: Optional["Span"], attributes: dict):
+        trace.span_count += 1
+        self.trace = trace
+        self.span_id = trace.span_count
+        self.name = name
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.children: List["Span"] = []
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error: BaseException = None):
+        if error is not None and self.error is None:
+            self.error = repr(error)[:300]
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.start
+
+
+# Span hiện tại của request; được copy sang task con, run_db, asyncio.to_thread và job OCR
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("vilaw_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def start_span(name: str, **attributes) -> Optional[Span]:
+    """
+    Span con của span hiện tại, không đặt làm span hiện tại (dùng trong async generator, nơi
+    contextvar không được set/reset qua các lần yield). Trả về None khi không có trace (job nền, CLI).
+    """
+    parent = _current.get()
+    if parent is None:
+        return None
+    trace = parent.trace
+    if trace.span_count >= settings.TRACE_MAX_SPANS:
+        trace.dropped += 1
+        return None
+    child = Span(trace, name, parent, attributes)
+    parent.children.append(child)
+    return child
+
+
+def record_span(name: str, duration: float, **attributes):
+    """Ghi một span đã kết thúc (kết thúc lúc gọi), VD: query DB đo trong event listener."""
+    child = start_span(name, **attributes)
+    if child is not None:
+        child.duration = duration
+        child.start -= duration
+
+
+@contextmanager
+def span(name: str, **attributes):
+    child = start_span(name, **attributes)
+    if child is None:
+        yield None
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.end(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+
+def traced(name: str):
+    """Decorator: mỗi lần gọi hàm (sync hoặc async) là một span con."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- Xuất trace ---
+
+def trace_to_dict(root: Span) -> dict:
+    trace = root.trace
+    spans = []
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        spans.append({
+            "id": current.span_id,
+            "parent": current.parent.span_id if current.parent else None,
+            "name": current.name,
+            "start_ms": round((current.start - root.start) * 1000, 2),
+            "duration_ms": round(current.duration * 1000, 2) if current.duration is not None else None,
+            "attributes": current.attributes,
+            "error": current.error,
+        })
+        stack.extend(reversed(current.children))
+    return {
+        "trace_id": trace.trace_id,
+        "ts": trace.started_at,
+        "name": root.name,
+        "duration_ms": spans[0]["duration_ms"],
+        "attributes": root.attributes,
+        "dropped_spans": trace.dropped,
+        "spans": spans,
+    }
+
+
+def format_tree(root: Span) -> str:
+    """Cây span dạng text cho log request chậm."""
+    lines = []
+    stack = [(root, 0)]
+    while stack:
+        current, depth = stack.pop()
+        duration = f"{current.duration * 1000:9.1f} ms" if current.duration is not None else "  (chưa xong)"
+        offset = (current.start - root.start) * 1000
+        extra = f" {current.attributes}" if current.attributes and current is not root else ""
+        error = f" ERROR {current.error}" if current.error else ""
+        lines.append(f"  {duration} +{offset:7.1f}  {'  ' * depth}{current.name}{extra}{error}")
+        stack.extend((child, depth + 1) for child in reversed(current.children))
+    if root.trace.dropped:
+        lines.append(f"  ... bỏ {root.trace.dropped} span (vượt TRACE_MAX_SPANS)")
+    return "\n".join(lines)
+
+
+class TraceSink:
+    """
+    Ghi trace ra file JSONL (mỗi dòng một request) bằng thread nền: event loop chỉ đưa trace vào hàng đợi,
+    hàng đợi đầy thì bỏ trace. File vượt TRACE_SINK_MAX_BYTES được đổi tên thành <file>.1.
+    Giữ thêm các trace chậm gần nhất trong RAM cho endpoint diagnostics.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(TraceSink, cls).__new__(cls)
+            cls._instance._queue = queue.Queue(maxsize=1000)
+            cls._instance._thread = None
+            cls._instance._lock = threading.Lock()
+            cls._instance.recent_slow = deque(maxlen=50)
+            cls._instance.written = 0
+            cls._instance.dropped = 0
+        return cls._instance
+
+    def submit(self, root: Span, slow: bool):
+        if slow:
+            self.recent_slow.append(root)
+        try:
+            self._queue.put_nowait(root)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self._ensure_writer()
+
+    def _ensure_writer(self):
+        # Thread được tạo trong process phục vụ request (worker prefork), không phải lúc import
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._write_loop, name="trace-sink", daemon=True)
+                    self._thread.start()
+
+    def _write_loop(self):
+        path = settings.TRACE_SINK_PATH
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        while True:
+            root = self._queue.get()
+            try:
+                line = json.dumps(trace_to_dict(root), ensure_ascii=False, default=str) + "\n"
+                if os.path.exists(path) and os.path.getsize(path) > settings.TRACE_SINK_MAX_BYTES:
+                    os.replace(path, path + ".1")
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(line)
+                self.written += 1
+            except Exception as e:
+                print(f"TraceSink: không ghi được trace: {e}")
+
+
+# --- Middleware ---
+
+class TracingMiddleware:
+    """
+    ASGI middleware: mở span gốc cho mỗi request (trace_id trả về ở header X-Trace-Id) để span của
+    router, service và DB gắn vào. Request vượt TRACE_SLOW_MS được log kèm cây span; trace được ghi
+    ra JSONL khi chậm hoặc được lấy mẫu (TRACE_SAMPLE_RATE). Request khớp lệnh profile của admin
+    (RequestProfiler) được profile trong lúc xử lý.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.TRACE_ENABLED or scope["path"].startswith(_UNTRACED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        from app.core.profiling import RequestProfiler
+
+        method = scope["method"]
+        trace = Trace()
+        root = trace.root = Span(trace, f"{method} {scope['path']}", None, {"path": scope["path"]})
+        token = _current.set(root)
+        trace_header = (b"x-trace-id", trace.trace_id.encode("ascii"))
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [trace_header]
+            await send(message)
+
+        capture = RequestProfiler().claim(method, scope["path"], trace.trace_id)
+        try:
+            if capture is not None:
+                capture.start()
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            root.end(e)
+            raise
+        finally:
+            _current.reset(token)
+            root.end()
+            if capture is not None:
+                await capture.finish(status, root.duration)
+            self._finish(root, method, route_template(scope), status)
+
+    @staticmethod
+    def _finish(root: Span, method: str, route: str, status: int):
+        root.name = f"{method} {route}"
+        root.set(status=status)
+        duration_ms = root.duration * 1000
+        slow = duration_ms >= settings.TRACE_SLOW_MS
+        if slow:
+            print(f"Slow request {duration_ms:.0f} ms: {root.name} -> {status} (trace {root.trace.trace_id})\n{format_tree(root)}")
+        if slow or random.random() < settings.TRACE_SAMPLE_RATE:
+            TraceSink().submit(root, slow)
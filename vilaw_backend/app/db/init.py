@@ -1,5 +1,7 @@
 from app.db.session import engine
 from app.db import models
+from app.db.migrations import run_migrations
 
 def init_db():
-    models.Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    models.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
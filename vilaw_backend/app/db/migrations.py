@@ -0,0 +1,38 @@
+from sqlalchemy import inspect, text
+
+# Các bước migration nhỏ, idempotent, cho DB đã tạo từ phiên bản cũ
+# (create_all không thêm cột/index vào bảng đã tồn tại).
+# ADD_COLUMNS: (bảng, cột, kiểu cột); CREATE_INDEXES: câu lệnh CREATE INDEX IF NOT EXISTS.
+ADD_COLUMNS = [
+    ("ocr_documents", "file_hash", "VARCHAR(64)"),
+    ("chat_history", "conversation_id", "VARCHAR(64)"),
+]
+
+CREATE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_ocr_documents_file_hash ON ocr_documents (file_hash)",
+    "CREATE INDEX IF NOT EXISTS ix_chat_history_conversation_id ON chat_history (conversation_id)",
+    # /procedures/dashboard lọc theo user_id, /db/ocr-documents sắp xếp theo created_at
+    "CREATE INDEX IF NOT EXISTS ix_user_procedures_user_id ON user_procedures (user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_ocr_documents_created_at ON ocr_documents (created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_chat_history_user_id ON chat_history (user_id)",
+    # /db/laws lọc theo document_id, phân trang theo id
+    "CREATE INDEX IF NOT EXISTS ix_law_chunks_document_id ON law_chunks (document_id)",
+]
+
+
+def run_migrations(engine):
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table, column, ddl in ADD_COLUMNS:
+            if table not in tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            if column not in existing:
+                print(f"Migration: thêm cột {table}.{column}")
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        for statement in CREATE_INDEXES:
+            conn.execute(text(statement))
+        if engine.dialect.name == "sqlite":
+            # Cập nhật thống kê cho query planner (chỉ phân tích bảng cần thiết, nhanh)
+            conn.execute(text("PRAGMA optimize"))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, JSON, Text, DateTime, UniqueConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, JSON, Text, DateTime, Float, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -20,7 +20,7 @@ class LawDocument(Base):
 class LawChunk(Base):
     __tablename__ = "law_chunks"
     id = Column(Integer, primary_key=True)
-    document_id = Column(Integer, ForeignKey("law_documents.id"), nullable=False)
+    document_id = Column(Integer, ForeignKey("law_documents.id"), nullable=False, index=True)
     title = Column(String, nullable=False)
     content = Column(Text, nullable=False)
 
@@ -45,14 +45,33 @@ class OCRDocument(Base):
     filename = Column(String)
     uploader_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     ocr_text = Column(Text)
+    file_hash = Column(String(64), index=True)  # sha256 của file gốc, dùng để dedup OCR
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    pages = relationship("OCRPage", back_populates="document", cascade="all, delete-orphan")
+
+
+class OCRPage(Base):
+    """Text từng trang của file PDF (ghi dần khi các trang được trích xuất xong)."""
+    __tablename__ = "ocr_pages"
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey("ocr_documents.id"), nullable=False, index=True)
+    page_number = Column(Integer, nullable=False)
+    text = Column(Text)
+    source = Column(String(16))  # "text" | "ocr" | "empty" | "error"
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        UniqueConstraint('document_id', 'page_number', name='uq_ocr_page'),
+    )
+
+    document = relationship("OCRDocument", back_populates="pages")
+
 
 
 class UserProcedure(Base):
     __tablename__ = "user_procedures"
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     title = Column(String, nullable=False)
     status = Column(String, default="In Progress")
     data = Column(JSON)
@@ -61,7 +80,55 @@ class UserProcedure(Base):
 class ChatHistory(Base):
     __tablename__ = "chat_history"
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    conversation_id = Column(String(64), index=True)
     question = Column(Text)
     answer = Column(Text)
-    timestamp = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    timestamp = Column(DateTime, default=datetime.utcnow)
+
+
+class Conversation(Base):
+    """Phần lịch sử đã gộp thành summary của một cuộc hội thoại (các lượt nằm trong chat_history)."""
+    __tablename__ = "conversations"
+    id = Column(String(64), primary_key=True)
+    summary = Column(Text, default="")
+    summarized_turns = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Job(Base):
+    """Job nền bền vững (hàng đợi trong SQLite), được worker.py hoặc worker trong process API xử lý."""
+    __tablename__ = "jobs"
+    id = Column(String(32), primary_key=True)
+    type = Column(String(64), nullable=False)
+    status = Column(String(16), nullable=False, default="queued")  # queued | running | succeeded | failed | cancelled
+    priority = Column(Integer, nullable=False, default=100)        # Nhỏ hơn = ưu tiên hơn
+    payload = Column(JSON)
+    result = Column(JSON)
+    error = Column(Text)
+    progress = Column(Float, default=0.0)
+    progress_message = Column(String)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    lease_owner = Column(String(64))
+    lease_expires_at = Column(DateTime)
+    run_after = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_jobs_claim", "status", "priority", "run_after"),
+    )
+
+
+class Artifact(Base):
+    """File sinh ra (DOCX...) trong kho theo nội dung (artifact_store), khoá là sha256."""
+    __tablename__ = "artifacts"
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    content_type = Column(String, nullable=False)
+    filename = Column(String, nullable=False)  # Tên file khi tải về
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_accessed_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -1,13 +1,163 @@
+import asyncio
+import contextvars
+import functools
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+from app.core.config import settings
+from app.core.metrics import REGISTRY
+from app.core.tracing import record_span
 from app.db.models import Base
 
 
-# Luôn dùng SQLite trong quá trình phát triển/test, đảm bảo đường dẫn đúng
-DATABASE_URL = "sqlite:///vilaw_db.sqlite3"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+DATABASE_URL = settings.DATABASE_URL
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+_engine_kwargs = {"pool_pre_ping": True}
+if IS_SQLITE:
+    # timeout của sqlite3 = thời gian chờ khoá ghi trước khi báo "database is locked"
+    _engine_kwargs["connect_args"] = {"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_MS / 1000}
+if ":memory:" not in DATABASE_URL:
+    _engine_kwargs.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+engine = create_engine(DATABASE_URL, **_engine_kwargs)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+if IS_SQLITE and settings.SQLITE_TUNED:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """
+        WAL: người đọc không bị chặn bởi người ghi; synchronous=NORMAL an toàn với WAL và bỏ fsync mỗi commit;
+        mmap/cache lớn giảm đọc đĩa cho các bảng hay truy vấn (law_chunks, ocr_documents).
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+
+
+# --- Thời gian từng query (theo loại câu lệnh) ---
+
+_query_stats = {}
+_stats_lock = threading.Lock()
+DB_QUERY_LATENCY = REGISTRY.histogram("vilaw_db_query_duration_seconds", "Thời gian query theo loại câu lệnh", ("statement",))
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    elapsed_ms = elapsed * 1000
+    kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    DB_QUERY_LATENCY.labels(kind).observe(elapsed)
+    record_span(f"db.{kind}", elapsed, statement=" ".join(statement.split())[:160])
+    with _stats_lock:
+        stats = _query_stats.setdefault(kind, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "slow": 0})
+        stats["count"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        if elapsed_ms >= settings.DB_SLOW_QUERY_MS:
+            stats["slow"] += 1
+    if elapsed_ms >= settings.DB_SLOW_QUERY_MS:
+        print(f"DB slow query ({elapsed_ms:.0f} ms, thread {threading.current_thread().name}): {' '.join(statement.split())[:300]}")
+
+
+def db_stats() -> dict:
+    with _stats_lock:
+        queries = {
+            kind: {**s, "avg_ms": round(s["total_ms"] / s["count"], 3), "total_ms": round(s["total_ms"], 1),
+                   "max_ms": round(s["max_ms"], 1)}
+            for kind, s in _query_stats.items()
+        }
+    return {
+        "pool": engine.pool.status(),
+        "executor_workers": settings.DB_EXECUTOR_WORKERS,
+        "queries": queries,
+    }
+
+
+def _pool_metrics():
+    pool = engine.pool
+    # Pool của SQLite :memory: (StaticPool/SingletonThreadPool) không có các số liệu này
+    if not hasattr(pool, "checkedout"):
+        return []
+    return [
+        ("vilaw_db_pool_size", "gauge", "Số connection cố định của pool", [({}, pool.size())]),
+        ("vilaw_db_pool_checked_out", "gauge", "Số connection đang được dùng", [({}, pool.checkedout())]),
+        ("vilaw_db_pool_overflow", "gauge", "Số connection overflow đang mở", [({}, max(pool.overflow(), 0))]),
+    ]
+
+
+REGISTRY.add_collector(_pool_metrics)
+
+
+# --- Truy cập DB từ code async ---
+
+# Executor riêng cho DB: query SQLite chậm không chiếm thread mặc định (OCR, file IO) và ngược lại;
+# số thread = pool_size nên thread không phải chờ connection.
+_db_executor = ThreadPoolExecutor(max_workers=settings.DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+
+async def run_db(fn, *args, **kwargs):
+    """Chạy hàm đồng bộ có truy cập DB (tự mở SessionLocal) trên executor DB, giữ contextvars của request."""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await loop.run_in_executor(_db_executor, call)
+
+
+class AsyncDB:
+    """
+    Session cho handler `async def`: mọi thao tác ORM chạy trên executor DB qua
+    `await db.run(fn, ...)` với `fn(session, ...)`; session đóng khi request kết thúc.
+    """
+
+    def __init__(self):
+        self.session: Session = None
+
+    async def run(self, fn, *args, **kwargs):
+        def call():
+            if self.session is None:
+                self.session = SessionLocal()
+            return fn(self.session, *args, **kwargs)
+        return await run_db(call)
+
+    async def close(self):
+        if self.session is not None:
+            await run_db(self.session.close)
+            self.session = None
+
+
+def get_db():
+    """Dependency cho handler `def` (FastAPI đã chạy chúng trong threadpool)."""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    """Dependency cho handler `async def`."""
+    db = AsyncDB()
+    try:
+        yield db
+    finally:
+        await db.close()
@@ -3,4 +3,4 @@ from typing import Optional
 
 class ChatRequest(BaseModel):
     message: str
-    conversation_id: Optional[str] = '1'
\ No newline at end of file
+    conversation_id: Optional[str] = None  # Bỏ trống => tạo hội thoại mới (id trả về ở header X-Conversation-Id)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Literal, Optional
 from pydantic import BaseModel, Field
 
 
@@ -16,6 +16,11 @@ class ContractDraftResponse(BaseModel):
     questions: Optional[List[str]] = None
 
 
+class DocxExportRequest(BaseModel):
+    content: str = Field(..., description="Văn bản thuần (VD: content_preview đã chỉnh sửa), mỗi dòng một đoạn")
+    document_type: str = Field("VanBan", description="Dùng để đặt tên file tải về")
+
+
 
 
 
@@ -30,6 +35,10 @@ class RiskPoint(BaseModel):
 class RiskAnalysisRequest(BaseModel):
 	content: str
 	contract_type: str
+	screening: Literal["full", "hybrid", "fast"] = Field(
+		"full",
+		description="'fast': chỉ chạy bộ rule cục bộ; 'hybrid': rule + LLM cho phần văn bản còn lại; 'full': rule + LLM cho toàn văn."
+	)
 
 
 class RiskAnalysisResponse(BaseModel):
@@ -37,3 +46,25 @@ class RiskAnalysisResponse(BaseModel):
 	completeness_status: str
 	missing_fields: List[str]
 	risks: List[RiskPoint]
+
+
+class BatchRiskDocument(BaseModel):
+	id: Optional[str] = Field(None, description="Mã tài liệu do client đặt (mặc định là số thứ tự)")
+	content: str
+	contract_type: Optional[str] = Field(None, description="Ghi đè loại hợp đồng chung của batch")
+
+
+class BatchRiskRequest(BaseModel):
+	contract_type: str = Field(..., description="Loại hợp đồng mặc định cho cả batch")
+	screening: Literal["full", "hybrid", "fast"] = "full"
+	documents: List[BatchRiskDocument]
+
+
+class BatchRiskJobResponse(BaseModel):
+	job_id: str
+	status: str             # "queued", "running", "completed", "failed", "cancelled"
+	total: int
+	completed: int
+	failed: int
+	created_at: str
+	results_url: str
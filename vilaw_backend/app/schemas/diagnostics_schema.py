@@ -0,0 +1,9 @@
+from typing import Literal, Optional
+from pydantic import BaseModel, Field
+
+
+class ProfileRequest(BaseModel):
+    route: str = Field(..., description="Route template hoặc path, VD: /api/v1/chat/stream, /api/v1/jobs/{job_id}")
+    method: Optional[str] = Field(None, description="Chỉ profile method này (bỏ trống = mọi method)")
+    count: int = Field(1, ge=1, description="Số request tiếp theo cần profile")
+    mode: Literal["cprofile", "sampling"] = "cprofile"
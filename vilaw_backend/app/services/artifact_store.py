@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from app.core.config import settings
+from app.db.session import SessionLocal, run_db
+from app.db.models import Artifact
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+# File trên đĩa không có bản ghi (process chết giữa lúc ghi) chỉ bị xoá khi đủ cũ
+_ORPHAN_GRACE_SECONDS = 3600
+
+
+class ArtifactStore:
+    """
+    Kho file sinh ra theo nội dung: <ARTIFACT_DIR>/ab/cd/<sha256>. Cùng nội dung chỉ lưu một lần;
+    metadata (kích thước, ngày tạo, lần truy cập cuối) nằm trong bảng `artifacts`.
+    URL ổn định: /api/v1/artifacts/<sha256>. `sweep()` xoá file quá ARTIFACT_TTL_DAYS không ai tải
+    và file truy cập cũ nhất khi tổng dung lượng vượt ARTIFACT_MAX_BYTES.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ArtifactStore, cls).__new__(cls)
+        return cls._instance
+
+    @staticmethod
+    def path_for(sha256: str) -> str:
+        return os.path.join(settings.ARTIFACT_DIR, sha256[:2], sha256[2:4], sha256)
+
+    @staticmethod
+    def url_for(sha256: str) -> str:
+        return f"/api/v1/artifacts/{sha256}"
+
+    def put(self, data: bytes, content_type: str, filename: str) -> Artifact:
+        """
+        Lưu nội dung (bỏ qua ghi nếu đã có file cùng sha256) và trả về bản ghi metadata.
+        Sau khi ghi/chạm bản ghi thì kiểm tra lại file: sweep() có thể đã xoá file cũ ngay trước đó.
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        self._write_file(sha256, data)
+
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            artifact = db.query(Artifact).filter(Artifact.sha256 == sha256).first()
+            if artifact is None:
+                artifact = Artifact(sha256=sha256, size=len(data), content_type=content_type,
+                                    filename=filename, created_at=now, last_accessed_at=now)
+                db.add(artifact)
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # Request khác vừa lưu cùng nội dung
+                    db.rollback()
+                    artifact = db.query(Artifact).filter(Artifact.sha256 == sha256).first()
+            else:
+                artifact.last_accessed_at = now
+                db.commit()
+            db.refresh(artifact)
+        finally:
+            db.close()
+        # sweep() chỉ xoá file trong cùng transaction xoá bản ghi có last_accessed_at cũ => sau khi bản ghi
+        # đã được chạm/tạo lại, file còn thiếu chỉ có thể do sweep chạy trước đó: ghi lại
+        self._write_file(sha256, data)
+        return artifact
+
+    def _write_file(self, sha256: str, data: bytes):
+        path = self.path_for(sha256)
+        if os.path.exists(path) and os.path.getsize(path) == len(data):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, sha256: str) -> Optional[Artifact]:
+        """Bản ghi của file còn trên đĩa; cập nhật last_accessed_at (tối đa mỗi ARTIFACT_TOUCH_INTERVAL giây)."""
+        if not SHA256_RE.match(sha256):
+            return None
+        db = SessionLocal()
+        try:
+            artifact = db.query(Artifact).filter(Artifact.sha256 == sha256).first()
+            if artifact is None:
+                return None
+            if not os.path.exists(self.path_for(sha256)):
+                db.delete(artifact)
+                db.commit()
+                return None
+            now = datetime.utcnow()
+            if artifact.last_accessed_at is None or now - artifact.last_accessed_at > timedelta(seconds=settings.ARTIFACT_TOUCH_INTERVAL):
+                artifact.last_accessed_at = now
+                db.commit()
+                db.refresh(artifact)
+            return artifact
+        finally:
+            db.close()
+
+    def sweep(self) -> dict:
+        stats = {"expired": 0, "evicted": 0, "orphans": 0, "freed_bytes": 0}
+        cutoff = datetime.utcnow() - timedelta(days=settings.ARTIFACT_TTL_DAYS)
+        db = SessionLocal()
+        try:
+            # Đọc giá trị (không giữ object ORM: commit sau mỗi lần xoá sẽ nạp lại last_accessed_at mới)
+            columns = (Artifact.sha256, Artifact.size, Artifact.last_accessed_at)
+            for row in db.query(*columns).filter(Artifact.last_accessed_at < cutoff).all():
+                freed = self._delete(db, row)
+                if freed is not None:
+                    stats["freed_bytes"] += freed
+                    stats["expired"] += 1
+
+            total = db.query(func.coalesce(func.sum(Artifact.size), 0)).scalar()
+            db.commit()
+            if total > settings.ARTIFACT_MAX_BYTES:
+                for row in db.query(*columns).order_by(Artifact.last_accessed_at).all():
+                    if total <= settings.ARTIFACT_MAX_BYTES:
+                        break
+                    freed = self._delete(db, row)
+                    if freed is None:
+                        continue
+                    total -= row.size
+                    stats["freed_bytes"] += freed
+                    stats["evicted"] += 1
+
+            known = {row.sha256 for row in db.query(Artifact.sha256)}
+        finally:
+            db.close()
+
+        stats["orphans"] = self._remove_orphans(known)
+        if any(stats[k] for k in ("expired", "evicted", "orphans")):
+            print(f"ArtifactStore sweep: {stats}")
+        return stats
+
+    def _delete(self, db, row) -> Optional[int]:
+        """
+        Xoá bản ghi và file nếu bản ghi chưa được chạm kể từ lúc sweep đọc (put()/get() đồng thời
+        cập nhật last_accessed_at => bỏ qua, trả về None). File bị xoá trước khi commit, lúc transaction
+        vẫn giữ khoá ghi, nên put() chạm bản ghi sau đó luôn thấy file đã mất và ghi lại.
+        """
+        deleted = db.query(Artifact).filter(
+            Artifact.sha256 == row.sha256,
+            Artifact.last_accessed_at == row.last_accessed_at,
+        ).delete(synchronize_session=False)
+        if not deleted:
+            db.rollback()
+            return None
+        try:
+            os.remove(self.path_for(row.sha256))
+            freed = row.size
+        except FileNotFoundError:
+            freed = 0
+        db.commit()
+        return freed
+
+    @staticmethod
+    def _remove_orphans(known: set) -> int:
+        removed = 0
+        deadline = time.time() - _ORPHAN_GRACE_SECONDS
+        if not os.path.isdir(settings.ARTIFACT_DIR):
+            return 0
+        for root, _, files in os.walk(settings.ARTIFACT_DIR):
+            for name in files:
+                if name in known:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < deadline:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    async def run_sweeper(self):
+        """Chạy nền trong lifespan: dọn kho mỗi ARTIFACT_SWEEP_INTERVAL giây."""
+        while True:
+            try:
+                await run_db(self.sweep)
+            except Exception as e:
+                print(f"ArtifactStore sweep lỗi: {e}")
+            await asyncio.sleep(settings.ARTIFACT_SWEEP_INTERVAL)
@@ -0,0 +1,342 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+import zipfile
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional, Set
+from app.core.config import settings
+from app.db.session import run_db
+from app.schemas.contract_schema import RiskAnalysisRequest
+from app.services.job_queue import JobContext, JobQueue, PRIORITY_LOW
+from app.services.risk_checker import RiskCheckerService
+
+JOB_TYPE = "batch_risk"
+# Trạng thái job trong hàng đợi -> trạng thái trả về cho client của batch API
+_STATUS = {"queued": "queued", "running": "running", "succeeded": "completed", "failed": "failed", "cancelled": "cancelled"}
+_FINAL_STATUSES = {"succeeded", "failed", "cancelled"}
+# Chu kỳ ghi tiến độ (meta.json + bảng jobs) khi đang chạy
+_PROGRESS_INTERVAL = 1.0
+_READ_LINES = 256
+
+
+def parse_batch_upload(path: str, filename: str) -> List[dict]:
+    """
+    Đọc file upload (đã lưu ở `path`) cho batch risk:
+    - .zip: mỗi file .txt/.md bên trong là một văn bản (id = tên file); giới hạn số file
+      (BATCH_RISK_MAX_DOCUMENTS) và tổng dung lượng sau giải nén (BATCH_UPLOAD_MAX_UNCOMPRESSED).
+    - .ndjson/.jsonl: mỗi dòng {"id": ..., "content": ..., "contract_type": ...}.
+    """
+    name = (filename or "").lower()
+    documents = []
+    if name.endswith(".zip"):
+        budget = settings.BATCH_UPLOAD_MAX_UNCOMPRESSED
+        with zipfile.ZipFile(path) as zf:
+            members = [i for i in zf.infolist() if not i.is_dir() and i.filename.lower().endswith((".txt", ".md"))]
+            if len(members) > settings.BATCH_RISK_MAX_DOCUMENTS:
+                raise ValueError(f"File zip có {len(members)} văn bản, vượt quá {settings.BATCH_RISK_MAX_DOCUMENTS}")
+            if sum(i.file_size for i in members) > budget:
+                raise ValueError(f"Tổng dung lượng sau giải nén vượt quá {budget // (1024 * 1024)} MB")
+            for info in members:
+                # file_size trong header có thể bị khai sai => đọc có giới hạn theo phần ngân sách còn lại
+                with zf.open(info) as member:
+                    raw = member.read(budget + 1)
+                budget -= len(raw)
+                if budget < 0:
+                    raise ValueError(f"Tổng dung lượng sau giải nén vượt quá "
+                                     f"{settings.BATCH_UPLOAD_MAX_UNCOMPRESSED // (1024 * 1024)} MB")
+                text = raw.decode("utf-8", errors="replace")
+                if text.strip():
+                    documents.append({"id": info.filename, "content": text})
+    elif name.endswith((".ndjson", ".jsonl")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                if len(documents) >= settings.BATCH_RISK_MAX_DOCUMENTS:
+                    raise ValueError(f"Batch vượt quá {settings.BATCH_RISK_MAX_DOCUMENTS} văn bản")
+                item = json.loads(line)
+                if not item.get("content"):
+                    raise ValueError(f"Dòng {line_no} thiếu trường 'content'")
+                documents.append(item)
+    else:
+        raise ValueError("Chỉ hỗ trợ file .zip hoặc .ndjson/.jsonl")
+    return documents
+
+
+class BatchJob:
+    """Trạng thái một batch đọc từ bảng jobs (trạng thái) và meta.json (số văn bản đã xong)."""
+
+    def __init__(self, job_id: str, status: str, total: int, completed: int, failed: int, created_at: str):
+        self.job_id = job_id
+        self.status = status
+        self.total = total
+        self.completed = completed
+        self.failed = failed
+        self.created_at = created_at
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "created_at": self.created_at,
+            "results_url": f"/api/v1/contracts/check-risk/batch/{self.job_id}/results",
+        }
+
+
+class _RunState:
+    """Trạng thái của batch đang chạy trong process này (chỉ tồn tại trong lúc chạy)."""
+
+    def __init__(self, meta: dict, done: Set[int], completed: int, failed: int):
+        self.meta = meta
+        self.done = done
+        self.completed = completed
+        self.failed = failed
+        self.lock = asyncio.Lock()
+        self.last_progress = 0.0
+
+
+class BatchRiskService:
+    """
+    Chạy check-risk cho hàng nghìn văn bản dưới dạng job của hàng đợi bền vững (JobQueue, type "batch_risk").
+    Dữ liệu mỗi job lưu ở BATCH_JOBS_DIR/<job_id>/ (input.ndjson, results.ndjson, meta.json); trạng thái nằm
+    trong bảng jobs nên mọi process (worker prefork, worker.py) đều đọc được, job dở dang được worker
+    khác nhận lại khi lease hết hạn và chạy tiếp từ văn bản chưa có kết quả. RAM chỉ giữ các văn bản
+    đang xử lý; kết quả được đọc lại từ đĩa khi client lấy.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(BatchRiskService, cls).__new__(cls)
+        return cls._instance
+
+    @property
+    def risk_service(self) -> RiskCheckerService:
+        # Tạo LLM khi job đầu tiên chạy, không phải lúc khởi động
+        return RiskCheckerService()
+
+    @staticmethod
+    def _job_dir(job_id: str) -> str:
+        return os.path.join(settings.BATCH_JOBS_DIR, job_id)
+
+    # --- Tạo job ---
+
+    async def create_job(self, documents: List[dict], contract_type: str, screening: str = "full") -> BatchJob:
+        if not documents:
+            raise ValueError("Batch không có văn bản nào")
+        if len(documents) > settings.BATCH_RISK_MAX_DOCUMENTS:
+            raise ValueError(f"Batch vượt quá {settings.BATCH_RISK_MAX_DOCUMENTS} văn bản")
+
+        job_id = uuid.uuid4().hex
+        meta = {
+            "total": len(documents),
+            "completed": 0,
+            "failed": 0,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "contract_type": contract_type,
+            "screening": screening,
+        }
+        # Ghi file trước rồi mới đưa vào hàng đợi: worker có thể nhận job ngay lập tức
+        await asyncio.to_thread(self._write_job_files, job_id, meta, documents)
+        await run_db(JobQueue().enqueue, JOB_TYPE, {"batch_id": job_id}, PRIORITY_LOW, job_id=job_id)
+        return BatchJob(job_id, "queued", meta["total"], 0, 0, meta["created_at"])
+
+    def _write_job_files(self, job_id: str, meta: dict, documents: List[dict]):
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        with open(os.path.join(job_dir, "input.ndjson"), "w", encoding="utf-8") as f:
+            for i, doc in enumerate(documents):
+                record = {
+                    "index": i,
+                    "id": str(doc.get("id") or i),
+                    "content": doc["content"],
+                    "contract_type": doc.get("contract_type") or meta["contract_type"],
+                }
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        open(os.path.join(job_dir, "results.ndjson"), "a", encoding="utf-8").close()
+        self._write_meta(job_id, meta)
+
+    def _write_meta(self, job_id: str, meta: dict):
+        path = os.path.join(self._job_dir(job_id), "meta.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def _read_meta(self, job_id: str) -> dict:
+        with open(os.path.join(self._job_dir(job_id), "meta.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    # --- Thực thi (handler của JobQueue) ---
+
+    async def run(self, ctx: JobContext, payload: dict) -> dict:
+        """
+        Xử lý các văn bản chưa có kết quả: một task đọc input.ndjson tuần tự vào hàng đợi có giới hạn,
+        BATCH_RISK_CONCURRENCY task lấy ra phân tích và ghi thêm vào results.ndjson.
+        """
+        job_id = payload["batch_id"]
+        job_dir = self._job_dir(job_id)
+        meta = await asyncio.to_thread(self._read_meta, job_id)
+        done, completed, failed = await asyncio.to_thread(self._recover_results, job_dir)
+        state = _RunState(meta, done, completed, failed)
+
+        out = await asyncio.to_thread(open, os.path.join(job_dir, "results.ndjson"), "a", encoding="utf-8")
+        records: asyncio.Queue = asyncio.Queue(maxsize=settings.BATCH_RISK_CONCURRENCY * 2)
+
+        async def produce():
+            with open(os.path.join(job_dir, "input.ndjson"), "r", encoding="utf-8") as f:
+                while True:
+                    lines = await asyncio.to_thread(self._read_lines, f)
+                    if not lines:
+                        break
+                    for line in lines:
+                        record = json.loads(line)
+                        if record["index"] not in state.done:
+                            await records.put(record)
+            for _ in range(settings.BATCH_RISK_CONCURRENCY):
+                await records.put(None)
+
+        async def consume():
+            while True:
+                record = await records.get()
+                if record is None:
+                    return
+                ctx.check_cancelled()
+                await self._process(ctx, job_id, state, record, out)
+
+        tasks = [asyncio.create_task(produce())]
+        tasks += [asyncio.create_task(consume()) for _ in range(settings.BATCH_RISK_CONCURRENCY)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            out.close()
+        await self._save_progress(ctx, job_id, state, force=True)
+        return {"total": meta["total"], "completed": state.completed, "failed": state.failed}
+
+    @staticmethod
+    def _read_lines(f) -> List[str]:
+        lines = []
+        for _ in range(_READ_LINES):
+            line = f.readline()
+            if not line:
+                break
+            lines.append(line)
+        return lines
+
+    async def _process(self, ctx: JobContext, job_id: str, state: _RunState, record: dict, out):
+        line = {"index": record["index"], "id": record["id"]}
+        try:
+            # Dùng chung RiskCheckerService => cache theo điều khoản được chia sẻ giữa các văn bản
+            result = await self.risk_service.analyze_document(RiskAnalysisRequest(
+                content=record["content"],
+                contract_type=record["contract_type"],
+                screening=state.meta["screening"],
+            ))
+            line.update({"status": "ok", "result": result})
+        except Exception as e:
+            print(f"Batch risk error ({job_id}/{record['id']}): {e}")
+            line.update({"status": "error", "error": str(e)})
+
+        async with state.lock:
+            line["seq"] = state.completed
+            # Ghi tuần tự (đang giữ lock) để các dòng NDJSON không chen lẫn nhau
+            await asyncio.to_thread(self._append_line, out, json.dumps(line, ensure_ascii=False, default=str))
+            state.done.add(record["index"])
+            state.completed += 1
+            if line["status"] == "error":
+                state.failed += 1
+            await self._save_progress(ctx, job_id, state)
+
+    async def _save_progress(self, ctx: JobContext, job_id: str, state: _RunState, force: bool = False):
+        now = time.monotonic()
+        if not force and now - state.last_progress < _PROGRESS_INTERVAL:
+            return
+        state.last_progress = now
+        state.meta.update({"completed": state.completed, "failed": state.failed})
+        await asyncio.to_thread(self._write_meta, job_id, dict(state.meta))
+        total = state.meta["total"]
+        await run_db(ctx.progress, state.completed / total if total else 1.0, f"{state.completed}/{total} văn bản")
+
+    @staticmethod
+    def _append_line(out, text: str):
+        out.write(text + "\n")
+        out.flush()
+
+    @staticmethod
+    def _recover_results(job_dir: str):
+        """Đọc kết quả đã ghi (lần chạy trước bị dừng giữa chừng), cắt bỏ dòng cuối ghi dở."""
+        results_path = os.path.join(job_dir, "results.ndjson")
+        done, completed, failed, valid_bytes = set(), 0, 0, 0
+        with open(results_path, "rb") as f:
+            for raw in f:
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    break
+                if not raw.endswith(b"\n"):
+                    break
+                valid_bytes += len(raw)
+                done.add(record["index"])
+                completed += 1
+                if record.get("status") == "error":
+                    failed += 1
+        if valid_bytes < os.path.getsize(results_path):
+            # Cắt bỏ phần ghi dở để các dòng mới không bị dính vào
+            with open(results_path, "r+b") as f:
+                f.truncate(valid_bytes)
+        return done, completed, failed
+
+    # --- Đọc trạng thái / kết quả ---
+
+    async def get_job(self, job_id: str) -> Optional[BatchJob]:
+        row = await run_db(JobQueue().get, job_id)
+        if row is None or row.type != JOB_TYPE:
+            return None
+        try:
+            meta = await asyncio.to_thread(self._read_meta, job_id)
+        except (OSError, ValueError):
+            return None
+        return BatchJob(job_id, _STATUS.get(row.status, row.status), meta["total"],
+                        meta.get("completed", 0), meta.get("failed", 0), meta["created_at"])
+
+    async def iter_results(self, job_id: str, offset: int = 0, follow: bool = True) -> AsyncIterator[str]:
+        """
+        Stream kết quả (NDJSON) từ results.ndjson bắt đầu ở dòng `offset`; với follow=True đọc tiếp phần
+        mới ghi (job có thể đang chạy ở process khác) cho tới khi job kết thúc.
+        """
+        path = os.path.join(self._job_dir(job_id), "results.ndjson")
+        f = await asyncio.to_thread(open, path, "r", encoding="utf-8")
+        try:
+            seen, partial = 0, ""
+            while True:
+                lines = await asyncio.to_thread(self._read_lines, f)
+                for line in lines:
+                    if not line.endswith("\n"):
+                        partial += line  # Dòng đang được ghi dở
+                        continue
+                    line, partial = partial + line, ""
+                    if seen >= offset:
+                        yield line
+                    seen += 1
+                if lines:
+                    continue
+                if not follow:
+                    return
+                row = await run_db(JobQueue().get, job_id)
+                if row is None or row.status in _FINAL_STATUSES:
+                    # Đọc nốt phần ghi sau lần đọc cuối rồi dừng
+                    follow = False
+                    continue
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+        finally:
+            f.close()
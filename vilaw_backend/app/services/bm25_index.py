@@ -0,0 +1,75 @@
+import math
+from typing import Dict, List, Tuple
+import numpy as np
+
+
+class BM25Index:
+    """
+    BM25 Okapi (cùng công thức và tham số mặc định với rank_bm25.BM25Okapi) lưu dạng postings trong
+    mảng numpy liền khối thay vì một dict tần suất cho mỗi văn bản:
+    - chấm điểm chỉ duyệt văn bản chứa từ của câu hỏi, không lặp Python qua toàn bộ corpus
+    - phần lớn bộ nhớ là buffer numpy, đọc không chạm refcount => các worker fork từ cùng
+      master (serve_prefork.py) dùng chung trang bộ nhớ mà không bị copy-on-write
+    """
+
+    def __init__(self, corpus: List[List[str]], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.corpus_size = len(corpus)
+        doc_len = np.fromiter((len(doc) for doc in corpus), dtype=np.float64, count=self.corpus_size)
+        self.avgdl = float(doc_len.sum()) / self.corpus_size
+        # Mẫu số BM25 không phụ thuộc câu hỏi ngoài tf => tính sẵn k1 * (1 - b + b * dl / avgdl)
+        self._norm = k1 * (1 - b + b * doc_len / self.avgdl)
+
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        for doc_id, document in enumerate(corpus):
+            frequencies: Dict[str, int] = {}
+            for word in document:
+                frequencies[word] = frequencies.get(word, 0) + 1
+            for word, freq in frequencies.items():
+                entry = postings.get(word)
+                if entry is None:
+                    entry = postings[word] = ([], [])
+                entry[0].append(doc_id)
+                entry[1].append(freq)
+
+        # terms: từ -> (vị trí bắt đầu, kết thúc trong _doc_ids/_tf, idf)
+        self.terms: Dict[str, Tuple[int, int, float]] = {}
+        doc_ids, tf = [], []
+        idfs = {}
+        for word, (ids, freqs) in postings.items():
+            idfs[word] = math.log(self.corpus_size - len(ids) + 0.5) - math.log(len(ids) + 0.5)
+        average_idf = sum(idfs.values()) / len(idfs) if idfs else 0.0
+        eps = epsilon * average_idf
+        for word, (ids, freqs) in postings.items():
+            start = len(doc_ids)
+            doc_ids.extend(ids)
+            tf.extend(freqs)
+            idf = idfs[word]
+            self.terms[word] = (start, len(doc_ids), float(idf if idf >= 0 else eps))
+        self._doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self._tf = np.asarray(tf, dtype=np.float64)
+
+    def get_scores(self, query: List[str]) -> np.ndarray:
+        score = np.zeros(self.corpus_size)
+        for word in query:
+            term = self.terms.get(word)
+            if term is None:
+                continue
+            start, end, idf = term
+            docs = self._doc_ids[start:end]
+            tf = self._tf[start:end]
+            score[docs] += idf * (tf * (self.k1 + 1) / (tf + self._norm[docs]))
+        return score
+
+    def top_k(self, query: List[str], k: int) -> List[int]:
+        """Chỉ số k văn bản điểm cao nhất (bằng điểm thì văn bản đứng trước xếp trước)."""
+        return self.rank(self.get_scores(query), k)
+
+    @staticmethod
+    def rank(scores: np.ndarray, k: int) -> List[int]:
+        return np.argsort(-scores, kind="stable")[:k].tolist()
+
+    @property
+    def nbytes(self) -> int:
+        return self._doc_ids.nbytes + self._tf.nbytes + self._norm.nbytes
@@ -0,0 +1,265 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from app.core.config import settings
+from app.core.metrics import cache_hit
+from app.db.session import SessionLocal, run_db
+from app.db.models import ChatHistory, Conversation
+from app.services.llm_engine import get_llm
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_template("""
+<|im_start|>system
+Bạn tóm tắt cuộc trò chuyện tư vấn pháp luật giữa người dùng và ViLaw để dùng làm ngữ cảnh cho các lượt sau.
+Giữ lại: sự việc, thông tin cá nhân/số liệu người dùng đã cung cấp, câu hỏi chính, kết luận pháp lý đã đưa ra.
+Viết ngắn gọn, tối đa {max_words} từ, không thêm thông tin mới.
+<|im_end|>
+<|im_start|>user
+Tóm tắt trước đó:
+{summary}
+
+Các lượt hội thoại tiếp theo:
+{turns}
+<|im_end|>
+<|im_start|>assistant
+""")
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng nhanh (~3 ký tự/token với tiếng Việt có dấu), đủ để giới hạn cửa sổ lịch sử."""
+    return len(text) // 3 + 1
+
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.question) + estimate_tokens(self.answer)
+
+
+@dataclass
+class ConversationState:
+    summary: str = ""
+    summarized_turns: int = 0                       # Số lượt (theo thứ tự) đã gộp vào summary
+    turns: List[Turn] = field(default_factory=list)  # Các lượt sau phần đã tóm tắt
+    compacting: bool = False
+
+
+class ConversationStore:
+    """
+    Bộ nhớ hội thoại cho chat:
+    - Cache nóng trong RAM (LRU theo conversation_id), đọc DB (chat_history + conversations) khi miss.
+    - Ghi sau (write-behind): lượt mới vào buffer, task nền commit theo lô mỗi CONVERSATION_FLUSH_INTERVAL giây
+      hoặc khi đủ CONVERSATION_FLUSH_BATCH lượt.
+    - Prompt chỉ chứa summary + các lượt gần nhất trong CONVERSATION_HISTORY_TOKENS; khi các lượt chưa tóm tắt
+      vượt cửa sổ, lượt cũ được LLM gộp vào summary (chạy nền, không chặn câu trả lời).
+    Nhiều process dùng chung DB (worker của serve_prefork.py, `cache_enabled = False`): không cache, không ghi sau;
+    mỗi lần đọc lấy từ DB và mỗi lượt được commit ngay, vì process khác có thể vừa thêm lượt hoặc gộp summary.
+    """
+    _instance = None
+    # false trong worker của serve_prefork.py: DB là nguồn chuẩn duy nhất
+    cache_enabled = True
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ConversationStore, cls).__new__(cls)
+            cls._instance._cache: "OrderedDict[str, ConversationState]" = OrderedDict()
+            cls._instance._pending_turns: List[dict] = []
+            cls._instance._pending_meta: Dict[str, dict] = {}
+            cls._instance._flusher: Optional[asyncio.Task] = None
+            cls._instance._wakeup: Optional[asyncio.Event] = None
+            cls._instance._llm = None
+            # Hội thoại đang được gộp summary (chế độ không cache: state mỗi lần đọc là object mới)
+            cls._instance._compacting: set = set()
+        return cls._instance
+
+    # --- Đọc ---
+
+    async def get(self, conversation_id: str) -> ConversationState:
+        if not self.cache_enabled:
+            return await run_db(self._load, conversation_id)
+        state = self._cache.get(conversation_id)
+        cache_hit("conversation", state is not None)
+        if state is None:
+            loaded = await run_db(self._load, conversation_id)
+            # Request khác có thể đã nạp trong lúc chờ DB
+            state = self._cache.setdefault(conversation_id, loaded)
+            self._apply_pending(conversation_id, state if state is loaded else None)
+        self._cache.move_to_end(conversation_id)
+        while len(self._cache) > settings.CONVERSATION_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return state
+
+    @staticmethod
+    def _load(conversation_id: str) -> ConversationState:
+        db = SessionLocal()
+        try:
+            state = ConversationState()
+            conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+            if conversation is not None:
+                state.summary = conversation.summary or ""
+                state.summarized_turns = conversation.summarized_turns or 0
+            rows = (
+                db.query(ChatHistory.question, ChatHistory.answer)
+                .filter(ChatHistory.conversation_id == conversation_id)
+                .order_by(ChatHistory.id)
+                .offset(state.summarized_turns)
+                .all()
+            )
+            state.turns = [Turn(row.question or "", row.answer or "") for row in rows]
+            return state
+        finally:
+            db.close()
+
+    def _apply_pending(self, conversation_id: str, state: Optional[ConversationState]):
+        """Bản ghi vừa nạp từ DB chưa có các lượt còn nằm trong buffer ghi sau."""
+        if state is None:
+            return
+        meta = self._pending_meta.get(conversation_id)
+        pending = [Turn(t["question"], t["answer"]) for t in self._pending_turns if t["conversation_id"] == conversation_id]
+        if meta is not None:
+            # Summary mới hơn DB: bỏ các lượt đã gộp
+            skip = meta["summarized_turns"] - state.summarized_turns
+            state.summary, state.summarized_turns = meta["summary"], meta["summarized_turns"]
+            state.turns = (state.turns + pending)[skip:]
+        else:
+            state.turns.extend(pending)
+
+    def render_history(self, state: ConversationState) -> str:
+        """Summary + các lượt mới nhất vừa cửa sổ token, theo định dạng <|im_start|> của prompt chat."""
+        budget = settings.CONVERSATION_HISTORY_TOKENS
+        recent: List[Turn] = []
+        for turn in reversed(state.turns):
+            if turn.tokens > budget:
+                break
+            budget -= turn.tokens
+            recent.append(turn)
+        parts = []
+        if state.summary:
+            parts.append(f"<|im_start|>system\nTóm tắt cuộc trò chuyện trước đó:\n{state.summary}<|im_end|>\n")
+        for turn in reversed(recent):
+            parts.append(f"<|im_start|>user\n{turn.question}<|im_end|>\n")
+            parts.append(f"<|im_start|>assistant\n{turn.answer}<|im_end|>\n")
+        return "".join(parts)
+
+    # --- Ghi ---
+
+    async def append(self, conversation_id: str, question: str, answer: str):
+        row = {"conversation_id": conversation_id, "question": question, "answer": answer,
+               "timestamp": datetime.utcnow()}
+        if self.cache_enabled:
+            state = await self.get(conversation_id)
+            state.turns.append(Turn(question, answer))
+            self._pending_turns.append(row)
+            self._ensure_flusher()
+            if len(self._pending_turns) >= settings.CONVERSATION_FLUSH_BATCH:
+                self._wakeup.set()
+        else:
+            # Commit ngay rồi đọc lại: thứ tự lượt trong state khớp thứ tự id trong DB (OFFSET của _load dựa vào đó)
+            await run_db(self._write, [row], {})
+            state = await self.get(conversation_id)
+        if (not state.compacting and conversation_id not in self._compacting
+                and sum(t.tokens for t in state.turns) > settings.CONVERSATION_HISTORY_TOKENS):
+            state.compacting = True
+            self._compacting.add(conversation_id)
+            asyncio.create_task(self._compact(conversation_id, state))
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._wakeup = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.CONVERSATION_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Commit toàn bộ buffer trong một transaction; lỗi thì giữ lại để lần sau ghi tiếp."""
+        if not self._pending_turns and not self._pending_meta:
+            return
+        turns, self._pending_turns = self._pending_turns, []
+        meta, self._pending_meta = self._pending_meta, {}
+        try:
+            await run_db(self._write, turns, meta)
+        except Exception as e:
+            print(f"ConversationStore: ghi lịch sử lỗi ({len(turns)} lượt), thử lại sau: {e}")
+            self._pending_turns = turns + self._pending_turns
+            for conversation_id, values in meta.items():
+                self._pending_meta.setdefault(conversation_id, values)
+
+    @staticmethod
+    def _write(turns: List[dict], meta: Dict[str, dict]):
+        db = SessionLocal()
+        try:
+            if turns:
+                db.bulk_insert_mappings(ChatHistory, turns)
+            now = datetime.utcnow()
+            for conversation_id, values in meta.items():
+                conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+                if conversation is None:
+                    db.add(Conversation(id=conversation_id, created_at=now, updated_at=now, **values))
+                elif (conversation.summarized_turns or 0) >= values["summarized_turns"]:
+                    # Process khác đã gộp tới (hoặc quá) mốc này; summary của mỗi bên luôn phủ đúng
+                    # summarized_turns lượt đầu nên chỉ giữ bản phủ nhiều lượt hơn
+                    continue
+                else:
+                    conversation.summary = values["summary"]
+                    conversation.summarized_turns = values["summarized_turns"]
+                    conversation.updated_at = now
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    # --- Gộp lịch sử cũ vào summary ---
+
+    async def _compact(self, conversation_id: str, state: ConversationState):
+        try:
+            # Giữ lại các lượt mới nhất chiếm tối đa nửa cửa sổ, phần cũ hơn đem tóm tắt
+            keep_budget = settings.CONVERSATION_HISTORY_TOKENS // 2
+            keep = 0
+            for turn in reversed(state.turns):
+                if turn.tokens > keep_budget:
+                    break
+                keep_budget -= turn.tokens
+                keep += 1
+            old = state.turns[:len(state.turns) - keep]
+            if not old:
+                return
+            if self._llm is None:
+                self._llm = get_llm(streaming=False, temperature=0)
+            chain = SUMMARY_PROMPT | self._llm | StrOutputParser()
+            summary = await chain.ainvoke({
+                "max_words": settings.CONVERSATION_SUMMARY_WORDS,
+                "summary": state.summary or "(chưa có)",
+                "turns": "\n".join(f"Người dùng: {t.question}\nViLaw: {t.answer}" for t in old),
+            })
+            # Các lượt mới có thể đã được thêm trong lúc chờ LLM => chỉ bỏ đúng phần đã tóm tắt
+            state.turns = state.turns[len(old):]
+            state.summary = summary.strip()
+            state.summarized_turns += len(old)
+            meta = {"summary": state.summary, "summarized_turns": state.summarized_turns}
+            if self.cache_enabled:
+                self._pending_meta[conversation_id] = meta
+                self._ensure_flusher()
+            else:
+                await run_db(self._write, [], {conversation_id: meta})
+        except Exception as e:
+            # Lịch sử cũ vẫn bị cắt khỏi prompt theo cửa sổ token, chỉ mất phần tóm tắt
+            print(f"ConversationStore: tóm tắt hội thoại {conversation_id} lỗi: {e}")
+        finally:
+            state.compacting = False
+            self._compacting.discard(conversation_id)
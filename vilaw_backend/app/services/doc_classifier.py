@@ -0,0 +1,232 @@
+import asyncio
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Union
+from PIL import Image, ImageOps
+from app.core.config import settings
+from app.core.metrics import cache_hit
+from app.services.image_preprocess import open_image
+
+# Trọng số các đặc trưng khi so với template (chỉ tính những đặc trưng template có)
+_WEIGHTS = {"hash": 0.5, "color": 0.3, "aspect": 0.2}
+_HIST_BINS = 3  # 3 mức mỗi kênh RGB => histogram 27 ô
+# Ảnh đồng màu / trang chữ trắng: dHash gần như cố định (mọi trang A4 đều ra cùng hash) => không
+# dùng template hay cache cho ảnh có độ tương phản (texture) dưới DOC_CLASSIFIER_MIN_TEXTURE
+# Cache hit phải khớp cả tỉ lệ khung (lệch tối đa 10%) bên cạnh dHash và histogram
+_CACHE_ASPECT_TOLERANCE = math.log(1.10)
+
+
+@dataclass
+class ImageFeatures:
+    dhash: int
+    aspect: float               # cạnh dài / cạnh ngắn (không phụ thuộc ảnh dọc/ngang)
+    mean_color: List[float]     # RGB trung bình, 0..1
+    color_hist: List[float]     # histogram 27 ô, tổng = 1
+    texture: float              # chênh lệch độ sáng trung bình giữa 2 ô kề nhau của lưới dHash, 0..1
+
+
+@dataclass
+class Template:
+    type: str
+    name: str
+    dhash: int
+    color_hist: List[float]
+    aspect: Optional[float] = None
+    mean_color: Optional[List[float]] = None
+
+
+@dataclass
+class Classification:
+    type: Optional[str]         # None => không đủ tự tin, cần hỏi LLM
+    confidence: float
+    source: str                 # "template" | "cache" | "unsure"
+    features: Optional[ImageFeatures] = None
+    template: Optional[str] = None
+    elapsed_ms: float = 0.0
+    scores: dict = field(default_factory=dict)
+
+
+def extract_features(source: Union[bytes, str]) -> ImageFeatures:
+    """Decode ảnh ở độ phân giải rất thấp (draft) rồi tính dHash 64 bit, màu và tỉ lệ khung."""
+    image = open_image(source)
+    image.draft("RGB", (128, 128))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    # Đưa về khổ ngang để thẻ chụp dọc vẫn khớp template
+    if image.height > image.width:
+        image = image.transpose(Image.Transpose.ROTATE_90)
+
+    gray = image.convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+    pixels = list(gray.getdata())
+    dhash = 0
+    gradient = 0
+    for row in range(8):
+        for col in range(8):
+            left, right = pixels[row * 9 + col], pixels[row * 9 + col + 1]
+            dhash = (dhash << 1) | (1 if left > right else 0)
+            gradient += abs(left - right)
+
+    small = image.resize((32, 32), Image.Resampling.BILINEAR)
+    hist = [0] * (_HIST_BINS ** 3)
+    totals = [0, 0, 0]
+    for r, g, b in small.getdata():
+        totals[0] += r
+        totals[1] += g
+        totals[2] += b
+        idx = (r * _HIST_BINS // 256) * _HIST_BINS ** 2 + (g * _HIST_BINS // 256) * _HIST_BINS + b * _HIST_BINS // 256
+        hist[idx] += 1
+    count = 32 * 32
+    return ImageFeatures(
+        dhash=dhash,
+        aspect=image.width / image.height,
+        mean_color=[t / count / 255 for t in totals],
+        color_hist=[h / count for h in hist],
+        texture=gradient / 64 / 255,
+    )
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def hist_similarity(a: List[float], b: List[float]) -> float:
+    """Histogram intersection: 1 = phân bố màu trùng khớp."""
+    return sum(min(x, y) for x, y in zip(a, b))
+
+
+class DocumentClassifier:
+    """
+    Phân loại nhanh giấy tờ tuỳ thân (CCCD, bằng lái...) trên CPU bằng cách so đặc trưng ảnh
+    với template mẫu (app/data/doc_templates.json, sinh bằng tools/build_doc_templates.py).
+    Chỉ trả về loại giấy tờ khi đủ tự tin; quyết định (kể cả kết quả LLM) được cache theo dHash
+    và chỉ dùng lại khi dHash, histogram màu và tỉ lệ khung cùng khớp. Ảnh ít chi tiết (trang chữ,
+    ảnh đồng màu) luôn rơi xuống LLM.
+    """
+    _instance = None
+
+    def __new__(cls, path: str = None):
+        if path is not None:
+            classifier = super(DocumentClassifier, cls).__new__(cls)
+            classifier.load(path)
+            return classifier
+        if cls._instance is None:
+            cls._instance = super(DocumentClassifier, cls).__new__(cls)
+            cls._instance.load(settings.DOC_CLASSIFIER_TEMPLATES_PATH)
+        return cls._instance
+
+    def load(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.path = path
+        self.templates = []
+        for raw in data.get("templates", []):
+            spec = dict(raw)
+            # Chỉ tỉ lệ khung + màu trung bình thì ảnh trống cùng màu cũng khớp => bắt buộc có dHash và histogram
+            if spec.get("dhash") is None or spec.get("color_hist") is None:
+                print(f"DocumentClassifier: bỏ template '{spec.get('name')}' thiếu dhash/color_hist "
+                      "(sinh lại bằng tools/build_doc_templates.py)")
+                continue
+            spec["dhash"] = int(spec["dhash"], 16)
+            spec.pop("source", None)
+            self.templates.append(Template(**spec))
+        self._cache: "OrderedDict[int, Classification]" = OrderedDict()
+        self._lock = threading.Lock()  # classify() chạy song song trong các thread
+        self.stats = {"template": 0, "cache": 0, "unsure": 0, "low_texture": 0, "llm_learned": 0}
+
+    # --- Phân loại ---
+
+    def classify(self, source: Union[bytes, str]) -> Classification:
+        """`source`: bytes hoặc đường dẫn ảnh. Chạy đồng bộ (vài ms); gọi qua classify_async từ event loop."""
+        started = time.perf_counter()
+        features = extract_features(source)
+        if features.texture < settings.DOC_CLASSIFIER_MIN_TEXTURE:
+            self.stats["low_texture"] += 1
+            return Classification(type=None, confidence=0.0, source="unsure", features=features,
+                                  elapsed_ms=(time.perf_counter() - started) * 1000)
+
+        cached = self._cache_lookup(features)
+        cache_hit("doc_classifier", cached is not None)
+        if cached is not None:
+            self.stats["cache"] += 1
+            return Classification(
+                type=cached.type, confidence=cached.confidence, source="cache",
+                features=features, template=cached.template,
+                elapsed_ms=(time.perf_counter() - started) * 1000,
+            )
+
+        best_by_type = {}
+        for template in self.templates:
+            score = self._score(features, template)
+            if score > best_by_type.get(template.type, (0.0, None))[0]:
+                best_by_type[template.type] = (score, template.name)
+
+        ranked = sorted(best_by_type.items(), key=lambda item: item[1][0], reverse=True)
+        result = Classification(type=None, confidence=0.0, source="unsure", features=features,
+                                scores={t: round(s, 3) for t, (s, _) in ranked})
+        if ranked:
+            doc_type, (score, name) = ranked[0]
+            runner_up = ranked[1][1][0] if len(ranked) > 1 else 0.0
+            result.confidence = score
+            if score >= settings.DOC_CLASSIFIER_THRESHOLD and score - runner_up >= settings.DOC_CLASSIFIER_MARGIN:
+                result.type, result.source, result.template = doc_type, "template", name
+                self._cache_put(result)
+
+        self.stats[result.source] += 1
+        result.elapsed_ms = (time.perf_counter() - started) * 1000
+        return result
+
+    async def classify_async(self, source: Union[bytes, str]) -> Optional[Classification]:
+        """Trả về None nếu file không đọc được như ảnh (VD: PDF)."""
+        try:
+            return await asyncio.to_thread(self.classify, source)
+        except Exception as e:
+            print(f"DocumentClassifier: không trích xuất được đặc trưng ảnh: {e}")
+            return None
+
+    def remember(self, decision: Classification, doc_type: str, confidence: float = 1.0):
+        """Lưu kết quả LLM để ảnh gần giống (dHash + histogram + tỉ lệ) lần sau không phải gọi lại."""
+        if decision.features is None or decision.features.texture < settings.DOC_CLASSIFIER_MIN_TEXTURE:
+            return
+        self.stats["llm_learned"] += 1
+        self._cache_put(Classification(type=doc_type, confidence=confidence, source="llm", features=decision.features))
+
+    @staticmethod
+    def _score(features: ImageFeatures, template: Template) -> float:
+        parts = {
+            "hash": max(0.0, 1 - hamming(features.dhash, template.dhash) / 32),
+            "color": hist_similarity(features.color_hist, template.color_hist),
+        }
+        if template.aspect is not None:
+            # Lệch 25% tỉ lệ khung => 0 điểm
+            parts["aspect"] = max(0.0, 1 - abs(math.log(features.aspect / template.aspect)) / math.log(1.25))
+        total = sum(_WEIGHTS[k] for k in parts)
+        return sum(_WEIGHTS[k] * v for k, v in parts.items()) / total
+
+    # --- Cache theo perceptual hash ---
+
+    def _cache_lookup(self, features: ImageFeatures) -> Optional[Classification]:
+        # dHash chỉ mô tả bố cục (CCCD và bằng lái rất giống nhau) => còn phải khớp histogram màu và tỉ lệ khung
+        max_distance = settings.DOC_CLASSIFIER_HASH_DISTANCE
+        min_similarity = settings.DOC_CLASSIFIER_CACHE_HIST_MATCH
+        with self._lock:
+            for key, value in self._cache.items():
+                cached = value.features
+                if (hamming(key, features.dhash) <= max_distance
+                        and abs(math.log(features.aspect / cached.aspect)) <= _CACHE_ASPECT_TOLERANCE
+                        and hist_similarity(features.color_hist, cached.color_hist) >= min_similarity):
+                    self._cache.move_to_end(key)
+                    return value
+            return None
+
+    def _cache_put(self, result: Classification):
+        if result.features.texture < settings.DOC_CLASSIFIER_MIN_TEXTURE:
+            return
+        key = result.features.dhash
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > settings.DOC_CLASSIFIER_CACHE_SIZE:
+                self._cache.popitem(last=False)
@@ -0,0 +1,124 @@
+import io
+import re
+import threading
+import zipfile
+from xml.sax.saxutils import escape
+
+# Phần document.xml nằm giữa <w:body> và </w:body> là thứ duy nhất thay đổi theo từng văn bản
+_DOCUMENT_PART = "word/document.xml"
+_FONT = "Times New Roman"
+# Thời gian cố định cho các entry zip => cùng nội dung cho ra cùng bytes (kho artifact khử trùng theo sha256)
+_ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+# Ký tự điều khiển không hợp lệ trong XML (LLM thỉnh thoảng sinh ra)
+_INVALID_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_CLAUSE_LINE = re.compile(r"^(Điều|Khoản)\s+\d+[:\.]", re.IGNORECASE)
+
+# Định dạng đoạn (pPr) và run (rPr) theo loại dòng, giống logic format của bản python-docx cũ
+_FORMATS = {
+    "plain": ("", ""),
+    "national": ('<w:pPr><w:jc w:val="center"/></w:pPr>', "<w:rPr><w:b/><w:sz w:val=\"26\"/></w:rPr>"),
+    "title": (
+        '<w:pPr><w:spacing w:before="240" w:after="240"/><w:jc w:val="center"/></w:pPr>',
+        "<w:rPr><w:b/><w:sz w:val=\"28\"/></w:rPr>",
+    ),
+    "clause": ('<w:pPr><w:spacing w:before="120"/></w:pPr>', "<w:rPr><w:b/></w:rPr>"),
+    "party": ("", "<w:rPr><w:b/></w:rPr>"),
+}
+
+
+def classify_line(line: str) -> str:
+    """Loại dòng: quốc hiệu/tiêu ngữ, tên văn bản, Điều/Khoản, các bên, hoặc văn bản thường."""
+    if "CỘNG HÒA XÃ HỘI" in line.upper() or ("Độc lập" in line and "Tự do" in line):
+        return "national"
+    if len(line) < 100 and line.isupper() and "ĐIỀU" not in line:
+        return "title"
+    if _CLAUSE_LINE.match(line):
+        return "clause"
+    if line.startswith(("Bên A", "Bên B", "ĐẠI DIỆN")):
+        return "party"
+    return "plain"
+
+
+def _paragraph(line: str) -> str:
+    ppr, rpr = _FORMATS[classify_line(line)]
+    text = escape(_INVALID_XML.sub("", line))
+    text = text.replace("\t", '</w:t><w:tab/><w:t xml:space="preserve">')
+    return f'<w:p>{ppr}<w:r>{rpr}<w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+
+
+def _entry(name: str) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(name, date_time=_ZIP_DATE)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+class _BaseTemplate:
+    """
+    File .docx mẫu (style Normal = Times New Roman 12) dựng bằng python-docx một lần rồi giữ trong RAM:
+    - `package`: zip đã nén sẵn mọi part trừ document.xml (styles.xml ~800KB chỉ nén một lần)
+    - `head`/`tail`: document.xml cắt tại nội dung body
+    """
+
+    def __init__(self):
+        from docx import Document
+        from docx.oxml.ns import qn
+        from docx.shared import Pt
+
+        doc = Document()
+        style = doc.styles["Normal"]
+        style.font.name = _FONT
+        style.font.size = Pt(12)
+        fonts = style.element.get_or_add_rPr().get_or_add_rFonts()
+        for attr in ("w:ascii", "w:hAnsi", "w:cs", "w:eastAsia"):
+            fonts.set(qn(attr), _FONT)
+
+        source = io.BytesIO()
+        doc.save(source)
+        package = io.BytesIO()
+        with zipfile.ZipFile(source) as src, zipfile.ZipFile(package, "w", zipfile.ZIP_DEFLATED) as dst:
+            for info in src.infolist():
+                data = src.read(info.filename)
+                if info.filename == _DOCUMENT_PART:
+                    document_xml = data.decode("utf-8")
+                    continue
+                dst.writestr(_entry(info.filename), data)
+        self.package = package.getvalue()
+
+        body_start = document_xml.index("<w:body>") + len("<w:body>")
+        body_end = document_xml.index("<w:sectPr")
+        self.head = document_xml[:body_start].encode("utf-8")
+        self.tail = document_xml[body_end:].encode("utf-8")
+
+
+_base = None
+_base_lock = threading.Lock()
+
+
+def _get_base() -> _BaseTemplate:
+    global _base
+    if _base is None:
+        with _base_lock:
+            if _base is None:
+                _base = _BaseTemplate()
+    return _base
+
+
+def render_docx(content: str) -> bytes:
+    """
+    Dựng file .docx (bytes) từ văn bản thuần: mỗi dòng khác rỗng là một đoạn.
+    document.xml được ghép một lượt bằng chuỗi rồi nối vào bản sao zip mẫu — không tạo object
+    python-docx cho từng đoạn, không nén lại styles. Thread-safe.
+    """
+    base = _get_base()
+    body = "".join(_paragraph(line) for line in (raw.strip() for raw in content.split("\n")) if line)
+    output = io.BytesIO(base.package)
+    output.seek(0, io.SEEK_END)
+    with zipfile.ZipFile(output, "a", zipfile.ZIP_DEFLATED) as package:
+        package.writestr(_entry(_DOCUMENT_PART), base.head + body.encode("utf-8") + base.tail)
+    return output.getvalue()
+
+
+def warm_up():
+    """Dựng template mẫu trước (gọi lúc khởi động để request đầu tiên không chịu chi phí này)."""
+    _get_base()
@@ -1,25 +1,22 @@
-import os
 import asyncio
+import json
 import re
 from datetime import datetime
-from docx import Document
-from docx.shared import Pt, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
+from typing import AsyncIterator, List, Optional, Tuple
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from app.core.config import settings
+from app.core.metrics import timed
+from app.core.tracing import traced
+from app.services.artifact_store import DOCX_CONTENT_TYPE, ArtifactStore
+from app.services.docx_renderer import render_docx
 from app.services.llm_engine import get_llm
-from app.services.risk_checker import RiskCheckerService
+from app.services.risk_checker import CLAUSE_BOUNDARY, RiskCheckerService
+from app.services.templates import TEMPLATE_SPECS, find_template, missing_fields, normalize_metadata, render_template
 from app.schemas.contract_schema import ContractDraftRequest, RiskAnalysisRequest
 
-class DrafterService:
-    def __init__(self):
-        # Dùng model tốt (GPT-4o/Gemini Pro) để viết văn bản hay
-        self.llm = get_llm(streaming=False, temperature=0.5)
-        self.risk_checker = RiskCheckerService()
-
-    async def draft_contract(self, data: ContractDraftRequest) -> dict:
-        # 1. Soạn thảo văn bản
-        prompt = ChatPromptTemplate.from_template("""
+# Prompt soạn thảo dùng chung cho /draft và /draft/stream
+DRAFT_PROMPT = ChatPromptTemplate.from_template("""
         <|im_start|>system
         Bạn là Luật sư cao cấp tại Việt Nam. Nhiệm vụ: Soạn thảo văn bản pháp lý chuyên nghiệp.
         
@@ -28,7 +25,7 @@ class DrafterService:
         2. Tiêu ngữ: Độc lập - Tự do - Hạnh phúc (Dòng 2)
         3. Tên văn bản: VIẾT HOA TOÀN BỘ (VD: HỢP ĐỒNG MUA BÁN)
         4. Căn cứ pháp lý: Căn cứ Bộ luật Dân sự 2015...
-        5. Nội dung: Chia thành "Điều 1:", "Điều 2:" rõ ràng.
+        5. Nội dung: Chia thành "Điều 1:", "Điều 2:" rõ ràng, mỗi Điều bắt đầu ở dòng mới.
         6. Phần ký tên: Bên A và Bên B ở cuối.
 
         Ngôn ngữ: Trang trọng, chặt chẽ, bảo vệ quyền lợi hợp pháp.
@@ -36,45 +33,292 @@ class DrafterService:
         
         <|im_start|>user
         Yêu cầu soạn thảo:
-        - Loại văn bản: {contract_type}
-        - Bên A: {party_a}
-        - Bên B: {party_b}
-        - Chi tiết/Yêu cầu đặc biệt: {key_terms}
+        - Loại văn bản: {document_type}
+        - Tóm tắt yêu cầu: {summary}
+        - Thông tin bổ sung:
+        {metadata}
         <|im_end|>
         
         <|im_start|>assistant
         """)
-        
-        chain = prompt | self.llm | StrOutputParser()
+
+# Prompt viết một đoạn văn xuôi trong khung template
+SECTION_PROMPT = ChatPromptTemplate.from_template("""
+        <|im_start|>system
+        Bạn là Luật sư tại Việt Nam, đang điền một phần của văn bản "{document_type}" theo mẫu có sẵn.
+        Chỉ viết nội dung của phần được yêu cầu, văn phong trang trọng. Không viết lại Quốc hiệu,
+        tiêu đề, thông tin các bên hay phần ký tên. Không bịa thông tin không có trong dữ liệu bên dưới.
+        <|im_end|>
+
+        <|im_start|>user
+        Phần cần viết: {section}
+        Tóm tắt của người dùng: {summary}
+        Thông tin đã biết:
+        {metadata}
+        <|im_end|>
+
+        <|im_start|>assistant
+        """)
+
+RISK_TIMEOUT = 15
+
+
+def _prompt_inputs(data: ContractDraftRequest) -> dict:
+    metadata = "\n".join(f"  + {k}: {v}" for k, v in (data.metadata or {}).items()) or "  (không có)"
+    return {"document_type": data.document_type, "summary": data.summary, "metadata": metadata}
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class DrafterService:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(DrafterService, cls).__new__(cls)
+            # Dùng model tốt (GPT-4o/Gemini Pro) để viết văn bản hay
+            cls._instance.llm = get_llm(streaming=False, temperature=0.5)
+            cls._instance.stream_llm = get_llm(streaming=True, temperature=0.5)
+            cls._instance.risk_checker = RiskCheckerService()
+        return cls._instance
+
+    @traced("drafter.draft_contract")
+    @timed("draft_contract")
+    async def draft_contract(self, data: ContractDraftRequest) -> dict:
+        # Loại văn bản có template: dựng khung cố định, LLM chỉ viết các đoạn văn xuôi còn thiếu
+        template_type = find_template(data.document_type)
+        if template_type is not None:
+            content, questions, screening = await self._draft_from_template(template_type, data)
+            if questions:
+                return {"content_preview": content, "risk_report": "", "download_url": "",
+                        "needs_more_info": True, "questions": questions}
+            risk_result, download_url = await self._finalize(content, template_type, screening=screening)
+            return {
+                "content_preview": content,
+                "risk_report": self._risk_summary(risk_result),
+                "download_url": download_url
+            }
+
+        # 1. Soạn thảo văn bản
+        chain = DRAFT_PROMPT | self.llm | StrOutputParser()
         try:
-            raw_content = await asyncio.wait_for(chain.ainvoke({
-                "contract_type": data.contract_type,
-                "party_a": data.party_a,
-                "party_b": data.party_b,
-                "key_terms": str(data.key_terms)
-            }), timeout=20)
+            raw_content = await asyncio.wait_for(chain.ainvoke(_prompt_inputs(data)), timeout=20)
         except asyncio.TimeoutError:
             # Fallback quick draft when LLM is slow/unavailable (keeps tests stable)
             raw_content = (
-                f"HỢP ĐỒNG (TẠM THỜI) - {data.contract_type}\n\n"
-                f"Bên A: {data.party_a}\nBên B: {data.party_b}\n\n"
+                f"{data.document_type.upper()} (TẠM THỜI)\n\n"
+                f"Tóm tắt: {data.summary}\n\n"
                 "Nội dung: (LLM timeout) - Vui lòng chạy lại để lấy bản đầy đủ."
             )
 
-        # 2. Chạy Risk Checker song song hoặc tuần tự
-        # (Lưu ý: Risk checker cần input là RiskAnalysisRequest)
-        risk_data_input = RiskAnalysisRequest(contract_type=data.contract_type, content=raw_content)
+        # 2. Chạy Risk Checker + 3. Lưu file DOCX
+        risk_result, download_url = await self._finalize(raw_content, data.document_type)
+
+        return {
+            "content_preview": raw_content,
+            "risk_report": self._risk_summary(risk_result),
+            "download_url": download_url
+        }
+
+    async def _draft_from_template(self, template_type: str, data: ContractDraftRequest) -> Tuple[str, List[str], Optional[str]]:
+        """
+        Trả về (nội dung, câu hỏi, chế độ rà soát). Thiếu thông tin bắt buộc => trả bản nháp còn chỗ trống kèm câu hỏi,
+        không gọi LLM. Metadata đã có đủ các đoạn văn xuôi => không gọi LLM.
+        Chế độ rà soát: "fast" (chỉ rule) khi văn bản chỉ gồm khung template và trường ngắn; có đoạn văn xuôi
+        (LLM viết hoặc người dùng gửi) => None, rà soát như /draft thường.
+        """
+        spec = TEMPLATE_SPECS[template_type]
+        metadata = normalize_metadata(data.metadata)
+        metadata.setdefault("date", datetime.now().strftime("%d/%m/%Y"))
+        missing = missing_fields(template_type, metadata)
+        if missing:
+            questions = [f"Vui lòng cung cấp {spec.required[key]} (metadata.{key})" for key in missing]
+            return render_template(template_type, metadata), questions, "fast"
+
+        metadata.update(await self._write_sections(template_type, data.summary, metadata))
+        has_prose = any(key in metadata for key in spec.free_text)
+        return render_template(template_type, metadata), [], None if has_prose else "fast"
+
+    @traced("drafter.write_sections")
+    async def _write_sections(self, template_type: str, summary: str, metadata: dict) -> dict:
+        """Gọi LLM song song cho từng đoạn văn xuôi chưa có trong metadata."""
+        sections = {k: v for k, v in TEMPLATE_SPECS[template_type].free_text.items() if k not in metadata}
+        if not sections or not summary.strip():
+            return {}
+        known = "\n".join(f"  + {k}: {v}" for k, v in metadata.items())
+        chain = SECTION_PROMPT | self.llm | StrOutputParser()
+        results = await asyncio.gather(*(
+            asyncio.wait_for(chain.ainvoke({
+                "document_type": template_type, "section": description,
+                "summary": summary, "metadata": known,
+            }), timeout=20)
+            for description in sections.values()
+        ), return_exceptions=True)
+
+        written = {}
+        for index, (key, result) in enumerate(zip(sections, results)):
+            if isinstance(result, BaseException) or not result.strip():
+                print(f"Drafter: không viết được phần '{key}' ({result!r})")
+                # Đoạn chính dùng nguyên văn tóm tắt, các đoạn phụ giữ chữ mặc định của template
+                if index == 0:
+                    written[key] = summary.strip()
+                continue
+            written[key] = result.strip()
+        return written
+
+    @traced("drafter.finalize")
+    async def _finalize(self, content: str, doc_type: str, screening: Optional[str] = None) -> Tuple[dict, str]:
+        """
+        Rà soát rủi ro (Risk Checker cần input là RiskAnalysisRequest) rồi lưu DOCX trong thread riêng; trả về (risk_result, download_url).
+        `screening=None`: mặc định của RiskAnalysisRequest (full).
+        """
+        risk_data_input = self._risk_request(doc_type, content, screening)
         try:
-            risk_result = await asyncio.wait_for(self.risk_checker.analyze_document(risk_data_input), timeout=15)
+            risk_result = await asyncio.wait_for(self.risk_checker.analyze_document(risk_data_input), timeout=RISK_TIMEOUT)
         except asyncio.TimeoutError:
-            risk_result = {
-                "overall_score": 0,
-                "completeness_status": "Không thể kiểm tra (timeout)",
-                "missing_fields": [],
-                "risks": []
-            }
+            risk_result = self._risk_timeout_result()
+        download_url = await asyncio.to_thread(self._save_docx, content, doc_type)
+        return risk_result, download_url
+
+    async def draft_stream(self, data: ContractDraftRequest) -> AsyncIterator[str]:
+        """
+        Soạn thảo dạng SSE. Các event:
+        - token: {"text"} từng đoạn văn bản LLM sinh ra
+        - risk: {"index", "title", "score", "risks"} kết quả rà soát tạm một Điều ngay khi Điều đó sinh xong
+          (chạy song song trong lúc LLM còn viết các Điều sau; phần mở đầu trước "Điều 1" không rà soát riêng)
+        - done: {"download_url", "risk_report", "overall_score", "completeness_status", "missing_fields"}
+          theo lần rà soát lại toàn văn sau khi sinh xong
+        - needs_more_info: {"questions", "content_preview"} (loại văn bản có template nhưng thiếu thông tin)
+        - error: {"detail"}
+        """
+        template_type = find_template(data.document_type)
+        if template_type is not None:
+            # Văn bản theo template sinh gần như tức thì => gửi một lần
+            try:
+                content, questions, screening = await self._draft_from_template(template_type, data)
+                if questions:
+                    yield _sse("needs_more_info", {"questions": questions, "content_preview": content})
+                    return
+                yield _sse("token", {"text": content})
+                risk_result, download_url = await self._finalize(content, template_type, screening=screening)
+            except Exception as e:
+                print(f"Draft stream error: {e}")
+                yield _sse("error", {"detail": "Lỗi hệ thống khi soạn thảo."})
+                return
+            yield self._done_event(download_url, risk_result)
+            return
+
+        chain = DRAFT_PROMPT | self.stream_llm | StrOutputParser()
+        contract_type = data.document_type
+        findings: asyncio.Queue = asyncio.Queue()
+        tasks: List[asyncio.Task] = []
+        clauses: List[str] = []
+        # Một giới hạn chung cho mọi lần gọi LLM rà soát của stream này (từng Điều + bản tổng hợp cuối)
+        semaphore = asyncio.Semaphore(settings.RISK_MAX_PARALLEL)
+
+        async def check(index: int, clause: str):
+            try:
+                # Kết quả tạm (chưa có dàn ý toàn văn) => không ghi cache
+                result = await self.risk_checker.analyze_clauses(contract_type, [clause], semaphore=semaphore, store=False)
+            except Exception as e:
+                result = {"overall_score": None, "risks": [], "error": str(e)}
+            await findings.put({
+                "index": index,
+                "title": clause.splitlines()[0][:120],
+                "score": result.get("overall_score"),
+                "risks": result.get("risks", []),
+            })
+
+        def start_check(clause: str):
+            clause = clause.strip()
+            if clause:
+                clauses.append(clause)
+                tasks.append(asyncio.create_task(check(len(clauses) - 1, clause)))
+
+        # clause_start: vị trí "Điều" đang viết dở; None khi còn ở phần mở đầu (Quốc hiệu, tiêu đề, căn cứ) - không rà soát riêng
+        text, clause_start = "", None
+        try:
+            try:
+                async for chunk in chain.astream(_prompt_inputs(data)):
+                    if not chunk:
+                        continue
+                    text += chunk
+                    yield _sse("token", {"text": chunk})
+                    # Một Điều hoàn tất khi Điều kế tiếp bắt đầu
+                    search_from = 0 if clause_start is None else clause_start + 1
+                    for boundary in CLAUSE_BOUNDARY.finditer(text, search_from):
+                        if clause_start is not None:
+                            start_check(text[clause_start:boundary.start()])
+                        clause_start = boundary.start()
+                    while not findings.empty():
+                        yield _sse("risk", findings.get_nowait())
+            except Exception as e:
+                print(f"Draft stream error: {e}")
+                yield _sse("error", {"detail": "Lỗi hệ thống khi soạn thảo."})
+                return
+            if clause_start is not None:
+                start_check(text[clause_start:])
+
+            # Kết quả cuối rà soát lại toàn văn với dàn ý đầy đủ (cùng chế độ mặc định với /draft), không dựa vào kết quả tạm của từng Điều;
+            # trong lúc chờ vẫn đẩy các event risk còn lại
+            final = asyncio.create_task(self.risk_checker.analyze_document(
+                self._risk_request(contract_type, text), semaphore=semaphore))
+            tasks.append(final)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + RISK_TIMEOUT
+            while not final.done():
+                waiting = {task for task in tasks if not task.done()}
+                done, _ = await asyncio.wait(waiting, timeout=max(0.0, deadline - loop.time()),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                while not findings.empty():
+                    yield _sse("risk", findings.get_nowait())
+                if not done:
+                    break
+
+            if not final.done():
+                risk_result = self._risk_timeout_result()
+            elif final.exception() is not None:
+                print(f"Draft stream risk error: {final.exception()}")
+                risk_result = self.risk_checker._error_result(str(final.exception()))
+            else:
+                risk_result = final.result()
+
+            download_url = await asyncio.to_thread(self._save_docx, text, data.document_type)
+            yield self._done_event(download_url, risk_result)
+        finally:
+            # Client ngắt kết nối hoặc đã có kết quả cuối: huỷ các tác vụ rà soát còn lại
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    def _risk_request(doc_type: str, content: str, screening: Optional[str] = None) -> RiskAnalysisRequest:
+        if screening is None:
+            return RiskAnalysisRequest(contract_type=doc_type, content=content)
+        return RiskAnalysisRequest(contract_type=doc_type, content=content, screening=screening)
+
+    def _done_event(self, download_url: str, risk_result: dict) -> str:
+        return _sse("done", {
+            "download_url": download_url,
+            "risk_report": self._risk_summary(risk_result),
+            "overall_score": risk_result.get("overall_score"),
+            "completeness_status": risk_result.get("completeness_status"),
+            "missing_fields": risk_result.get("missing_fields", []),
+        })
 
-        # 3. Xử lý kết quả Risk (Hỗ trợ cả Dict và Pydantic Model)
+    @staticmethod
+    def _risk_timeout_result() -> dict:
+        return {
+            "overall_score": 0,
+            "completeness_status": "Không thể kiểm tra (timeout)",
+            "missing_fields": [],
+            "risks": []
+        }
+
+    @staticmethod
+    def _risk_summary(risk_result) -> str:
+        # Xử lý kết quả Risk (Hỗ trợ cả Dict và Pydantic Model)
         if isinstance(risk_result, dict):
             score = risk_result.get("overall_score", 0)
             risks = risk_result.get("risks", [])
@@ -99,75 +343,13 @@ class DrafterService:
             if len(high_risks) > 3: risk_summary += f"\n... và {len(high_risks)-3} vấn đề khác."
         else:
             risk_summary += "✅ Văn bản được soạn thảo tuân thủ quy định cơ bản."
+        return risk_summary
 
-        # 4. Lưu file DOCX (Chạy trong Thread riêng để không block server)
-        filename = await asyncio.to_thread(self._save_docx, raw_content, data.contract_type)
-
-        return {
-            "content_preview": raw_content,
-            "risk_report": risk_summary,
-            "download_url": f"/static/docs/{filename}"
-        }
-
+    @traced("drafter.save_docx")
     def _save_docx(self, content: str, doc_type: str) -> str:
-        """
-        Hàm xử lý format Word thông minh hơn
-        """
-        doc = Document()
-        
-        # Cấu hình Font mặc định
-        style = doc.styles['Normal']
-        style.font.name = 'Times New Roman'
-        style.font.size = Pt(12)
-
-        lines = content.split('\n')
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-
-            p = doc.add_paragraph()
-            run = p.add_run(line)
-            run.font.name = 'Times New Roman'
-
-            # --- Logic Format thông minh ---
-            
-            # 1. Quốc hiệu (Căn giữa, In đậm)
-            if "CỘNG HÒA XÃ HỘI" in line.upper():
-                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                run.bold = True
-                run.font.size = Pt(13)
-            
-            # 2. Tiêu ngữ (Căn giữa, In đậm)
-            elif "Độc lập" in line and "Tự do" in line:
-                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                run.bold = True
-                run.font.size = Pt(13)
-            
-            # 3. Tên Hợp đồng (Căn giữa, In đậm, To) - Logic: Ngắn + Viết hoa toàn bộ
-            elif len(line) < 100 and line.isupper() and "ĐIỀU" not in line:
-                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                run.bold = True
-                run.font.size = Pt(14)
-                p.paragraph_format.space_before = Pt(12)
-                p.paragraph_format.space_after = Pt(12)
-
-            # 4. Các Điều khoản (Điều 1, Điều 2...) -> In đậm
-            elif re.match(r"^(Điều|Khoản)\s+\d+[:\.]", line, re.IGNORECASE):
-                run.bold = True
-                p.paragraph_format.space_before = Pt(6)
-            
-            # 5. Các bên (Bên A, Bên B) -> In đậm
-            elif line.startswith("Bên A") or line.startswith("Bên B") or line.startswith("ĐẠI DIỆN"):
-                run.bold = True
-
-        # Lưu file
-        save_dir = "static/docs"
-        os.makedirs(save_dir, exist_ok=True)
-        timestamp = int(datetime.now().timestamp())
+        """Render DOCX trong RAM (docx_renderer) rồi lưu vào kho theo nội dung; trả về download_url."""
+        data = render_docx(content)
         # Clean tên file cho an toàn
         safe_type = re.sub(r'[\\/*?:"<>|]', "", doc_type).replace(" ", "_")
-        filename = f"ViLaw_{safe_type}_{timestamp}.docx"
-        
-        doc.save(os.path.join(save_dir, filename))
-        return filename
\ No newline at end of file
+        artifact = ArtifactStore().put(data, DOCX_CONTENT_TYPE, f"ViLaw_{safe_type}.docx")
+        return ArtifactStore.url_for(artifact.sha256)
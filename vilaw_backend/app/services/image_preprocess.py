@@ -0,0 +1,94 @@
+import io
+import os
+import time
+from dataclasses import dataclass
+from typing import Union
+from PIL import Image, ImageOps
+from app.core.config import settings
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+@dataclass
+class PreprocessedImage:
+    data: bytes
+    mime_type: str
+    size: tuple              # (width, height) sau xử lý
+    original_size: tuple     # (width, height) ảnh gốc
+    original_bytes: int
+    processed_bytes: int
+    elapsed_ms: float
+
+
+def open_image(source: Union[bytes, str]) -> Image.Image:
+    """`source` là bytes hoặc đường dẫn file (PIL đọc trực tiếp từ đĩa, không copy toàn bộ vào RAM)."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(source))
+    return Image.open(source)
+
+
+def _source_size(source: Union[bytes, str]) -> int:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    return os.path.getsize(source)
+
+
+def preprocess_image(
+    source: Union[bytes, str],
+    max_side: int = None,
+    grayscale: bool = None,
+    image_format: str = None,
+    quality: int = None,
+) -> PreprocessedImage:
+    """
+    Chuẩn hoá ảnh cho OCR: xoay theo EXIF, thu nhỏ về cạnh dài tối đa `max_side`,
+    chuyển grayscale + cân bằng tương phản, rồi encode lại (JPEG/WEBP).
+    Hàm chạy đồng bộ, gọi từ worker thread (không gọi trực tiếp trên event loop).
+    """
+    started = time.perf_counter()
+    max_side = max_side or settings.OCR_MAX_SIDE
+    grayscale = settings.OCR_GRAYSCALE if grayscale is None else grayscale
+    image_format = (image_format or settings.OCR_IMAGE_FORMAT).upper()
+    quality = quality or settings.OCR_IMAGE_QUALITY
+
+    original_bytes = _source_size(source)
+    image = open_image(source)
+    original_format = image.format
+    original_size = image.size
+    # JPEG: decode thẳng ở độ phân giải thấp hơn (nhanh hơn nhiều so với decode full rồi resize)
+    image.draft("L" if grayscale else "RGB", (max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+    if grayscale:
+        image = ImageOps.autocontrast(image.convert("L"), cutoff=1)
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    save_kwargs = {"quality": quality}
+    if image_format == "JPEG":
+        save_kwargs["optimize"] = True
+    image.save(buffer, format=image_format, **save_kwargs)
+    data = buffer.getvalue()
+    mime_type = _MIME_TYPES.get(image_format, "image/jpeg")
+
+    # Ảnh gốc đã nhỏ hơn (VD: PNG scan nhỏ) và không cần xoay/thu nhỏ -> giữ nguyên file gốc
+    if len(data) >= original_bytes and image.size == original_size and original_format in _MIME_TYPES:
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                source = f.read()
+        data = bytes(source)
+        mime_type = _MIME_TYPES[original_format]
+
+    return PreprocessedImage(
+        data=data,
+        mime_type=mime_type,
+        size=image.size,
+        original_size=original_size,
+        original_bytes=original_bytes,
+        processed_bytes=len(data),
+        elapsed_ms=(time.perf_counter() - started) * 1000,
+    )
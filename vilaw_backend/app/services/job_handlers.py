@@ -0,0 +1,25 @@
+"""Đăng ký handler cho các job type; worker (worker.py hoặc worker trong process API) import module này."""
+from app.services.job_queue import JobContext, job_handler
+
+
+@job_handler("rag_refresh")
+def rag_refresh(ctx: JobContext, payload: dict) -> dict:
+    """Build lại index BM25 và ghi snapshot; các process API tự nạp lại khi thấy snapshot mới."""
+    from app.services.rag_service import RAGService
+
+    ctx.progress(0.1, "Đang tách từ và build index")
+    return RAGService.build_snapshot()
+
+
+@job_handler("pdf_ingest")
+async def pdf_ingest(ctx: JobContext, payload: dict) -> dict:
+    from app.services.pdf_ingest import PdfIngestService
+
+    return await PdfIngestService().ingest(ctx, payload)
+
+
+@job_handler("batch_risk")
+async def batch_risk(ctx: JobContext, payload: dict) -> dict:
+    from app.services.batch_risk import BatchRiskService
+
+    return await BatchRiskService().run(ctx, payload)
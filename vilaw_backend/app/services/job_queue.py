@@ -0,0 +1,323 @@
+import asyncio
+import inspect
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+from sqlalchemy import and_, or_
+from app.core.config import settings
+from app.db.session import SessionLocal, run_db
+from app.db.models import Job
+
+# type -> handler(ctx, payload) -> dict (handler sync chạy trong thread, async chạy trên loop của worker)
+JOB_HANDLERS: Dict[str, Callable] = {}
+
+# Độ ưu tiên mặc định (nhỏ hơn = chạy trước)
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 100
+PRIORITY_LOW = 1000
+
+
+def job_handler(job_type: str):
+    def register(fn: Callable):
+        JOB_HANDLERS[job_type] = fn
+        return fn
+    return register
+
+
+class JobCancelled(Exception):
+    """Job bị huỷ hoặc worker mất lease trong lúc đang chạy."""
+
+
+class JobContext:
+    """Truyền cho handler: báo tiến độ và kiểm tra huỷ."""
+
+    def __init__(self, queue: "JobQueue", job_id: str, worker_id: str, attempt: int = 1, max_attempts: int = 1):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.attempt = attempt
+        self.max_attempts = max_attempts
+        self.cancel_event = threading.Event()
+
+    @property
+    def last_attempt(self) -> bool:
+        """Lỗi ở lần chạy này thì job không được thử lại (handler có thể dọn file tạm)."""
+        return self.attempt >= self.max_attempts
+
+    def progress(self, fraction: float, message: str = None):
+        """Gọi được từ thread (handler sync); handler async nên dùng `await run_db(ctx.progress, ...)`."""
+        self.check_cancelled()
+        if not self.queue.set_progress(self.job_id, self.worker_id, fraction, message):
+            self.cancel_event.set()
+            raise JobCancelled()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+
+class JobQueue:
+    """
+    Hàng đợi job bền vững trên bảng `jobs` (SQLite dùng chung với API).
+    Worker nhận job bằng lease có thời hạn (compare-and-set trên status/lease_expires_at), nên nhiều
+    process worker có thể chạy song song; job của worker chết được nhận lại khi lease hết hạn.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(JobQueue, cls).__new__(cls)
+        return cls._instance
+
+    # --- Phía API ---
+
+    def enqueue(
+        self,
+        job_type: str,
+        payload: dict = None,
+        priority: int = PRIORITY_NORMAL,
+        max_attempts: int = None,
+        unique: bool = False,
+        job_id: str = None,
+    ) -> Job:
+        """
+        `unique=True`: nếu đã có job cùng type đang chờ thì trả lại job đó (VD: rag_refresh).
+        `job_id`: id đặt trước khi dữ liệu của job đã được ghi ra đĩa theo id (VD: batch_risk).
+        """
+        db = SessionLocal()
+        try:
+            if unique:
+                existing = (
+                    db.query(Job)
+                    .filter(Job.type == job_type, Job.status == "queued")
+                    .order_by(Job.created_at)
+                    .first()
+                )
+                if existing is not None:
+                    return existing
+            now = datetime.utcnow()
+            job = Job(
+                id=job_id or uuid.uuid4().hex,
+                type=job_type,
+                status="queued",
+                priority=priority,
+                payload=payload or {},
+                max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+                run_after=now,
+                created_at=now,
+            )
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            return job
+        finally:
+            db.close()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        db = SessionLocal()
+        try:
+            return db.query(Job).filter(Job.id == job_id).first()
+        finally:
+            db.close()
+
+    def list(self, status: str = None, job_type: str = None, limit: int = 50) -> List[Job]:
+        db = SessionLocal()
+        try:
+            query = db.query(Job)
+            if status:
+                query = query.filter(Job.status == status)
+            if job_type:
+                query = query.filter(Job.type == job_type)
+            return query.order_by(Job.created_at.desc()).limit(limit).all()
+        finally:
+            db.close()
+
+    def cancel(self, job_id: str) -> bool:
+        """Huỷ job đang chờ/đang chạy; worker phát hiện ở lần báo tiến độ/heartbeat kế tiếp."""
+        return self._update(
+            and_(Job.id == job_id, Job.status.in_(("queued", "running"))),
+            status="cancelled", finished_at=datetime.utcnow(), lease_owner=None,
+        )
+
+    # --- Phía worker ---
+
+    def claim(self, worker_id: str, types: Iterable[str] = None) -> Optional[Job]:
+        now = datetime.utcnow()
+        claimable = or_(
+            and_(Job.status == "queued", Job.run_after <= now),
+            and_(Job.status == "running", Job.lease_expires_at < now),  # Worker cũ chết giữa chừng
+        )
+        db = SessionLocal()
+        try:
+            for _ in range(10):
+                query = db.query(Job.id, Job.status, Job.attempts, Job.max_attempts).filter(claimable)
+                if types:
+                    query = query.filter(Job.type.in_(list(types)))
+                candidate = query.order_by(Job.priority, Job.created_at).first()
+                if candidate is None:
+                    return None
+                if candidate.status == "running" and candidate.attempts >= candidate.max_attempts:
+                    # Lease hết hạn ở lần chạy cuối cùng => không thử lại nữa
+                    db.query(Job).filter(Job.id == candidate.id, Job.attempts == candidate.attempts, claimable).update({
+                        "status": "failed", "error": "Worker dừng giữa chừng (lease hết hạn)",
+                        "finished_at": now, "lease_owner": None,
+                    }, synchronize_session=False)
+                    db.commit()
+                    continue
+                # Compare-and-set: chỉ một worker cập nhật được dòng này
+                updated = (
+                    db.query(Job)
+                    .filter(Job.id == candidate.id, Job.attempts == candidate.attempts, claimable)
+                    .update({
+                        "status": "running",
+                        "lease_owner": worker_id,
+                        "lease_expires_at": now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                        "attempts": candidate.attempts + 1,
+                        "started_at": now,
+                    }, synchronize_session=False)
+                )
+                db.commit()
+                if updated:
+                    return db.query(Job).filter(Job.id == candidate.id).first()
+            return None
+        finally:
+            db.close()
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Gia hạn lease; False nếu job đã bị huỷ hoặc worker khác nhận lại."""
+        return self._update(
+            self._owned(job_id, worker_id),
+            lease_expires_at=datetime.utcnow() + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+        )
+
+    def set_progress(self, job_id: str, worker_id: str, fraction: float, message: str = None) -> bool:
+        values = {
+            "progress": max(0.0, min(1.0, fraction)),
+            "lease_expires_at": datetime.utcnow() + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+        }
+        if message is not None:
+            values["progress_message"] = message
+        return self._update(self._owned(job_id, worker_id), **values)
+
+    def complete(self, job_id: str, worker_id: str, result: dict = None) -> bool:
+        return self._update(
+            self._owned(job_id, worker_id),
+            status="succeeded", result=result, error=None, progress=1.0,
+            finished_at=datetime.utcnow(), lease_owner=None, lease_expires_at=None,
+        )
+
+    def fail(self, job_id: str, worker_id: str, error: str, attempts: int, max_attempts: int) -> bool:
+        """Còn lượt thì đưa lại vào hàng đợi với backoff luỹ thừa, hết lượt thì đánh dấu failed."""
+        now = datetime.utcnow()
+        if attempts < max_attempts:
+            delay = settings.JOB_RETRY_BACKOFF * (2 ** (attempts - 1))
+            values = {"status": "queued", "run_after": now + timedelta(seconds=delay)}
+        else:
+            values = {"status": "failed", "finished_at": now}
+        return self._update(
+            self._owned(job_id, worker_id),
+            error=error, lease_owner=None, lease_expires_at=None, **values,
+        )
+
+    @staticmethod
+    def _owned(job_id: str, worker_id: str):
+        return and_(Job.id == job_id, Job.status == "running", Job.lease_owner == worker_id)
+
+    @staticmethod
+    def _update(condition, **values) -> bool:
+        db = SessionLocal()
+        try:
+            updated = db.query(Job).filter(condition).update(values, synchronize_session=False)
+            db.commit()
+            return bool(updated)
+        finally:
+            db.close()
+
+
+def job_to_dict(job: Job) -> dict:
+    return {
+        "job_id": job.id,
+        "type": job.type,
+        "status": job.status,
+        "priority": job.priority,
+        "progress": job.progress or 0.0,
+        "progress_message": job.progress_message,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "status_url": f"/api/v1/jobs/{job.id}",
+    }
+
+
+class JobWorker:
+    """Vòng lặp nhận và chạy job; dùng trong worker.py hoặc chạy kèm process API (JOB_INPROCESS_WORKER)."""
+
+    def __init__(self, concurrency: int = None, types: Iterable[str] = None, worker_id: str = None):
+        self.concurrency = concurrency or settings.JOB_WORKER_CONCURRENCY
+        self.types = list(types) if types else None
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.queue = JobQueue()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        load_handlers()
+        types = self.types or list(JOB_HANDLERS)
+        print(f"JobWorker {self.worker_id}: concurrency={self.concurrency}, types={types}")
+        await asyncio.gather(*(self._loop(types) for _ in range(self.concurrency)))
+
+    async def _loop(self, types: List[str]):
+        while not self._stopping.is_set():
+            try:
+                job = await run_db(self.queue.claim, self.worker_id, types)
+            except Exception as e:
+                print(f"JobWorker: lỗi nhận job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job)
+
+    async def _execute(self, job: Job):
+        ctx = JobContext(self.queue, job.id, self.worker_id, job.attempts, job.max_attempts)
+        heartbeat = asyncio.create_task(self._heartbeat(ctx))
+        try:
+            handler = JOB_HANDLERS.get(job.type)
+            if handler is None:
+                raise ValueError(f"Không có handler cho job type '{job.type}'")
+            if inspect.iscoroutinefunction(handler):
+                result = await handler(ctx, job.payload or {})
+            else:
+                result = await asyncio.to_thread(handler, ctx, job.payload or {})
+            await run_db(self.queue.complete, job.id, self.worker_id, result)
+        except JobCancelled:
+            print(f"JobWorker: job {job.id} ({job.type}) đã bị huỷ")
+        except Exception as e:
+            print(f"JobWorker: job {job.id} ({job.type}) lỗi lần {job.attempts}/{job.max_attempts}: {e}")
+            await run_db(self.queue.fail, job.id, self.worker_id, str(e), job.attempts, job.max_attempts)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, ctx: JobContext):
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            if not await run_db(self.queue.heartbeat, ctx.job_id, ctx.worker_id):
+                ctx.cancel_event.set()
+                return
+
+
+def load_handlers():
+    """Import các module đăng ký handler (tách riêng để API không phải import khi chỉ enqueue)."""
+    from app.services import job_handlers  # noqa: F401
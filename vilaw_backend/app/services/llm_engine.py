@@ -1,21 +1,94 @@
-from langchain_openai import ChatOpenAI
+import time
+from langchain_core.callbacks import BaseCallbackHandler
 from app.core.config import settings
+from app.core.metrics import REGISTRY
+from app.core.tracing import start_span
 
-def get_llm(streaming: bool = False, temperature: float = 0.3):
+LLM_LATENCY = REGISTRY.histogram("vilaw_llm_request_duration_seconds", "Thời gian một lần gọi LLM (tới token cuối)", ("model", "outcome"))
+LLM_TOKENS = REGISTRY.counter("vilaw_llm_tokens_total", "Số token LLM theo loại (prompt/completion)", ("model", "kind"))
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    Ghi thời gian và số token của mọi lần gọi LLM (chat, soạn thảo, risk, thủ tục, tóm tắt hội thoại),
+    kèm span "llm.call" trong trace của request.
+    """
+    # Chạy ngay trong event loop thay vì đẩy sang executor: chỉ cập nhật vài bộ đếm
+    run_inline = True
+    # Lần gọi bị huỷ giữa chừng (client ngắt stream) có thể không có on_llm_end/on_llm_error
+    _MAX_PENDING = 1024
+
+    def __init__(self, model: str):
+        self.model = model
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def _start(self, run_id):
+        if len(self._started) >= self._MAX_PENDING:
+            self._started.pop(next(iter(self._started)), None)
+        self._started[run_id] = (time.perf_counter(), start_span("llm.call", model=self.model))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._observe(run_id, "ok")
+        usage = self._usage(response)
+        if usage:
+            LLM_TOKENS.labels(self.model, "prompt").inc(usage.get("input_tokens", 0))
+            LLM_TOKENS.labels(self.model, "completion").inc(usage.get("output_tokens", 0))
+            if span is not None:
+                span.set(input_tokens=usage.get("input_tokens", 0), output_tokens=usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._observe(run_id, "error", error)
+
+    def _observe(self, run_id, outcome: str, error: BaseException = None):
+        started, span = self._started.pop(run_id, (None, None))
+        if started is not None:
+            LLM_LATENCY.labels(self.model, outcome).observe(time.perf_counter() - started)
+        if span is not None:
+            span.end(error)
+        return span
+
+    @staticmethod
+    def _usage(response) -> dict:
+        # usage_metadata của message (có cả khi stream nhờ stream_usage=True), fallback token_usage của provider
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    return usage
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        return {"input_tokens": token_usage.get("prompt_tokens", 0),
+                "output_tokens": token_usage.get("completion_tokens", 0)} if token_usage else {}
+
+
+_metrics_handler = LLMMetricsHandler(settings.OPENROUTER_MODEL)
+
+
+def get_llm(streaming: bool = False, temperature: float = 0.3, max_tokens: int = 1024):
     """
     Khởi tạo LLM kết nối tới OpenRouter.
-    Có thể tái sử dụng cho nhiều service khác nhau.
+    Có thể tái sử dụng cho nhiều service khác nhau (`max_tokens`: giới hạn token output mỗi lần gọi).
+    langchain_openai (kéo theo SDK openai, ~1s) chỉ được import ở lần gọi đầu tiên, không lúc khởi động.
     """
+    from langchain_openai import ChatOpenAI
+
     llm = ChatOpenAI(
         model=settings.OPENROUTER_MODEL,
         openai_api_key=settings.OPENROUTER_API_KEY,
         openai_api_base=settings.OPENROUTER_BASE_URL,
         streaming=streaming,
+        stream_usage=True,
         temperature=temperature,
         default_headers={
             "HTTP-Referer": "https://vilaw.vn",
             "X-Title": "ViLaw Backend"
         },
-        max_tokens=1024
+        max_tokens=max_tokens,
+        callbacks=[_metrics_handler],
     )
-    return llm
\ No newline at end of file
+    return llm
@@ -0,0 +1,184 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from app.core.config import settings
+from app.core.exceptions import OCRQueueFull, OCRTimeout
+from app.core.metrics import REGISTRY
+
+OCR_QUEUE_WAIT = REGISTRY.histogram("vilaw_ocr_queue_wait_seconds", "Thời gian job OCR chờ trong hàng đợi")
+OCR_SERVICE = REGISTRY.histogram("vilaw_ocr_service_seconds", "Thời gian chạy job OCR trong worker", ("outcome",))
+OCR_JOBS = REGISTRY.counter("vilaw_ocr_jobs_total", "Số job OCR theo kết quả", ("outcome",))
+
+
+class OCRCancelled(Exception):
+    """Job bị huỷ (client ngắt kết nối hoặc quá deadline) trước khi chạy xong."""
+
+
+class _Job:
+    __slots__ = ("fn", "args", "deadline", "future", "cancel_event", "enqueued_at", "context")
+
+    def __init__(self, fn: Callable, args: tuple, deadline: float, future: asyncio.Future):
+        self.fn = fn
+        self.args = args
+        self.deadline = deadline
+        self.future = future
+        self.cancel_event = threading.Event()
+        self.enqueued_at = time.monotonic()
+        self.context = contextvars.copy_context()
+
+
+class OCRWorkerPool:
+    """
+    Pool thread riêng cho OCR: hàng đợi có giới hạn, deadline cho từng job và huỷ job.
+    Hàm chạy trong pool nhận `cancel_event` làm tham số đầu tiên để tự dừng giữa các bước
+    (decode ảnh -> gọi Gemini -> ghi DB).
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(OCRWorkerPool, cls).__new__(cls)
+            cls._instance._setup(settings.OCR_WORKERS, settings.OCR_MAX_QUEUE)
+        return cls._instance
+
+    def _setup(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-worker")
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumers = []
+        self._loop = None
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.total_service = 0.0
+        self.last_wait = 0.0
+        self.last_service = 0.0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # Khởi tạo (hoặc khởi tạo lại khi event loop thay đổi, VD: test/reload)
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._consumers = [loop.create_task(self._consume()) for _ in range(self.workers)]
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """Đưa `fn(cancel_event, *args)` vào hàng đợi và chờ kết quả (tối đa `timeout` giây)."""
+        self._ensure_started()
+        timeout = settings.OCR_JOB_TIMEOUT if timeout is None else timeout
+        if self._queue.full():
+            self.rejected += 1
+            OCR_JOBS.labels("rejected").inc()
+            raise OCRQueueFull(retry_after=self._retry_after())
+
+        job = _Job(fn, args, time.monotonic() + timeout, self._loop.create_future())
+        self._queue.put_nowait(job)
+        self.submitted += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout)
+        except asyncio.TimeoutError:
+            # Huỷ future bên trong shield: worker thấy done() nên không set_exception(OCRCancelled) vào một
+            # future không ai đọc (asyncio sẽ log "Future exception was never retrieved")
+            job.future.cancel()
+            job.cancel_event.set()
+            self.timed_out += 1
+            OCR_JOBS.labels("timeout").inc()
+            raise OCRTimeout(f"OCR vượt quá {timeout:g}s")
+        except asyncio.CancelledError:
+            job.future.cancel()
+            job.cancel_event.set()
+            self.cancelled += 1
+            OCR_JOBS.labels("cancelled").inc()
+            raise
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.cancel_event.is_set() or job.future.done():
+                    continue
+                started = time.monotonic()
+                if started > job.deadline:
+                    job.cancel_event.set()
+                    continue
+                self.last_wait = started - job.enqueued_at
+                self.total_wait += self.last_wait
+                OCR_QUEUE_WAIT.observe(self.last_wait)
+                outcome = "ok"
+                self.in_flight += 1
+                try:
+                    result = await loop.run_in_executor(
+                        self._executor, job.context.run, job.fn, job.cancel_event, *job.args
+                    )
+                except Exception as e:
+                    self.failed += 1
+                    outcome = "error"
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                else:
+                    self.completed += 1
+                    if not job.future.done():
+                        job.future.set_result(result)
+                finally:
+                    self.in_flight -= 1
+                    self.last_service = time.monotonic() - started
+                    self.total_service += self.last_service
+                    OCR_SERVICE.labels(outcome).observe(self.last_service)
+                    OCR_JOBS.labels(outcome).inc()
+            finally:
+                self._queue.task_done()
+
+    def _retry_after(self) -> int:
+        finished = max(self.completed + self.failed, 1)
+        avg_service = self.total_service / finished if self.total_service else 5.0
+        return max(1, min(120, int(avg_service * (self.max_queue / max(self.workers, 1)))))
+
+    def stats(self) -> dict:
+        finished = max(self.completed + self.failed, 1)
+        started = max(self.completed + self.failed + self.in_flight, 1)
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "cancelled": self.cancelled,
+            "avg_wait_ms": round(self.total_wait / started * 1000, 1),
+            "avg_service_ms": round(self.total_service / finished * 1000, 1),
+            "last_wait_ms": round(self.last_wait * 1000, 1),
+            "last_service_ms": round(self.last_service * 1000, 1),
+        }
+
+
+def check_cancelled(cancel_event: threading.Event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise OCRCancelled()
+
+
+def _pool_metrics():
+    pool = OCRWorkerPool._instance
+    if pool is None:
+        return []
+    return [
+        ("vilaw_ocr_queue_depth", "gauge", "Số job OCR đang chờ trong hàng đợi",
+         [({}, pool._queue.qsize() if pool._queue else 0)]),
+        ("vilaw_ocr_in_flight", "gauge", "Số job OCR đang chạy", [({}, pool.in_flight)]),
+    ]
+
+
+REGISTRY.add_collector(_pool_metrics)
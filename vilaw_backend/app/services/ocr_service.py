@@ -1,28 +1,69 @@
+import asyncio
 import hashlib
 import json
 import os
-import io
+import threading
+from collections import OrderedDict
 from datetime import datetime, timezone
-from PIL import Image
+from typing import Dict, Optional, Union
 from fastapi import UploadFile
-import google.generativeai as genai
-from app.db.session import SessionLocal
+from app.db.session import SessionLocal, run_db
 from app.db.models import OCRDocument
+from app.core.config import settings
+from app.core.exceptions import OCRQueueFull, OCRTimeout
+from app.core.metrics import cache_hit, timed
+from app.core.tracing import span, traced
+from app.services.ocr_pool import OCRWorkerPool, OCRCancelled, check_cancelled
+from app.services.image_preprocess import PreprocessedImage, open_image, preprocess_image
+from app.services.upload_pipeline import StoredUpload, receive_upload, sha256_file
+from app.services.doc_classifier import DocumentClassifier
 
-# Cấu hình Gemini một lần duy nhất ở module level
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 if not GOOGLE_API_KEY:
     print("WARNING: GOOGLE_API_KEY not found in environment variables")
-else:
-    genai.configure(api_key=GOOGLE_API_KEY)
+
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def _get_genai():
+    """Import + cấu hình SDK Gemini (~0.7s) một lần, ở lần OCR đầu tiên thay vì lúc import module."""
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+                if GOOGLE_API_KEY:
+                    genai.configure(api_key=GOOGLE_API_KEY)
+                _genai = genai
+    return _genai
+
 
 class OCRService:
+    # LRU kết quả OCR theo sha256 của file (dùng chung giữa các instance)
+    _result_cache: "OrderedDict[str, dict]" = OrderedDict()
+    # Các file đang được OCR, để upload trùng cùng lúc chỉ gọi Gemini một lần
+    _inflight: Dict[str, asyncio.Future] = {}
+    # Thống kê tiền xử lý ảnh (tổng byte trước/sau, thời gian xử lý)
+    preprocess_stats = {"images": 0, "original_bytes": 0, "processed_bytes": 0, "total_ms": 0.0}
+
     def __init__(self):
-        # Sử dụng model Flash cho tốc độ và chi phí tối ưu
-        self.model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash", # Hoặc gemini-1.5-pro tuỳ nhu cầu
-            generation_config={"response_mime_type": "application/json"} # BẮT BUỘC TRẢ VỀ JSON
-        )
+        self._model = None
+
+    @property
+    def model(self):
+        # Tạo model khi OCR lần đầu (chạy trong worker thread của OCRWorkerPool)
+        if self._model is None:
+            # Sử dụng model Flash cho tốc độ và chi phí tối ưu
+            self._model = _get_genai().GenerativeModel(
+                model_name="gemini-1.5-flash", # Hoặc gemini-1.5-pro tuỳ nhu cầu
+                generation_config={"response_mime_type": "application/json"} # BẮT BUỘC TRẢ VỀ JSON
+            )
+        return self._model
+
+    @model.setter
+    def model(self, value):
+        self._model = value
 
     def _clean_entities(self, data: dict) -> list:
         """Hàm phụ trợ để chuẩn hóa entities"""
@@ -45,14 +86,159 @@ class OCRService:
                 ent['name'] = ent['ten']
         return entities
 
-    async def process_bytes(self, content: bytes, filename: str, file_type: str = None) -> dict:
+    @traced("ocr.process_bytes")
+    @timed("ocr_process_bytes")
+    async def process_bytes(self, content: bytes, filename: str, file_type: str = None, store: bool = True) -> dict:
         """
-        Hàm xử lý cốt lõi: Nhận bytes -> Trả về kết quả phân tích
+        Hàm xử lý cốt lõi: Nhận bytes -> Trả về kết quả phân tích.
+        File đã từng OCR (cùng sha256) được trả lại từ LRU cache hoặc bảng OCRDocument, không gọi Gemini.
+        Phần nặng (decode ảnh, gọi Gemini, ghi DB) chạy trong OCRWorkerPool, event loop chỉ chờ kết quả.
+        store=False: không ghi kết quả vào OCRDocument (VD: trang PDF, đã lưu ở OCRPage).
+        Raise OCRQueueFull khi hàng đợi đầy.
         """
-        file_hash = hashlib.sha256(content).hexdigest()
+        file_hash = await asyncio.to_thread(_sha256, content)
+        return await self._process_source(content, filename, file_type, file_hash, store)
+
+    @traced("ocr.process_path")
+    async def process_path(self, path: str, filename: str, file_type: str = None, file_hash: str = None) -> dict:
+        """Như process_bytes nhưng đọc thẳng từ file trên đĩa, không nạp cả file vào RAM."""
+        file_hash = file_hash or await asyncio.to_thread(sha256_file, path)
+        return await self._process_source(path, filename, file_type, file_hash)
+
+    async def process_stored(self, stored: StoredUpload) -> dict:
+        """File từ upload pipeline: sha256 đã được tính lúc nhận upload."""
+        return await self.process_path(stored.path, stored.filename, stored.content_type, stored.sha256)
+
+    async def _process_source(self, source: Union[bytes, str], filename: str, file_type: Optional[str], file_hash: str, store: bool = True) -> dict:
+        cached = self._cache_get(file_hash)
+        if cached is not None:
+            return dict(cached, filename=filename)
+
+        inflight = self._inflight.get(file_hash)
+        if inflight is not None:
+            result = await asyncio.shield(inflight)
+            if result is not None:
+                return dict(result, filename=filename)
+            # Request đang xử lý trước đó bị lỗi/huỷ -> tự xử lý lại
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[file_hash] = future
+        result = None
+        try:
+            result = await run_db(self._lookup_stored, file_hash, filename)
+            if result is None:
+                try:
+                    result = await OCRWorkerPool().run(self._process_sync, source, filename, file_type, file_hash, store)
+                except OCRTimeout as e:
+                    result = self._error_result(filename, str(e))
+            if "error" not in result:
+                self._cache_put(file_hash, result)
+            return result
+        finally:
+            future.set_result(result if result is not None and "error" not in result else None)
+            if self._inflight.get(file_hash) is future:
+                del self._inflight[file_hash]
+
+    # --- Cache / tra cứu theo file_hash ---
+
+    @classmethod
+    def _cache_get(cls, file_hash: str) -> Optional[dict]:
+        value = cls._result_cache.get(file_hash)
+        if value is not None:
+            cls._result_cache.move_to_end(file_hash)
+        cache_hit("ocr_result", value is not None)
+        return value
+
+    @classmethod
+    def _cache_put(cls, file_hash: str, result: dict):
+        cls._result_cache[file_hash] = result
+        cls._result_cache.move_to_end(file_hash)
+        while len(cls._result_cache) > settings.OCR_CACHE_SIZE:
+            cls._result_cache.popitem(last=False)
+
+    @traced("ocr.lookup_stored")
+    def _lookup_stored(self, file_hash: str, filename: str) -> Optional[dict]:
+        """Tìm kết quả OCR đã lưu theo file_hash (cột có index)."""
+        db = SessionLocal()
+        try:
+            doc = (
+                db.query(OCRDocument.id, OCRDocument.ocr_text)
+                .filter(OCRDocument.file_hash == file_hash)
+                .order_by(OCRDocument.id.desc())
+                .first()
+            )
+        except Exception as db_err:
+            print(f"Database Error: {db_err}")
+            return None
+        finally:
+            db.close()
+        if not doc or not doc.ocr_text:
+            return None
+        try:
+            parsed_result = json.loads(doc.ocr_text)
+        except json.JSONDecodeError:
+            return None
+        return self._build_result(parsed_result, filename, file_hash, doc.id)
+
+    def _build_result(self, parsed_result: dict, filename: str, file_hash: str, metadata_id: Optional[int]) -> dict:
+        # --- Chuẩn hóa dữ liệu ---
+        final_result = {
+            "filename": filename,
+            "file_hash": file_hash,
+            "blockchain_status": "Verified & Stored on Chain",
+            "document_type": parsed_result.get("document_type", "Không xác định"),
+            "entities": self._clean_entities(parsed_result),
+            "clauses": parsed_result.get("clauses", []),
+            "handwritten_notes": parsed_result.get("handwritten_notes", ""),
+            "metadata_id": metadata_id
+        }
+
+        # Xử lý handwritten_notes nếu nó là list
+        if isinstance(final_result["handwritten_notes"], list):
+            final_result["handwritten_notes"] = "\n".join(
+                [str(n) if isinstance(n, str) else n.get('text', '') for n in final_result["handwritten_notes"]]
+            )
+        return final_result
+
+    @classmethod
+    def _record_preprocess(cls, prepared: PreprocessedImage):
+        stats = cls.preprocess_stats
+        stats["images"] += 1
+        stats["original_bytes"] += prepared.original_bytes
+        stats["processed_bytes"] += prepared.processed_bytes
+        stats["total_ms"] += prepared.elapsed_ms
+        print(
+            f"OCR preprocess: {prepared.original_size} {prepared.original_bytes / 1024:.0f}KB -> "
+            f"{prepared.size} {prepared.processed_bytes / 1024:.0f}KB ({prepared.elapsed_ms:.0f}ms)"
+        )
+
+    @staticmethod
+    def _error_result(filename: str, error: str) -> dict:
+        return {
+            "filename": filename,
+            "error": error,
+            "document_type": "Lỗi hệ thống",
+            "entities": [],
+            "clauses": [],
+            "handwritten_notes": ""
+        }
+
+    @traced("ocr.worker")
+    def _process_sync(self, cancel_event, source: Union[bytes, str], filename: str, file_type: str = None, file_hash: str = None, store: bool = True) -> dict:
+        """Chạy trong worker thread của OCRWorkerPool. `source`: bytes hoặc đường dẫn file ảnh."""
         
         try:
-            image = Image.open(io.BytesIO(content))
+            if file_hash is None:
+                file_hash = _sha256(source) if isinstance(source, (bytes, bytearray)) else sha256_file(source)
+            if settings.OCR_PREPROCESS:
+                with span("ocr.preprocess"):
+                    prepared = preprocess_image(source)
+                self._record_preprocess(prepared)
+                image = {"mime_type": prepared.mime_type, "data": prepared.data}
+            else:
+                image = open_image(source)
+                image.load()
+            check_cancelled(cancel_event)
             
             prompt = (
                 "Bạn là chuyên gia OCR & Legal AI. Hãy trích xuất thông tin từ ảnh này.\n"
@@ -66,7 +252,9 @@ class OCRService:
             )
 
             # Gọi Gemini
-            response = self.model.generate_content([prompt, image])
+            with span("ocr.gemini"):
+                response = self.model.generate_content([prompt, image])
+            check_cancelled(cancel_event)
             
             # Vì đã set response_mime_type="application/json", không cần strip string nữa
             try:
@@ -76,59 +264,43 @@ class OCRService:
                 text = response.text.replace('```json', '').replace('```', '')
                 parsed_result = json.loads(text)
 
-            # --- Chuẩn hóa dữ liệu ---
-            final_result = {
-                "filename": filename,
-                "file_hash": file_hash,
-                "blockchain_status": "Verified & Stored on Chain",
-                "document_type": parsed_result.get("document_type", "Không xác định"),
-                "entities": self._clean_entities(parsed_result),
-                "clauses": parsed_result.get("clauses", []),
-                "handwritten_notes": parsed_result.get("handwritten_notes", ""),
-                "metadata_id": None
-            }
-
-            # Xử lý handwritten_notes nếu nó là list
-            if isinstance(final_result["handwritten_notes"], list):
-                final_result["handwritten_notes"] = "\n".join(
-                    [str(n) if isinstance(n, str) else n.get('text', '') for n in final_result["handwritten_notes"]]
-                )
+            final_result = self._build_result(parsed_result, filename, file_hash, None)
 
             # --- Lưu vào Database ---
-            db = SessionLocal()
-            try:
-                # Use OCRDocument model (DocumentMetadata was legacy/undefined)
-                doc_meta = OCRDocument(
-                    filename=filename,
-                    ocr_text=json.dumps(parsed_result, ensure_ascii=False), # Lưu JSON đã parse thay vì raw text
-                    created_at=datetime.now(timezone.utc), # Dùng timezone aware
-                )
-                db.add(doc_meta)
-                db.commit()
-                db.refresh(doc_meta)
-                final_result['metadata_id'] = doc_meta.id
-            except Exception as db_err:
-                print(f"Database Error: {db_err}")
-                # Không return lỗi để user vẫn nhận được kết quả OCR dù lưu DB thất bại
-            finally:
-                db.close()
+            if store:
+                db = SessionLocal()
+                try:
+                    # Use OCRDocument model (DocumentMetadata was legacy/undefined)
+                    doc_meta = OCRDocument(
+                        filename=filename,
+                        ocr_text=json.dumps(parsed_result, ensure_ascii=False), # Lưu JSON đã parse thay vì raw text
+                        file_hash=file_hash,
+                        created_at=datetime.now(timezone.utc), # Dùng timezone aware
+                    )
+                    db.add(doc_meta)
+                    db.commit()
+                    db.refresh(doc_meta)
+                    final_result['metadata_id'] = doc_meta.id
+                except Exception as db_err:
+                    print(f"Database Error: {db_err}")
+                    # Không return lỗi để user vẫn nhận được kết quả OCR dù lưu DB thất bại
+                finally:
+                    db.close()
 
             return final_result
 
+        except OCRCancelled:
+            raise
         except Exception as e:
-            return {
-                "filename": filename,
-                "error": str(e),
-                "document_type": "Lỗi hệ thống",
-                "entities": [],
-                "clauses": [],
-                "handwritten_notes": ""
-            }
+            return self._error_result(filename, str(e))
 
     async def process_upload_file(self, file: UploadFile) -> dict:
-        """Wrapper dành cho FastAPI UploadFile"""
-        content = await file.read()
-        return await self.process_bytes(content, file.filename, file.content_type)
+        """Wrapper dành cho FastAPI UploadFile: ghi ra file tạm theo chunk rồi OCR từ đĩa. Raise UploadRejected."""
+        stored = await receive_upload(file)
+        try:
+            return await self.process_stored(stored)
+        finally:
+            await asyncio.to_thread(stored.remove)
 
     # Backwards-compatible alias expected by some callers
     async def process_document(self, file: UploadFile) -> dict:
@@ -139,9 +311,14 @@ class OCRService:
 # Khởi tạo service 1 lần (Singleton pattern đơn giản)
 ocr_service_instance = OCRService()
 
-async def ocr_image(file_path: str) -> dict:
+
+def _sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+async def ocr_image(file_path: str, file_hash: str = None) -> dict:
     """
-    Nhận diện loại giấy tờ từ đường dẫn file cục bộ.
+    Nhận diện loại giấy tờ từ đường dẫn file cục bộ (`file_hash`: sha256 nếu đã tính lúc upload).
     """
     if not os.path.exists(file_path):
         return {"type": "File không tồn tại"}
@@ -153,12 +330,21 @@ async def ocr_image(file_path: str) -> dict:
     if any(x in basename for x in ["bang_lai", "blx", "gplx"]):
         return {"type": "Bằng lái xe"}
 
-    # 2. Nếu không đoán được tên, gọi AI OCR
+    # 2. Phân loại cục bộ (vài ms) theo template / cache perceptual hash
+    decision = None
+    if settings.DOC_CLASSIFIER_ENABLED:
+        decision = await DocumentClassifier().classify_async(file_path)
+        if decision is not None and decision.type:
+            return {"type": decision.type, "source": decision.source, "confidence": round(decision.confidence, 3)}
+
+    # 3. Không đủ tự tin -> gọi AI OCR
     try:
-        with open(file_path, "rb") as f:
-            content = f.read()
-        
-        result = await ocr_service_instance.process_bytes(content, basename)
-        return {"type": result.get("document_type", "Không xác định")}
+        result = await ocr_service_instance.process_path(file_path, basename, file_hash=file_hash)
+    except OCRQueueFull:
+        raise
     except Exception:
-        return {"type": "Lỗi nhận diện"}
\ No newline at end of file
+        return {"type": "Lỗi nhận diện"}
+    doc_type = result.get("document_type", "Không xác định")
+    if decision is not None and "error" not in result and doc_type != "Không xác định":
+        DocumentClassifier().remember(decision, doc_type)
+    return {"type": doc_type, "source": "llm"}
\ No newline at end of file
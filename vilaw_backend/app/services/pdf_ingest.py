@@ -0,0 +1,215 @@
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from app.core.config import settings
+from app.core.exceptions import OCRQueueFull
+from app.db.session import SessionLocal, run_db
+from app.db.models import Job, OCRDocument, OCRPage
+from app.services.job_queue import JobCancelled, JobContext, JobQueue
+from app.services.upload_pipeline import StoredUpload
+from app.services.ocr_service import ocr_service_instance
+
+# (số trang, text, ảnh PNG của trang nếu cần OCR, lỗi)
+PageResult = Tuple[int, str, Optional[bytes], Optional[str]]
+
+
+# --- Chạy trong process con (phải là hàm module-level để pickle được) ---
+
+def _count_pages(path: str) -> int:
+    import pdfplumber
+
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def _extract_pages(path: str, page_numbers: List[int], render_images: bool, min_chars: int, resolution: int) -> List[PageResult]:
+    """Trích xuất text một nhóm trang; trang gần như không có text nhưng có ảnh được render PNG để OCR."""
+    import pdfplumber
+
+    results = []
+    with pdfplumber.open(path) as pdf:
+        for number in page_numbers:
+            page = pdf.pages[number - 1]
+            try:
+                text = page.extract_text() or ""
+                image = None
+                if render_images and len(text.strip()) < min_chars and page.images:
+                    buffer = io.BytesIO()
+                    page.to_image(resolution=resolution).original.save(buffer, format="PNG")
+                    image = buffer.getvalue()
+                results.append((number, text, image, None))
+            except Exception as e:
+                results.append((number, "", None, str(e)))
+            finally:
+                page.close()  # Giải phóng cache object của trang
+    return results
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class PdfIngestService:
+    """
+    Ingest PDF qua hàng đợi job (type "pdf_ingest"): các nhóm trang được trích xuất song song trong
+    process pool của worker, mỗi trang được ghi vào OCRPage ngay khi xong; trang chỉ có ảnh (scan)
+    được gửi qua OCRService. Khi xong, OCRDocument.ocr_text chứa text toàn bộ file theo thứ tự trang.
+    Job chạy lại (retry / worker chết) bỏ qua các trang đã có trong OCRPage.
+    File PDF là file tạm tên duy nhất (UPLOAD_TMP_DIR), bị xoá khi job xong, bị huỷ hoặc hết lượt thử.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(PdfIngestService, cls).__new__(cls)
+            cls._instance._executor = None
+        return cls._instance
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Không fork thẳng từ process đang chạy event loop và các thread pool (run_db, OCR):
+            # process con có thể kế thừa lock đang bị giữ => treo. forkserver/spawn khởi động process sạch
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self._executor = ProcessPoolExecutor(max_workers=settings.PDF_INGEST_WORKERS, mp_context=context)
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def submit(self, stored: StoredUpload) -> Job:
+        """Tạo bản ghi OCRDocument và đưa job vào hàng đợi; trả về ngay. Job sở hữu file `stored.path` từ đây."""
+        document_id = await run_db(self._create_document, stored)
+        payload = {"document_id": document_id, "path": stored.path, "filename": stored.filename}
+        return await run_db(JobQueue().enqueue, "pdf_ingest", payload)
+
+    @staticmethod
+    def _create_document(stored: StoredUpload) -> int:
+        db = SessionLocal()
+        try:
+            doc = OCRDocument(filename=stored.filename, file_hash=stored.sha256, created_at=datetime.now(timezone.utc))
+            db.add(doc)
+            db.commit()
+            return doc.id
+        finally:
+            db.close()
+
+    async def ingest(self, ctx: JobContext, payload: dict) -> dict:
+        path = payload["path"]
+        try:
+            stats = await self._ingest(ctx, payload)
+        except JobCancelled:
+            # Huỷ qua API thì xoá file; mất lease thì worker khác còn chạy tiếp bằng file này
+            job = await run_db(JobQueue().get, ctx.job_id)
+            if job is not None and job.status == "cancelled":
+                await asyncio.to_thread(_remove_quietly, path)
+            raise
+        except Exception:
+            if ctx.last_attempt:
+                await asyncio.to_thread(_remove_quietly, path)
+            raise
+        await asyncio.to_thread(_remove_quietly, path)
+        return stats
+
+    async def _ingest(self, ctx: JobContext, payload: dict) -> dict:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        document_id, path, filename = payload["document_id"], payload["path"], payload["filename"]
+        stats = {"document_id": document_id, "total_pages": 0, "ocr_pages": 0, "failed_pages": 0}
+
+        stats["total_pages"] = total = await loop.run_in_executor(executor, _count_pages, path)
+        done = await run_db(self._existing_pages, document_id)
+        todo = [n for n in range(1, total + 1) if n not in done]
+        step = max(1, settings.PDF_PAGES_PER_TASK)
+        pending = [
+            loop.run_in_executor(
+                executor, _extract_pages, path, todo[i:i + step],
+                settings.PDF_OCR_FALLBACK, settings.PDF_OCR_MIN_CHARS, settings.PDF_OCR_RESOLUTION,
+            )
+            for i in range(0, len(todo), step)
+        ]
+        progress = {"done": len(done)}
+
+        async def save(number: int, text: str, source: str):
+            await run_db(self._insert_page, document_id, number, text, source)
+            progress["done"] += 1
+            if source == "error":
+                stats["failed_pages"] += 1
+            await run_db(ctx.progress, progress["done"] / max(total, 1), f"{progress['done']}/{total} trang")
+
+        ocr_tasks = []
+        try:
+            for finished in asyncio.as_completed(pending):
+                for number, text, image, error in await finished:
+                    if image is not None:
+                        ocr_tasks.append(asyncio.create_task(self._ocr_page(filename, number, image, save, stats)))
+                    else:
+                        await save(number, text, "error" if error else ("text" if text.strip() else "empty"))
+            await asyncio.gather(*ocr_tasks)
+        finally:
+            # Huỷ / mất lease / lỗi: nhóm trang chưa chạy bị bỏ khỏi process pool (nhóm đang chạy không dừng được)
+            for future in pending:
+                future.cancel()
+            for task in ocr_tasks:
+                task.cancel()
+
+        await run_db(self._finalize_document, document_id)
+        return stats
+
+    async def _ocr_page(self, filename: str, number: int, image: bytes, save, stats: dict):
+        page_name = f"{filename}#page-{number}"
+        while True:
+            try:
+                result = await ocr_service_instance.process_bytes(image, page_name, "image/png", store=False)
+                break
+            except OCRQueueFull as e:
+                # Job nền: chờ hàng đợi OCR vơi bớt thay vì bỏ trang
+                await asyncio.sleep(e.retry_after)
+        if "error" in result:
+            await save(number, "", "error")
+            return
+        parts = [f"{c.get('number', '')} {c.get('text', '')}".strip() for c in result.get("clauses", []) if isinstance(c, dict)]
+        if result.get("handwritten_notes"):
+            parts.append(result["handwritten_notes"])
+        stats["ocr_pages"] += 1
+        await save(number, "\n".join(parts), "ocr")
+
+    @staticmethod
+    def _existing_pages(document_id: int) -> set:
+        db = SessionLocal()
+        try:
+            return {row.page_number for row in db.query(OCRPage.page_number).filter(OCRPage.document_id == document_id)}
+        finally:
+            db.close()
+
+    @staticmethod
+    def _insert_page(document_id: int, number: int, text: str, source: str):
+        db = SessionLocal()
+        try:
+            db.add(OCRPage(document_id=document_id, page_number=number, text=text, source=source))
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _finalize_document(document_id: int):
+        db = SessionLocal()
+        try:
+            texts = [
+                row.text for row in
+                db.query(OCRPage.text).filter(OCRPage.document_id == document_id).order_by(OCRPage.page_number)
+                if row.text
+            ]
+            db.query(OCRDocument).filter(OCRDocument.id == document_id).update({"ocr_text": "\n".join(texts)})
+            db.commit()
+        finally:
+            db.close()
@@ -1,6 +1,8 @@
 import json
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
+from app.core.metrics import timed
+from app.core.tracing import traced
 from app.services.llm_engine import get_llm
 from app.schemas.procedure_schema import ProcedureGuideResponse
 
@@ -13,6 +15,8 @@ class ProcedureEngine:
             cls._instance.llm = get_llm(streaming=False, temperature=0.1)
         return cls._instance
 
+    @traced("procedure.generate_guide")
+    @timed("generate_guide")
     async def generate_guide(self, query: str) -> dict:
         parser = JsonOutputParser(pydantic_object=ProcedureGuideResponse)
 
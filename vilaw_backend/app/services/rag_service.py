@@ -1,21 +1,49 @@
-import json
+import asyncio
+import os
+import pickle
+import threading
+import time
 from datetime import datetime
-from rank_bm25 import BM25Okapi
-from underthesea import word_tokenize
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 from app.services.llm_engine import get_llm
 from app.services.blockchain import BlockchainService
 from app.db.session import SessionLocal
-from app.db.models import LawChunk, ChatHistory
+from app.db.models import LawChunk
+from app.services.conversation_store import ConversationStore
+from app.core.config import settings
+from app.core.metrics import CHAT_STAGE_LATENCY, REGISTRY
+from app.core.tracing import record_span, span, traced
+
+# Mỗi giai đoạn một series, lấy sẵn để không tra nhãn trong đường nóng
+_STAGES = {stage: CHAT_STAGE_LATENCY.labels(stage) for stage in (
+    "history", "tokenize", "score", "top_k", "prompt_build", "llm_ttft", "llm_stream", "persist",
+)}
+
+
+def _stage(name: str, started: float) -> float:
+    """Ghi thời gian giai đoạn (từ `started` tới lúc gọi) vào histogram và span chat.<name>; trả về mốc hiện tại."""
+    now = time.perf_counter()
+    _STAGES[name].observe(now - started)
+    record_span(f"chat.{name}", now - started)
+    return now
+
 
 class RAGService:
     _instance = None
     _bm25 = None
     _doc_texts = None
     _llm = None
-    
+    _snapshot_mtime = None
+    # Tăng mỗi lần nạp snapshot (index mới)
+    _generation = 0
+    _init_lock = threading.Lock()
+    # Giữ trong lúc đổi/đọc cặp (_doc_texts, _bm25): retrieve chạy trong thread, song song với reload
+    _swap_lock = threading.Lock()
+    # false trong worker của serve_prefork.py: index do process master nạp và chia sẻ copy-on-write
+    auto_reload = True
+
 
     SYSTEM_PROMPT = """
     <|im_start|>system
@@ -30,6 +58,7 @@ class RAGService:
     <|im_end|>
     """
 
+    def __new__(cls):
         # Singleton
         if cls._instance is None:
             cls._instance = super(RAGService, cls).__new__(cls)
@@ -38,37 +67,107 @@ class RAGService:
 
     @classmethod
     def _init_resources(cls):
-        print("--- RAGService: Initializing Resources... ---")
+        # Có thể được gọi đồng thời từ warm-up nền lúc khởi động và request chat đầu tiên
+        with cls._init_lock:
+            if cls._bm25 is not None and cls._llm is not None:
+                return
+            print("--- RAGService: Initializing Resources... ---")
+
+            # Index BM25 được build sẵn thành snapshot (job rag_refresh); chưa có thì build ngay
+            if not cls._load_snapshot():
+                cls.build_snapshot()
+                cls._load_snapshot()
+
+            # Nạp sẵn model tách từ (underthesea tải model ở lần gọi đầu tiên)
+            from underthesea import word_tokenize
+            word_tokenize("khởi động", format="text")
+
+            # Init LLM
+            cls._llm = get_llm(streaming=True)
+            print("--- RAGService: Ready ---")
 
+    @classmethod
+    def build_snapshot(cls, path: str = None) -> dict:
+        """Đọc LawChunk, tách từ (phần tốn thời gian) và ghi snapshot; chạy trong worker job."""
+        from underthesea import word_tokenize
+        from app.services.bm25_index import BM25Index
 
+        path = path or settings.RAG_SNAPSHOT_PATH
         db = SessionLocal()
         try:
-            laws = db.query(LawChunk).filter(LawChunk.content != None).all()
-            cls._doc_texts = [law.content for law in laws if law.content and law.content.strip()]
+            laws = db.query(LawChunk.content).filter(LawChunk.content != None).all()
+            doc_texts = [law.content for law in laws if law.content and law.content.strip()]
         finally:
             db.close()
 
-        if not cls._doc_texts:
-            cls._doc_texts = ["Không có dữ liệu pháp luật trong database."]
+        if not doc_texts:
+            doc_texts = ["Không có dữ liệu pháp luật trong database."]
 
-        corpus_tokenized = [word_tokenize(doc, format="text").split() for doc in cls._doc_texts]
-        cls._bm25 = BM25Okapi(corpus_tokenized)
-        
-        # Init LLM
-        cls._llm = get_llm(streaming=True)
-        print("--- RAGService: Ready ---")
+        corpus_tokenized = [word_tokenize(doc, format="text").split() for doc in doc_texts]
+        # Lưu index đã dựng (mảng numpy) thay vì token: process API nạp nhanh, không tạo hàng triệu object tạm
+        snapshot = {"doc_texts": doc_texts, "index": BM25Index(corpus_tokenized), "built_at": datetime.utcnow().isoformat()}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)  # Process API đọc snapshot không bao giờ thấy file ghi dở
+        return {"documents": len(doc_texts), "built_at": snapshot["built_at"]}
+
+    @classmethod
+    def _load_snapshot(cls) -> bool:
+        from app.services.bm25_index import BM25Index
+
+        path = settings.RAG_SNAPSHOT_PATH
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, "rb") as f:
+                snapshot = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False
+        # Snapshot bản cũ chỉ có token
+        index = snapshot["index"] if "index" in snapshot else BM25Index(snapshot["tokens"])
+        with cls._swap_lock:
+            cls._doc_texts, cls._bm25 = snapshot["doc_texts"], index
+        cls._snapshot_mtime = mtime
+        cls._generation += 1
+        print(f"RAGService: loaded index snapshot ({len(cls._doc_texts)} documents, built {snapshot['built_at']})")
+        return True
+
+    @classmethod
+    def reload_if_stale(cls):
+        """Nạp lại snapshot nếu worker vừa build bản mới (so mtime, chỉ tốn một lần stat). Gọi trong thread."""
+        if not cls.auto_reload:
+            return
+        try:
+            mtime = os.path.getmtime(settings.RAG_SNAPSHOT_PATH)
+        except OSError:
+            return
+        if mtime != cls._snapshot_mtime:
+            with cls._init_lock:
+                # Request khác có thể vừa nạp xong bản này
+                if mtime != cls._snapshot_mtime:
+                    cls._load_snapshot()
 
+    @traced("rag.retrieve")
     def retrieve(self, query, k=3):
+        from underthesea import word_tokenize
 
+        started = time.perf_counter()
         query_tok = word_tokenize(query, format="text").split()
-        scores = self._bm25.get_scores(query_tok)
-        top_idx = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
-        return [self._doc_texts[i] for i in top_idx]
+        started = _stage("tokenize", started)
+        with self._swap_lock:
+            bm25, doc_texts = self._bm25, self._doc_texts
+        scores = bm25.get_scores(query_tok)
+        started = _stage("score", started)
+        top = bm25.rank(scores, k)
+        _stage("top_k", started)
+        return [doc_texts[i] for i in top]
 
-    def _create_prompt(self, history_str):
+    def _create_prompt(self):
+        # Lịch sử là biến của template (không ghép thẳng vào chuỗi template vì có thể chứa dấu ngoặc nhọn)
         full_template = f"""
 {self.SYSTEM_PROMPT}
-{history_str}
+{{history}}
 <|im_start|>user
 Câu hỏi: {{question}}
 <|im_end|>
@@ -79,69 +178,98 @@ Câu hỏi: {{question}}
     @classmethod
     def refresh_knowledge(cls):
         try:
-            cls._init_resources()
+            cls.build_snapshot()
+            cls._load_snapshot()
             print("RAGService: Knowledge refreshed.")
         except Exception as e:
             print(f"RAGService.refresh_knowledge error: {e}")
 
-    async def chat_stream(self, message: str, conversation_id: str = '1', db=None):
+    @classmethod
+    def is_ready(cls) -> bool:
+        return cls._bm25 is not None and cls._llm is not None
 
-        close_db = False
-        if db is None:
-            db = SessionLocal()
-            close_db = True
-            
-        history_str = ""
-        try:
-            # Try to use a Message model if it exists; otherwise skip memory loading
-            Message = None
-            try:
-                from app.db.models import Message as _Message
-                Message = _Message
-            except Exception:
-                Message = None
-
-            if Message:
-                mem_msg = db.query(Message).filter(Message.conversation_id == conversation_id, Message.role == 'memory').first()
-                if mem_msg and getattr(mem_msg, 'content', None):
-                    try:
-                        history = json.loads(mem_msg.content)
-                        for turn in history:
-                            role = turn.get('role')
-                            content = turn.get('content', '')
-                            if role in ['user', 'assistant']:
-                                history_str += f"<|im_start|>{role}\n{content}<|im_end|>\n"
-                    except Exception:
-                        pass
-        finally:
-            if close_db:
-                db.close()
+    async def ensure_ready(self):
+        """
+        Chờ index BM25 và LLM sẵn sàng mà không chặn event loop: _init_resources (có thể đang chạy trong
+        warm-up nền và giữ _init_lock nhiều giây) được gọi trong thread. Lỗi khởi tạo được ném ra cho caller.
+        """
+        if self.is_ready():
+            return
+        with span("rag.init"):
+            await asyncio.to_thread(type(self)._init_resources)
 
-        # Ensure resources are initialized (BM25, docs, LLM)
-        if not getattr(self, '_bm25', None):
+    async def chat_stream(self, message: str, conversation_id: str = '1'):
+        # Lịch sử hội thoại: summary + các lượt gần nhất trong cửa sổ token (không phình theo độ dài hội thoại)
+        store = ConversationStore()
+        history_str = ""
+        # Span (không phải record_span) để query DB khi cache miss nằm dưới chat.history trong cây span;
+        # set/reset contextvar trong cùng một bước của generator (không qua yield) nên an toàn
+        started = time.perf_counter()
+        with span("chat.history"):
             try:
-                type(self)._init_resources()
+                history_str = store.render_history(await store.get(conversation_id))
             except Exception as e:
-                print(f"RAGService: failed to init resources: {e}")
+                print(f"RAGService: không tải được lịch sử hội thoại {conversation_id}: {e}")
+        _STAGES["history"].observe(time.perf_counter() - started)
+
+        # Ensure resources are initialized (BM25, docs, LLM); endpoint đã chờ sẵn (trả 503 nếu lỗi)
+        await self.ensure_ready()
+        # stat/nạp snapshot và tách từ + chấm điểm BM25 đều là việc CPU/IO đồng bộ => chạy ngoài event loop
+        await asyncio.to_thread(type(self).reload_if_stale)
 
         # 1. Retrieve Context
-        context = "\n\n".join(self.retrieve(message, k=3))
+        context = "\n\n".join(await asyncio.to_thread(self.retrieve, message, 3))
         
         # 2. Create Chain (Tái sử dụng prompt template gọn gàng hơn)
-        prompt_template = self._create_prompt(history_str)
+        started = time.perf_counter()
+        prompt_template = self._create_prompt()
         
         chain = (
-            {"context": lambda _: context, "question": RunnablePassthrough()}
+            {"context": lambda _: context, "history": lambda _: history_str, "question": RunnablePassthrough()}
             | prompt_template
             | self._llm
             | StrOutputParser()
         )
+        _stage("prompt_build", started)
 
         # 3. Streaming & Blockchain
+        # llm_ttft: tới chunk đầu tiên; llm_stream: toàn bộ lượt stream (gồm cả thời gian client đọc)
         full_response = ""
+        started = time.perf_counter()
+        first_chunk = True
         async for chunk in chain.astream(message):
+            if first_chunk:
+                first_chunk = False
+                _stage("llm_ttft", started)
             full_response += chunk
             yield chunk
-            
+        _stage("llm_stream", started)
+
+        started = time.perf_counter()
+        with span("chat.persist"):
+            try:
+                await store.append(conversation_id, message, full_response)
+            except Exception as e:
+                print(f"RAGService: không lưu được lượt hội thoại {conversation_id}: {e}")
+        _STAGES["persist"].observe(time.perf_counter() - started)
+
         tx_hash, timestamp = BlockchainService.create_hash(full_response)
-        yield f"\n\n[🛡️ HASH: {tx_hash} | TIMESTAMP: {timestamp}]"
\ No newline at end of file
+        yield f"\n\n[🛡️ HASH: {tx_hash} | TIMESTAMP: {timestamp}]"
+
+
+def _index_metrics():
+    if RAGService._bm25 is None:
+        return []
+    families = [
+        ("vilaw_rag_index_documents", "gauge", "Số văn bản trong index BM25", [({}, len(RAGService._doc_texts))]),
+        ("vilaw_rag_index_bytes", "gauge", "Dung lượng mảng postings của index BM25", [({}, RAGService._bm25.nbytes)]),
+        ("vilaw_rag_index_terms", "gauge", "Số từ khác nhau trong index BM25", [({}, len(RAGService._bm25.terms))]),
+        ("vilaw_rag_index_generation", "gauge", "Số lần process nạp snapshot index", [({}, RAGService._generation)]),
+    ]
+    if RAGService._snapshot_mtime is not None:
+        families.append(("vilaw_rag_snapshot_mtime_seconds", "gauge", "mtime (unix) của snapshot đang dùng",
+                         [({}, RAGService._snapshot_mtime)]))
+    return families
+
+
+REGISTRY.add_collector(_index_metrics)
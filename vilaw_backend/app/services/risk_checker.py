@@ -1,10 +1,19 @@
+import asyncio
+import hashlib
 import json
+import re
+from collections import OrderedDict
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.exceptions import OutputParserException
 from pydantic import BaseModel, Field, validator
+from app.core.config import settings
+from app.core.metrics import cache_hit, timed
+from app.core.tracing import traced
 from app.services.llm_engine import get_llm
+from app.services.risk_rules import RiskRuleEngine, RuleScreenResult
 from app.schemas.contract_schema import RiskAnalysisRequest
 
 
@@ -34,78 +43,347 @@ class AIOutputStructure(BaseModel):
         return v
 
 
+class ClauseAnalysis(BaseModel):
+    index: int = Field(description="Số thứ tự [n] của điều khoản được phân tích")
+    score: int = Field(description="Điểm an toàn pháp lý của riêng điều khoản này (0-100)")
+    missing_fields: List[str] = Field(default_factory=list, description="Các mục bắt buộc bị thiếu trong phạm vi điều khoản này")
+    risks: List[RiskItem] = Field(default_factory=list, description="Danh sách rủi ro tìm thấy trong điều khoản này")
 
-class RiskCheckerService:
-    _instance = None
+class ClauseBatchOutput(BaseModel):
+    clauses: List[ClauseAnalysis] = Field(description="Kết quả phân tích cho từng điều khoản [n] trong input")
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(RiskCheckerService, cls).__new__(cls)
-            cls._instance.llm = get_llm(streaming=False, temperature=0.0)
-        return cls._instance
 
-    async def analyze_document(self, data: RiskAnalysisRequest) -> dict:
-        parser = JsonOutputParser(pydantic_object=AIOutputStructure)
+ERROR_STATUS = "Lỗi hệ thống khi phân tích"
+# Một số điều khoản không phân tích được: điểm bị chặn, không bao giờ coi là "Đầy đủ"
+PARTIAL_STATUS = "Phân tích chưa đầy đủ (có điều khoản lỗi)"
+# Điểm tối đa khi có điều khoản lỗi (như một điều khoản 0 điểm trong công thức min_score + 40)
+PARTIAL_SCORE_CAP = 40
+MISSING_OUTPUT_ERROR = "LLM không trả về kết quả cho điều khoản này (output bị cắt hoặc bỏ sót)"
 
+# Ranh giới điều khoản: dòng bắt đầu bằng "Điều N"
+CLAUSE_BOUNDARY = re.compile(r"^[ \t]*(?=Điều\s+\d+)", re.MULTILINE | re.IGNORECASE)
 
-        prompt = ChatPromptTemplate.from_template("""
+
+def split_clauses(content: str) -> List[str]:
+    """Tách văn bản thành các phần: phần mở đầu, từng "Điều N", (phần ký kết nằm trong điều cuối)."""
+    if not content:
+        return []
+    starts = [m.start() for m in CLAUSE_BOUNDARY.finditer(content)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    bounds = starts + [len(content)]
+    parts = (content[a:b].strip() for a, b in zip(bounds, bounds[1:]))
+    return [p for p in parts if p]
+
+
+def completeness_status(missing_fields: List[str]) -> str:
+    if not missing_fields:
+        return "Đầy đủ"
+    if len(missing_fields) < 3:
+        return "Thiếu sót"
+    return "Thiếu sót nghiêm trọng"
+
+
+class RiskCheckerService:
+    _instance = None
+    # Cache kết quả theo hash của từng điều khoản (dùng chung cho mọi request)
+    _clause_cache: "OrderedDict[str, dict]" = OrderedDict()
+
+    PROMPT = ChatPromptTemplate.from_template("""
         <|im_start|>system
         Bạn là Chuyên gia Pháp chế & Kiểm soát Rủi ro Hợp đồng (Legal Risk Compliance) hàng đầu tại Việt Nam.
         Nhiệm vụ: Phân tích văn bản pháp lý cực kỳ nghiêm ngặt để bảo vệ quyền lợi cho khách hàng.
-        
-        QUY TRÌNH PHÂN TÍCH 4 BƯỚC:
-        1. **Kiểm tra hình thức (Completeness):** Rà soát các yếu tố bắt buộc (Chủ thể, Đại diện, Ngày tháng, Chữ ký/Con dấu).
+
+        Bạn chỉ nhận MỘT PHẦN của hợp đồng, gồm các điều khoản được đánh số [1], [2], ...
+        Dàn ý toàn văn (chỉ để tham khảo ngữ cảnh, KHÔNG phân tích):
+        {outline}
+
+        QUY TRÌNH PHÂN TÍCH CHO TỪNG ĐIỀU KHOẢN [n]:
+        1. **Kiểm tra hình thức (Completeness):** Chỉ ghi missing_fields nếu mục bắt buộc thuộc phạm vi điều khoản đó bị thiếu
+           (VD: phần mở đầu thiếu thông tin Chủ thể/Đại diện, phần cuối thiếu Ngày tháng, Chữ ký/Con dấu).
         2. **Đối chiếu pháp luật (Compliance):** So sánh với Bộ luật Dân sự 2015, Luật Thương mại 2005, và các luật chuyên ngành liên quan.
            - Cảnh báo ngay nếu điều khoản trái luật (Vô hiệu).
            - Phát hiện các điều khoản bất lợi, không công bằng.
-        3. **Đánh giá rủi ro (Risk Scoring):** Chấm điểm dựa trên mức độ rủi ro tìm thấy.
+        3. **Đánh giá rủi ro (Risk Scoring):** Chấm điểm riêng cho điều khoản (0-100).
         4. **Đề xuất (Redlining):** Đưa ra phương án sửa đổi cụ thể.
 
         QUY TẮC QUAN TRỌNG:
+        - Trả về đúng một phần tử trong "clauses" cho mỗi điều khoản [n], với "index" = n.
         - **Trích dẫn (clause):** Phải trích dẫn NGUYÊN VĂN từ văn bản input. Không được tự viết lại.
         - **Căn cứ pháp lý:** Chỉ trích dẫn điều luật cụ thể nếu bạn chắc chắn 100%. Nếu không, hãy ghi "Theo quy định pháp luật hiện hành".
         - **JSON Output:** Trả về JSON thuần túy, không markdown.
 
         {format_instructions}
         <|im_end|>
-        
+
         <|im_start|>user
         LOẠI HỢP ĐỒNG: {contract_type}
-        
-        NỘI DUNG VĂN BẢN:
-        {content}
+
+        CÁC ĐIỀU KHOẢN CẦN PHÂN TÍCH:
+        {clauses}
         <|im_end|>
-        
+
         <|im_start|>assistant
         """)
 
-        chain = prompt | self.llm | parser
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(RiskCheckerService, cls).__new__(cls)
+            cls._instance.llm = get_llm(streaming=False, temperature=0.0, max_tokens=settings.RISK_MAX_OUTPUT_TOKENS)
+        return cls._instance
 
-        try:
+    @traced("risk.analyze_document")
+    @timed("analyze_document")
+    async def analyze_document(self, data: RiskAnalysisRequest, semaphore: Optional[asyncio.Semaphore] = None) -> dict:
+        # 1. Pre-screen bằng rule cục bộ (vài ms, không tốn LLM)
+        screen = RiskRuleEngine().evaluate(data.content, data.contract_type)
+        if data.screening == "fast":
+            return self._rules_result(screen)
+
+        # 2. LLM chỉ phân tích phần còn lại (hybrid) hoặc toàn văn (full)
+        text = screen.residual_text(data.content) if data.screening == "hybrid" else data.content
+        clauses = split_clauses(text)
+        if not clauses:
+            return self._rules_result(screen)
+        llm_result = await self.analyze_clauses(data.contract_type, clauses, semaphore=semaphore)
+        return self._combine(screen, llm_result)
+
+    async def analyze_clauses(self, contract_type: str, clauses: List[str],
+                              semaphore: Optional[asyncio.Semaphore] = None, store: bool = True) -> dict:
+        """
+        Phân tích rủi ro theo từng điều khoản:
+        - Điều khoản đã có trong cache (cùng nội dung + loại hợp đồng) không gọi lại LLM.
+        - Các điều khoản còn lại được gom thành batch nhỏ (theo ký tự input và ngân sách token output)
+          và gửi song song (giới hạn RISK_MAX_PARALLEL).
+        - Điều khoản LLM không trả kết quả (output bị cắt, bỏ sót) được gửi lại riêng từng điều;
+          vẫn thiếu thì báo lỗi cho điều khoản đó, không bao giờ coi là an toàn hay đưa vào cache.
+        `semaphore`: giới hạn dùng chung khi nhiều lần gọi chạy cùng lúc (VD: các Điều của /draft/stream),
+        mặc định mỗi lần gọi một Semaphore(RISK_MAX_PARALLEL) riêng.
+        `store=False`: không ghi kết quả vào cache (phân tích thiếu dàn ý toàn văn, chỉ dùng tạm).
+        """
+        keys = [self._clause_key(contract_type, c) for c in clauses]
+        results: List[Optional[dict]] = [self._cache_get(k) for k in keys]
+        pending = [i for i, r in enumerate(results) if r is None]
+
+        errors: Dict[int, str] = {}
+        if pending:
+            outline = "\n".join(f"- {c.splitlines()[0][:80]}" for c in clauses)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(settings.RISK_MAX_PARALLEL)
+
+            async def run(batch: List[int]):
+                async with semaphore:
+                    return await self._analyze_batch(contract_type, outline, [clauses[i] for i in batch])
+
+            batches = self._make_batches(pending, clauses)
+            while batches:
+                retry = []
+                outputs = await asyncio.gather(*(run(b) for b in batches), return_exceptions=True)
+                for batch, output in zip(batches, outputs):
+                    if isinstance(output, Exception):
+                        print(f"Risk analysis error: {output}")
+                        # JSON hỏng (thường do output bị cắt) ở batch nhiều điều khoản: thử lại từng điều
+                        if isinstance(output, OutputParserException) and len(batch) > 1:
+                            retry.extend(batch)
+                            continue
+                        for i in batch:
+                            errors[i] = str(output)
+                        continue
+                    for pos, i in enumerate(batch):
+                        item = output.get(pos)
+                        if item is not None:
+                            results[i] = item
+                            if store:
+                                self._cache_put(keys[i], item)
+                        elif len(batch) > 1:
+                            retry.append(i)
+                        else:
+                            errors[i] = MISSING_OUTPUT_ERROR
+                batches = [[i] for i in retry]
+
+        if clauses and len(errors) == len(clauses):
+            return self._error_result(next(iter(errors.values())))
+        return self._merge(clauses, results, errors)
+
+    @traced("risk.analyze_batch")
+    async def _analyze_batch(self, contract_type: str, outline: str, batch: List[str]) -> Dict[int, dict]:
+        """Trả về {vị trí trong batch: kết quả}; chỉ gồm các điều khoản LLM trả về đầy đủ."""
+        parser = JsonOutputParser(pydantic_object=ClauseBatchOutput)
+        chain = self.PROMPT | self.llm
+        message = await chain.ainvoke({
+            "contract_type": contract_type,
+            "outline": outline,
+            "clauses": "\n\n".join(f"[{n}] {text}" for n, text in enumerate(batch, start=1)),
+            "format_instructions": parser.get_format_instructions()
+        })
+        # JsonOutputParser tự "vá" JSON bị cắt => phải tự kiểm tra output có bị cắt vì max_tokens không
+        truncated = (getattr(message, "response_metadata", None) or {}).get("finish_reason") == "length"
+        result = parser.invoke(message)
+        by_index = {}
+        for item in (result or {}).get("clauses", []) if isinstance(result, dict) else []:
+            if not isinstance(item, dict) or "score" not in item:
+                continue
+            try:
+                by_index[int(item.get("index"))] = item
+            except (TypeError, ValueError):
+                continue
+        if truncated and by_index:
+            # Phần tử cuối cùng có thể chỉ là nửa đầu (danh sách risks bị cắt)
+            by_index.pop(max(by_index))
+        return {n - 1: self._normalize_clause(item) for n, item in by_index.items() if 1 <= n <= len(batch)}
+
+    # --- Batching & cache ---
+
+    @staticmethod
+    def _estimate_output_tokens(clause: str) -> int:
+        return settings.RISK_OUTPUT_TOKENS_PER_CLAUSE + len(clause) // 8
+
+    @classmethod
+    def _make_batches(cls, indices: List[int], clauses: List[str]) -> List[List[int]]:
+        output_budget = settings.RISK_MAX_OUTPUT_TOKENS * 0.8
+        batches, current, size, tokens = [], [], 0, 0
+        for i in indices:
+            length = len(clauses[i])
+            estimate = cls._estimate_output_tokens(clauses[i])
+            if current and (size + length > settings.RISK_BATCH_CHARS
+                            or len(current) >= settings.RISK_BATCH_CLAUSES
+                            or tokens + estimate > output_budget):
+                batches.append(current)
+                current, size, tokens = [], 0, 0
+            current.append(i)
+            size += length
+            tokens += estimate
+        if current:
+            batches.append(current)
+        return batches
 
-            result = await chain.ainvoke({
-                "contract_type": data.contract_type,
-                "content": data.content,
-                "format_instructions": parser.get_format_instructions()
+    @staticmethod
+    def _clause_key(contract_type: str, clause: str) -> str:
+        normalized = " ".join(clause.split())
+        return hashlib.sha256(f"{contract_type.strip().lower()}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    @classmethod
+    def _cache_get(cls, key: str) -> Optional[dict]:
+        value = cls._clause_cache.get(key)
+        if value is not None:
+            cls._clause_cache.move_to_end(key)
+        cache_hit("risk_clause", value is not None)
+        return value
+
+    @classmethod
+    def _cache_put(cls, key: str, value: dict):
+        cls._clause_cache[key] = value
+        cls._clause_cache.move_to_end(key)
+        while len(cls._clause_cache) > settings.RISK_CLAUSE_CACHE_SIZE:
+            cls._clause_cache.popitem(last=False)
+
+    # --- Chuẩn hoá & gộp kết quả ---
+
+    @staticmethod
+    def _normalize_clause(item: dict) -> dict:
+        try:
+            score = max(0, min(100, int(item.get("score", 100))))
+        except (TypeError, ValueError):
+            score = 100
+        risks = []
+        for r in item.get("risks") or []:
+            if not isinstance(r, dict):
+                continue
+            severity = str(r.get("severity", "Medium")).strip().capitalize()
+            risks.append({
+                "severity": severity if severity in ("High", "Medium", "Low") else "Medium",
+                "clause": str(r.get("clause") or ""),
+                "issue": str(r.get("issue") or ""),
+                "suggestion": str(r.get("suggestion") or ""),
+                "legal_basis": r.get("legal_basis"),
             })
-            return result
-            
-        except Exception as e:
-            print(f"Risk analysis error: {e}")
-            return AIOutputStructure(
-                overall_score=0,
-                completeness_status="Lỗi hệ thống khi phân tích",
-                missing_fields=[],
-                risks=[
-                    RiskItem(
-                        severity=RiskSeverity.HIGH,
-                        clause="N/A",
-                        issue=f"Hệ thống không thể đọc văn bản này: {str(e)}",
-                        suggestion="Vui lòng kiểm tra lại định dạng văn bản hoặc thử lại sau.",
-                        legal_basis=None
-                    )
-                ]
-            ).dict()
+        return {
+            "score": score,
+            "missing_fields": [str(f) for f in item.get("missing_fields") or []],
+            "risks": risks,
+        }
+
+    @staticmethod
+    def _merge(clauses: List[str], results: List[Optional[dict]], errors: Dict[int, str]) -> dict:
+        weighted, total_len, min_score = 0.0, 0, 100
+        missing_fields, risks = [], []
+        for i, result in enumerate(results):
+            if result is None:
+                # Chưa biết điều khoản này an toàn hay không => tính như điều khoản 0 điểm trong min_score
+                min_score = 0
+                risks.append({
+                    "severity": RiskSeverity.HIGH.value,
+                    "clause": clauses[i][:200],
+                    "issue": f"Hệ thống không thể phân tích điều khoản này: {errors.get(i, '')}",
+                    "suggestion": "Vui lòng thử lại sau.",
+                    "legal_basis": None,
+                })
+                continue
+            weighted += result["score"] * len(clauses[i])
+            total_len += len(clauses[i])
+            min_score = min(min_score, result["score"])
+            for field in result["missing_fields"]:
+                if field not in missing_fields:
+                    missing_fields.append(field)
+            risks.extend(result["risks"])
+
+        # Điểm tổng: trung bình theo độ dài, nhưng một điều khoản rất rủi ro vẫn kéo điểm xuống
+        score = round(weighted / total_len) if total_len else 0
+        score = min(score, min_score + 40)
+
+        return {
+            "overall_score": score,
+            "completeness_status": PARTIAL_STATUS if errors else completeness_status(missing_fields),
+            "missing_fields": missing_fields,
+            "risks": risks,
+        }
+
+    @staticmethod
+    def _rules_result(screen: RuleScreenResult) -> dict:
+        return {
+            "overall_score": screen.score,
+            "completeness_status": completeness_status(screen.missing_fields),
+            "missing_fields": list(screen.missing_fields),
+            "risks": list(screen.risks),
+        }
+
+    @staticmethod
+    def _combine(screen: RuleScreenResult, llm_result: dict) -> dict:
+        """Gộp kết quả rule (đặt trước, có legal_basis chắc chắn) với kết quả LLM."""
+        missing_fields = list(screen.missing_fields)
+        for f in llm_result.get("missing_fields", []):
+            if f not in missing_fields:
+                missing_fields.append(f)
+        risks = list(screen.risks) + list(llm_result.get("risks", []))
+        llm_status = llm_result.get("completeness_status")
+        if llm_status == ERROR_STATUS:
+            # LLM lỗi: vẫn trả điểm rule (chặn như phân tích dở dang), kèm cảnh báo phân tích chưa đầy đủ
+            score = min(screen.score, PARTIAL_SCORE_CAP)
+        else:
+            score = min(screen.score, llm_result.get("overall_score", 100))
+        return {
+            "overall_score": score,
+            "completeness_status": llm_status if llm_status in (ERROR_STATUS, PARTIAL_STATUS) else completeness_status(missing_fields),
+            "missing_fields": missing_fields,
+            "risks": risks,
+        }
+
+    @staticmethod
+    def _error_result(error: str) -> dict:
+        return AIOutputStructure(
+            overall_score=0,
+            completeness_status=ERROR_STATUS,
+            missing_fields=[],
+            risks=[
+                RiskItem(
+                    severity=RiskSeverity.HIGH,
+                    clause="N/A",
+                    issue=f"Hệ thống không thể đọc văn bản này: {error}",
+                    suggestion="Vui lòng kiểm tra lại định dạng văn bản hoặc thử lại sau.",
+                    legal_basis=None
+                )
+            ]
+        ).dict()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,177 @@
+import json
+import operator
+import re
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from app.core.config import settings
+
+_OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+# Ranh giới câu dùng khi cắt bỏ phần đã được rule xử lý (mode "hybrid")
+_SENTENCE_END = re.compile(r"[.;]\s|\n")
+# Độ dài tối đa của câu trích làm "clause" trong kết quả
+_MAX_CLAUSE_CHARS = 300
+
+
+@dataclass
+class Rule:
+    id: str
+    type: str                       # "required" | "pattern" | "numeric"
+    regex: re.Pattern
+    severity: str
+    issue: str
+    suggestion: str
+    legal_basis: Optional[str] = None
+    missing_field: Optional[str] = None
+    number_format: str = "decimal"  # "decimal": 2,5 / 2.5 | "grouped": 3.450.000
+    scale: float = 1
+    op: str = ">"
+    threshold: float = 0
+    contract_types: List[str] = field(default_factory=list)
+    exclude_contract_types: List[str] = field(default_factory=list)
+    # Khớp ở cuối đoạn câu đứng trước match (VD: "không được ...", "nghiêm cấm ...") => câu phủ định, bỏ qua
+    negation: Optional[re.Pattern] = None
+
+    def applies_to(self, contract_type: str) -> bool:
+        ct = (contract_type or "").lower()
+        if self.contract_types and not any(k in ct for k in self.contract_types):
+            return False
+        return not any(k in ct for k in self.exclude_contract_types)
+
+
+@dataclass
+class RuleScreenResult:
+    risks: List[dict] = field(default_factory=list)
+    missing_fields: List[str] = field(default_factory=list)
+    matched_spans: List[Tuple[int, int]] = field(default_factory=list)
+    fired_rules: List[str] = field(default_factory=list)
+    score: int = 100
+    elapsed_ms: float = 0.0
+
+    def residual_text(self, content: str) -> str:
+        """Bỏ các câu đã bị rule bắt lỗi, phần còn lại mới cần gửi cho LLM."""
+        if not self.matched_spans:
+            return content
+        removed = []
+        for start, end in sorted(self.matched_spans):
+            s, e = _sentence_bounds(content, start, end)
+            if removed and s <= removed[-1][1]:
+                removed[-1] = (removed[-1][0], max(e, removed[-1][1]))
+            else:
+                removed.append((s, e))
+        parts, cursor = [], 0
+        for s, e in removed:
+            parts.append(content[cursor:s])
+            cursor = e
+        parts.append(content[cursor:])
+        return "".join(parts).strip()
+
+
+def _sentence_bounds(content: str, start: int, end: int) -> Tuple[int, int]:
+    """Câu chứa đoạn [start, end): từ sau dấu kết câu gần nhất phía trước tới hết dấu kết câu phía sau."""
+    prev = None
+    for m in _SENTENCE_END.finditer(content, 0, start):
+        prev = m
+    s = prev.end() if prev else 0
+    nxt = _SENTENCE_END.search(content, end)
+    e = nxt.end() if nxt else len(content)
+    return s, e
+
+
+def _parse_number(raw: str, number_format: str) -> float:
+    if number_format == "grouped":
+        return float(re.sub(r"[.,]", "", raw))
+    return float(raw.replace(",", "."))
+
+
+class RiskRuleEngine:
+    """
+    Bộ rule tất định chạy trước LLM: regex + so sánh số liệu trích xuất được.
+    Rule được nạp từ file JSON (mặc định app/data/risk_rules.json) và compile một lần.
+    """
+    _instance = None
+
+    def __new__(cls, path: str = None):
+        if path is not None:
+            engine = super(RiskRuleEngine, cls).__new__(cls)
+            engine.load(path)
+            return engine
+        if cls._instance is None:
+            cls._instance = super(RiskRuleEngine, cls).__new__(cls)
+            cls._instance.load(settings.RISK_RULES_PATH)
+        return cls._instance
+
+    def load(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.path = path
+        self.severity_penalty = data.get("severity_penalty", {"High": 20, "Medium": 10, "Low": 5})
+        self.missing_field_penalty = data.get("missing_field_penalty", 5)
+        self.rules = []
+        for raw in data.get("rules", []):
+            spec = dict(raw)
+            spec["regex"] = re.compile(spec.pop("pattern"), re.IGNORECASE | re.MULTILINE)
+            negation = spec.pop("negation_pattern", None)
+            spec["negation"] = re.compile(negation, re.IGNORECASE) if negation else None
+            spec["contract_types"] = [k.lower() for k in spec.get("contract_types", [])]
+            spec["exclude_contract_types"] = [k.lower() for k in spec.get("exclude_contract_types", [])]
+            self.rules.append(Rule(**spec))
+
+    def evaluate(self, content: str, contract_type: str = "") -> RuleScreenResult:
+        started = time.perf_counter()
+        result = RuleScreenResult()
+        content = content or ""
+
+        for rule in self.rules:
+            if not rule.applies_to(contract_type):
+                continue
+
+            if rule.type == "required":
+                if rule.regex.search(content) is None:
+                    result.fired_rules.append(rule.id)
+                    if rule.missing_field and rule.missing_field not in result.missing_fields:
+                        result.missing_fields.append(rule.missing_field)
+                    result.risks.append(self._risk(rule, "N/A"))
+                continue
+
+            # Mỗi rule báo tối đa một lỗi cho mỗi câu, trích nguyên câu làm clause
+            fired_sentences = set()
+            for match in rule.regex.finditer(content):
+                s, e = _sentence_bounds(content, *match.span())
+                if s in fired_sentences:
+                    continue
+                if rule.negation is not None and rule.negation.search(content, s, match.start()):
+                    continue
+                sentence = content[s:e].strip()[:_MAX_CLAUSE_CHARS]
+                if rule.type == "numeric":
+                    # Pattern có thể có nhiều nhánh (mỗi nhánh một group): lấy group khớp đầu tiên
+                    raw = next((g for g in match.groups() if g is not None), None)
+                    try:
+                        value = _parse_number(raw, rule.number_format) * rule.scale
+                    except (TypeError, ValueError):
+                        continue
+                    if not _OPS[rule.op](value, rule.threshold):
+                        continue
+                    risk = self._risk(rule, sentence, value=value)
+                else:
+                    risk = self._risk(rule, sentence)
+                fired_sentences.add(s)
+                result.fired_rules.append(rule.id)
+                result.risks.append(risk)
+                result.matched_spans.append(match.span())
+
+        penalty = sum(self.severity_penalty.get(r["severity"], 0) for r in result.risks)
+        penalty += self.missing_field_penalty * len(result.missing_fields)
+        result.score = max(0, 100 - penalty)
+        result.elapsed_ms = (time.perf_counter() - started) * 1000
+        return result
+
+    @staticmethod
+    def _risk(rule: Rule, clause: str, **values) -> dict:
+        return {
+            "severity": rule.severity,
+            "clause": clause,
+            "issue": rule.issue.format(**values) if values else rule.issue,
+            "suggestion": rule.suggestion,
+            "legal_basis": rule.legal_basis,
+        }
@@ -0,0 +1,300 @@
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, fields, replace
+from typing import Dict, Optional
+from app.core.config import settings
+from app.core.metrics import REGISTRY
+from app.core.exceptions import AdmissionRejected
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    name: str
+    concurrency: int        # Số request chạy đồng thời tối đa trong pool
+    max_queue: int          # Số request được phép xếp hàng chờ
+    priority: int           # Số nhỏ = ưu tiên cao (chat tương tác đứng trước drafting)
+    rate: float             # Token bucket: số request/giây cho mỗi user
+    burst: int              # Token bucket: dung lượng tối đa
+
+
+DEFAULT_POOLS = {
+    "chat": PoolConfig("chat", concurrency=16, max_queue=64, priority=0, rate=1.0, burst=5),
+    "ocr": PoolConfig("ocr", concurrency=4, max_queue=32, priority=1, rate=0.5, burst=5),
+    "risk": PoolConfig("risk", concurrency=6, max_queue=32, priority=1, rate=0.5, burst=3),
+    "procedure": PoolConfig("procedure", concurrency=6, max_queue=32, priority=1, rate=0.5, burst=3),
+    "draft": PoolConfig("draft", concurrency=3, max_queue=16, priority=2, rate=0.2, burst=2),
+    "batch": PoolConfig("batch", concurrency=2, max_queue=8, priority=3, rate=0.05, burst=2),
+}
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Lấy 1 token. Trả về 0 nếu thành công, ngược lại số giây cần chờ."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+class _Pool:
+    def __init__(self, config: PoolConfig):
+        self.config = config
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.avg_service = 1.0  # EWMA thời gian xử lý (giây), dùng để ước lượng Retry-After
+
+    def observe(self, duration: float):
+        self.avg_service = 0.8 * self.avg_service + 0.2 * duration
+
+
+class _Waiter:
+    __slots__ = ("pool", "future", "granted")
+
+    def __init__(self, pool: _Pool, future: asyncio.Future):
+        self.pool = pool
+        self.future = future
+        self.granted = False
+
+
+class RequestScheduler:
+    """
+    Admission control cho các endpoint nặng:
+    - Mỗi endpoint có pool riêng (giới hạn concurrency + độ dài hàng đợi).
+    - Tất cả pool dùng chung một giới hạn toàn cục; khi có slot trống, request ưu tiên cao nhất được chạy trước.
+    - Rate limit theo user bằng token bucket.
+    Khi quá tải trả về lỗi ngay (429/503 kèm Retry-After) thay vì để client chờ tới timeout.
+    Trạng thái nằm trong RAM của từng process: với `processes` > 1 (worker của serve_prefork.py) mỗi process
+    chỉ nhận phần giới hạn của mình (xem `_share_pools`) để tổng cả máy vẫn xấp xỉ cấu hình.
+    """
+    _instance = None
+    MAX_BUCKETS = 10000
+    # Số process API cùng phục vụ (serve_prefork.py đặt trước khi fork)
+    processes = 1
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(RequestScheduler, cls).__new__(cls)
+            cls._instance._configure(
+                _share_pools(_load_pools(settings.SCHEDULER_POOLS), cls.processes),
+                math.ceil(settings.SCHEDULER_GLOBAL_CONCURRENCY / cls.processes),
+                settings.SCHEDULER_MAX_WAIT,
+            )
+        return cls._instance
+
+    def _configure(self, pools: Dict[str, PoolConfig], global_concurrency: int, max_wait: float):
+        self.pools = {name: _Pool(cfg) for name, cfg in pools.items()}
+        self.global_concurrency = global_concurrency
+        self.max_wait = max_wait
+        self.active_total = 0
+        self._heap = []
+        self._seq = itertools.count()
+        self._buckets: "OrderedDict[tuple, TokenBucket]" = OrderedDict()
+
+    # --- Rate limit ---
+
+    def _check_rate(self, pool: _Pool, user_key: str):
+        key = (pool.config.name, user_key)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(pool.config.rate, pool.config.burst)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        wait = bucket.take()
+        if wait > 0:
+            pool.rate_limited += 1
+            raise AdmissionRejected(429, "Bạn gửi yêu cầu quá nhanh, vui lòng thử lại sau.", math.ceil(wait))
+
+    # --- Slot management ---
+
+    def _has_capacity(self, pool: _Pool) -> bool:
+        return pool.active < pool.config.concurrency and self.active_total < self.global_concurrency
+
+    def _grant(self, pool: _Pool):
+        pool.active += 1
+        pool.admitted += 1
+        self.active_total += 1
+
+    def _release(self, pool: _Pool, duration: Optional[float] = None):
+        pool.active -= 1
+        self.active_total -= 1
+        if duration is not None:
+            pool.observe(duration)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Cấp slot trống cho các waiter theo thứ tự ưu tiên (bỏ qua pool đã đầy)."""
+        skipped = []
+        while self._heap and self.active_total < self.global_concurrency:
+            entry = heapq.heappop(self._heap)
+            waiter = entry[2]
+            if waiter.future.done():
+                continue
+            if waiter.pool.active >= waiter.pool.config.concurrency:
+                skipped.append(entry)
+                continue
+            waiter.pool.waiting -= 1
+            waiter.granted = True
+            self._grant(waiter.pool)
+            waiter.future.set_result(True)
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+
+    def _retry_after(self, pool: _Pool) -> int:
+        backlog = (pool.waiting + pool.active) / max(pool.config.concurrency, 1)
+        return max(1, min(60, math.ceil(backlog * pool.avg_service)))
+
+    @asynccontextmanager
+    async def admit(self, pool_name: str, user_key: str = "anonymous"):
+        pool = self.pools.get(pool_name)
+        if pool is None:
+            yield
+            return
+
+        self._check_rate(pool, user_key)
+
+        if not self._heap and self._has_capacity(pool):
+            self._grant(pool)
+        else:
+            if pool.waiting >= pool.config.max_queue:
+                pool.rejected += 1
+                raise AdmissionRejected(503, "Hệ thống đang quá tải, vui lòng thử lại sau.", self._retry_after(pool))
+
+            waiter = _Waiter(pool, asyncio.get_running_loop().create_future())
+            heapq.heappush(self._heap, (pool.config.priority, next(self._seq), waiter))
+            pool.waiting += 1
+            self._dispatch()
+            try:
+                if not waiter.granted:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.granted:
+                    # Đã được cấp slot đúng lúc bị huỷ -> trả lại slot
+                    self._release(pool)
+                else:
+                    waiter.future.cancel()
+                    pool.waiting -= 1
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                pool.rejected += 1
+                raise AdmissionRejected(503, "Hệ thống đang quá tải, vui lòng thử lại sau.", self._retry_after(pool))
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(pool, time.monotonic() - started)
+
+    def snapshot(self) -> dict:
+        return {
+            "active_total": self.active_total,
+            "global_concurrency": self.global_concurrency,
+            "processes": self.processes,
+            "pools": {
+                name: {
+                    "active": p.active,
+                    "waiting": p.waiting,
+                    "concurrency": p.config.concurrency,
+                    "max_queue": p.config.max_queue,
+                    "priority": p.config.priority,
+                    "admitted": p.admitted,
+                    "rejected": p.rejected,
+                    "rate_limited": p.rate_limited,
+                    "avg_service_s": round(p.avg_service, 3),
+                }
+                for name, p in self.pools.items()
+            },
+        }
+
+
+def _share_pools(pools: Dict[str, PoolConfig], processes: int) -> Dict[str, PoolConfig]:
+    """
+    Phần giới hạn của một process khi `processes` process chia nhau request (qua cùng socket, phân bố gần đều):
+    concurrency/hàng đợi/burst chia đều (làm tròn lên, tối thiểu 1), rate chia đều. Rate limit theo user vì thế
+    chỉ xấp xỉ: user dồn request vào một process bị chặn sớm hơn, burst làm tròn lên có thể vượt một chút.
+    """
+    if processes <= 1:
+        return pools
+    return {
+        name: replace(
+            cfg,
+            concurrency=max(1, math.ceil(cfg.concurrency / processes)),
+            max_queue=max(1, math.ceil(cfg.max_queue / processes)),
+            rate=cfg.rate / processes,
+            burst=max(1, math.ceil(cfg.burst / processes)),
+        )
+        for name, cfg in pools.items()
+    }
+
+
+def _load_pools(raw: str) -> Dict[str, PoolConfig]:
+    pools = dict(DEFAULT_POOLS)
+    if not raw:
+        return pools
+    try:
+        overrides = json.loads(raw)
+    except json.JSONDecodeError as e:
+        print(f"WARNING: SCHEDULER_POOLS không hợp lệ, dùng cấu hình mặc định: {e}")
+        return pools
+    if not isinstance(overrides, dict):
+        print("WARNING: SCHEDULER_POOLS phải là object JSON {pool: {...}}, dùng cấu hình mặc định")
+        return pools
+    types = {f.name: f.type for f in fields(PoolConfig) if f.name != "name"}
+    for name, values in overrides.items():
+        if not isinstance(values, dict):
+            print(f"WARNING: SCHEDULER_POOLS['{name}'] phải là object, bỏ qua")
+            continue
+        unknown = set(values) - set(types)
+        if unknown:
+            print(f"WARNING: SCHEDULER_POOLS['{name}'] có khoá không hợp lệ {sorted(unknown)}, "
+                  f"chỉ nhận {sorted(types)}")
+        try:
+            clean = {key: types[key](value) for key, value in values.items() if key in types}
+        except (TypeError, ValueError) as e:
+            print(f"WARNING: SCHEDULER_POOLS['{name}'] có giá trị không hợp lệ, bỏ qua: {e}")
+            continue
+        if any(value < 0 for value in clean.values()) or clean.get("concurrency", 1) < 1:
+            print(f"WARNING: SCHEDULER_POOLS['{name}'] có giá trị âm hoặc concurrency < 1, bỏ qua")
+            continue
+        base = pools.get(name, PoolConfig(name, concurrency=4, max_queue=16, priority=1, rate=1.0, burst=5))
+        pools[name] = replace(base, **clean)
+    return pools
+
+
+def _scheduler_metrics():
+    scheduler = RequestScheduler._instance
+    if scheduler is None:
+        return []
+    pools = scheduler.pools.items()
+    return [
+        ("vilaw_scheduler_active", "gauge", "Số request đang chạy theo pool", [({"pool": n}, p.active) for n, p in pools]),
+        ("vilaw_scheduler_waiting", "gauge", "Số request đang chờ slot theo pool", [({"pool": n}, p.waiting) for n, p in pools]),
+        ("vilaw_scheduler_admitted_total", "counter", "Số request được nhận theo pool", [({"pool": n}, p.admitted) for n, p in pools]),
+        ("vilaw_scheduler_rejected_total", "counter", "Số request bị từ chối (quá tải) theo pool", [({"pool": n}, p.rejected) for n, p in pools]),
+        ("vilaw_scheduler_rate_limited_total", "counter", "Số request bị rate limit theo pool", [({"pool": n}, p.rate_limited) for n, p in pools]),
+    ]
+
+
+REGISTRY.add_collector(_scheduler_metrics)
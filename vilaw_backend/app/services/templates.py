@@ -1,4 +1,67 @@
-from typing import Dict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# Tên trường viết tắt/tiếng Việt không dấu mà client hay gửi
+FIELD_ALIASES = {"ten": "name", "dia_chi": "address", "ngay": "date", "cccd": "id_number"}
+
+
+@dataclass(frozen=True)
+class TemplateSpec:
+    required: Dict[str, str]    # Thông tin thực tế phải hỏi người dùng (không để LLM tự đặt ra)
+    free_text: Dict[str, str]   # Đoạn văn xuôi LLM viết được từ `summary` nếu metadata chưa có
+
+
+TEMPLATE_SPECS: Dict[str, TemplateSpec] = {
+    "Đơn Khiếu Nại": TemplateSpec(
+        required={"name": "Họ và tên người khiếu nại", "address": "Địa chỉ người khiếu nại",
+                  "recipient": "Cơ quan/đơn vị nhận đơn"},
+        free_text={"subject": "Dòng 'Về việc ...' ngắn gọn nêu vấn đề khiếu nại",
+                   "details": "Trình bày chi tiết sự việc và yêu cầu giải quyết"},
+    ),
+    "Hợp Đồng Thuê Nhà": TemplateSpec(
+        required={"landlord": "Họ tên bên cho thuê", "tenant": "Họ tên bên thuê",
+                  "property_address": "Địa chỉ nhà cho thuê", "rent": "Giá thuê",
+                  "duration": "Thời hạn thuê"},
+        free_text={"terms": "Các điều khoản (Điều 1: Mục đích sử dụng, Điều 2: Thanh toán, "
+                            "Điều 3: Quyền và nghĩa vụ các bên, ...), mỗi Điều bắt đầu ở dòng mới"},
+    ),
+    "Đơn xin Việc": TemplateSpec(
+        required={"name": "Họ và tên", "address": "Địa chỉ", "company": "Tên công ty",
+                  "position": "Vị trí ứng tuyển", "education": "Trình độ học vấn",
+                  "skills": "Kỹ năng nổi bật"},
+        free_text={"content": "Nội dung thư xin việc: lý do ứng tuyển, kinh nghiệm, cam kết"},
+    ),
+    "Đơn tố cáo": TemplateSpec(
+        required={"name": "Họ và tên người tố cáo", "address": "Địa chỉ người tố cáo",
+                  "recipient": "Cơ quan/đơn vị nhận đơn", "accused": "Người/bên bị tố cáo"},
+        free_text={"incident": "Mô tả sự việc vi phạm (thời gian, địa điểm, hành vi)",
+                   "evidence": "Các chứng cứ kèm theo được nêu trong tóm tắt (nếu có)"},
+    ),
+}
+
+
+def find_template(document_type: str) -> Optional[str]:
+    """Tên loại văn bản chuẩn trong TEMPLATE_SPECS (không phân biệt hoa thường), None nếu không có template."""
+    key = " ".join((document_type or "").split()).casefold()
+    for name in TEMPLATE_SPECS:
+        if name.casefold() == key:
+            return name
+    return None
+
+
+def normalize_metadata(metadata: Dict[str, str]) -> Dict[str, str]:
+    """Đổi alias sang tên trường chuẩn và bỏ giá trị rỗng."""
+    result = {}
+    for key, value in (metadata or {}).items():
+        if value is None or not str(value).strip():
+            continue
+        result.setdefault(FIELD_ALIASES.get(key, key), str(value).strip())
+    return result
+
+
+def missing_fields(document_type: str, metadata: Dict[str, str]) -> List[str]:
+    spec = TEMPLATE_SPECS[document_type]
+    return [key for key in spec.required if key not in metadata]
 
 
 def render_template(document_type: str, metadata: Dict[str, str]) -> str:
@@ -13,6 +76,9 @@ def render_template(document_type: str, metadata: Dict[str, str]) -> str:
     date = m.get("date", m.get("ngay", "[ngày/tháng/năm]"))
     name = m.get("name", m.get("ten", "[Họ và tên]") )
     address = m.get("address", m.get("dia_chi", "[Địa chỉ]") )
+    id_number = m.get("id_number", m.get("cccd", "[Số CCCD/Hộ chiếu]"))
+    # Phần ký: rule "missing_signature" của Risk Checker cần thấy "(Ký và ghi rõ họ tên)"
+    sign = "(Ký và ghi rõ họ tên)"
 
     if document_type == "Đơn Khiếu Nại":
         subject = m.get("subject", "Về việc ...")
@@ -23,12 +89,13 @@ def render_template(document_type: str, metadata: Dict[str, str]) -> str:
             "ĐƠN KHIẾU NẠI\n\n"
             f"Kính gửi: {m.get('recipient','[Tên cơ quan/đơn vị]')}\n"
             f"Họ và tên: {name}\n"
+            f"Số CCCD/Hộ chiếu: {id_number}\n"
             f"Địa chỉ: {address}\n"
             f"Ngày: {date}\n\n"
             f"Nội dung khiếu nại: {subject}\n\n"
             f"Chi tiết: {details}\n\n"
             "Kính đề nghị cơ quan xem xét và giải quyết.\n\n"
-            f"Người khiếu nại\n{ name }")
+            f"Người khiếu nại\n{sign}\n{ name }")
 
     if document_type == "Hợp Đồng Thuê Nhà":
         landlord = m.get("landlord", "[Bên cho thuê]")
@@ -36,17 +103,22 @@ def render_template(document_type: str, metadata: Dict[str, str]) -> str:
         rent = m.get("rent", "[Số tiền thuê]")
         duration = m.get("duration", "[Thời hạn thuê]")
         address_house = m.get("property_address", "[Địa chỉ nhà]")
+        terms = m.get("terms", "1. Mục đích sử dụng\n2. Thanh toán\n3. Quyền và nghĩa vụ của các bên")
+        landlord_id = m.get("landlord_id", "[Số CCCD/Hộ chiếu]")
+        tenant_id = m.get("tenant_id", "[Số CCCD/Hộ chiếu]")
         return (
             "CỘNG HÒA XÃ HỘI CHỦ NGHĨA VIỆT NAM\n"
             "Độc lập - Tự do - Hạnh phúc\n\n"
             "HỢP ĐỒNG THUÊ NHÀ\n\n"
-            f"Bên cho thuê: {landlord}\n"
-            f"Bên thuê: {tenant}\n"
+            f"Hôm nay, ngày {date}, chúng tôi gồm:\n"
+            f"Bên cho thuê: {landlord}, số CCCD/Hộ chiếu: {landlord_id}\n"
+            f"Bên thuê: {tenant}, số CCCD/Hộ chiếu: {tenant_id}\n"
             f"Địa chỉ bất động sản: {address_house}\n"
             f"Giá thuê: {rent}\n"
             f"Thời hạn: {duration}\n\n"
-            "Các điều khoản: \n1. Mục đích sử dụng\n2. Thanh toán\n3. Quyền và nghĩa vụ của các bên\n\n"
-            "Ký: \nBên cho thuê:\nBên thuê:")
+            f"Các điều khoản: \n{terms}\n\n"
+            f"BÊN CHO THUÊ\n{sign}\n{landlord}\n\n"
+            f"BÊN THUÊ\n{sign}\n{tenant}")
 
     if document_type == "Đơn xin Việc":
         position = m.get("position", "[Vị trí ứng tuyển]")
@@ -60,13 +132,15 @@ def render_template(document_type: str, metadata: Dict[str, str]) -> str:
             "ĐƠN XIN VIỆC\n\n"
             f"Kính gửi: {company}\n"
             f"Họ và tên: {name}\n"
+            f"Số CCCD/Hộ chiếu: {id_number}\n"
             f"Địa chỉ: {address}\n"
             f"Vị trí ứng tuyển: {position}\n"
             f"Trình độ: {education}\n"
             f"Kỹ năng: {skills}\n\n"
             f"Nội dung: {content}\n\n"
             "Kính mong Nhà tuyển dụng xem xét.\n\n"
-            f"Người làm đơn\n{ name }")
+            f"Ngày {date}\n"
+            f"Người làm đơn\n{sign}\n{ name }")
 
     if document_type == "Đơn tố cáo":
         accused = m.get("accused", "[Người/bên bị tố cáo]")
@@ -78,12 +152,14 @@ def render_template(document_type: str, metadata: Dict[str, str]) -> str:
             "ĐƠN TỐ CÁO\n\n"
             f"Kính gửi: {m.get('recipient','[Tên cơ quan/đơn vị]')}\n"
             f"Người tố cáo: {name}\n"
+            f"Số CCCD/Hộ chiếu: {id_number}\n"
             f"Địa chỉ: {address}\n\n"
             f"Nội dung tố cáo liên quan đến: {accused}\n"
             f"Sự việc: {incident}\n"
             f"Chứng cứ: {evidence}\n\n"
             "Kính đề nghị cơ quan chức năng làm rõ và xử lý theo quy định pháp luật.\n\n"
-            f"Người tố cáo\n{ name }")
+            f"Ngày {date}\n"
+            f"Người tố cáo\n{sign}\n{ name }")
 
     # Default generic document
     return (
@@ -93,4 +169,5 @@ def render_template(document_type: str, metadata: Dict[str, str]) -> str:
         f"Người/Đơn vị: {name}\n"
         f"Địa chỉ: {address}\n"
         f"Nội dung: {m.get('content','[Nội dung]')}\n\n"
-        f"Ký: {name}")
+        f"Ngày {date}\n"
+        f"{sign}\n{name}")
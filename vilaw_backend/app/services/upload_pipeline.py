@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import mmap
+import os
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Iterator, Optional
+from fastapi import UploadFile
+from app.core.config import settings
+from app.core.exceptions import UploadRejected
+
+IMAGE_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+
+
+@dataclass
+class StoredUpload:
+    """File upload đã nằm trên đĩa, kèm sha256 tính trong cùng lượt ghi."""
+    path: str
+    filename: str
+    content_type: Optional[str]
+    size: int
+    sha256: str
+    temporary: bool = False
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.filename)[1].lower()
+
+    def open(self) -> BinaryIO:
+        return open(self.path, "rb")
+
+    @contextmanager
+    def mmap(self) -> Iterator[memoryview]:
+        """View chỉ đọc trên file (không copy vào RAM); không dùng view sau khi thoát context."""
+        with open(self.path, "rb") as f:
+            if self.size == 0:
+                yield memoryview(b"")
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    yield view
+                finally:
+                    view.release()
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """Bỏ phần thư mục trong tên file client gửi lên (tránh ghi ra ngoài thư mục upload)."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    return name or "upload"
+
+
+def check_upload(file: UploadFile, max_bytes: int = None, extensions: Iterable[str] = None):
+    """Kiểm tra sớm (trước khi copy) định dạng và dung lượng khai báo của file."""
+    max_bytes = max_bytes or settings.UPLOAD_MAX_BYTES
+    if extensions is not None:
+        ext = os.path.splitext(file.filename or "")[1].lower()
+        if ext not in extensions:
+            raise UploadRejected(415, f"Định dạng {ext or '(không có)'} không được hỗ trợ. Chỉ nhận: {', '.join(sorted(extensions))}")
+    if file.size is not None and file.size > max_bytes:
+        raise UploadRejected(413, f"File vượt quá dung lượng cho phép ({max_bytes // (1024 * 1024)}MB)")
+
+
+def _copy_to_disk(source: BinaryIO, dest_path: str, max_bytes: int, chunk_size: int):
+    """Copy từng chunk + cập nhật sha256; ghi vào file tạm rồi đổi tên (không để lại file dở)."""
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    tmp_path = f"{dest_path}.{uuid.uuid4().hex}.part"
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        source.seek(0)
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(413, f"File vượt quá dung lượng cho phép ({max_bytes // (1024 * 1024)}MB)")
+                hasher.update(chunk)
+                out.write(chunk)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return size, hasher.hexdigest()
+
+
+async def receive_upload(
+    file: UploadFile,
+    dest_path: str = None,
+    max_bytes: int = None,
+    extensions: Iterable[str] = None,
+) -> StoredUpload:
+    """
+    Ghi UploadFile ra đĩa theo chunk (UPLOAD_CHUNK_SIZE) trong thread, tính sha256 cùng lượt.
+    Không có `dest_path` => file tạm trong UPLOAD_TMP_DIR, caller gọi `remove()` khi xong.
+    Raise UploadRejected (413/415).
+    """
+    max_bytes = max_bytes or settings.UPLOAD_MAX_BYTES
+    check_upload(file, max_bytes, extensions)
+    filename = safe_filename(file.filename)
+    temporary = dest_path is None
+    if temporary:
+        dest_path = os.path.join(settings.UPLOAD_TMP_DIR, f"{uuid.uuid4().hex}{os.path.splitext(filename)[1].lower()}")
+    size, sha256 = await asyncio.to_thread(_copy_to_disk, file.file, dest_path, max_bytes, settings.UPLOAD_CHUNK_SIZE)
+    return StoredUpload(
+        path=dest_path,
+        filename=filename,
+        content_type=file.content_type,
+        size=size,
+        sha256=sha256,
+        temporary=temporary,
+    )
+
+
+def sha256_file(path: str, chunk_size: int = None) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size or settings.UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
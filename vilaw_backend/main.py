@@ -1,40 +1,95 @@
 import os
+import asyncio
 import uvicorn
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from app.core.admission import ADMISSION_ROUTES, AdmissionMiddleware
+from app.core.config import settings
+from app.core.metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware
+from app.core.security import require_admin
+from app.core.tracing import TracingMiddleware
 
 # Import các router
-from app.api.v1 import chat, contracts, documents, procedures, upload, db_viewer
+from app.api.v1 import chat, contracts, documents, procedures, upload, db_viewer, jobs, artifacts, diagnostics
+
+
+def _warm_up():
+    """Nạp trước tài nguyên nặng (index BM25, LLM client, template DOCX) để request đầu tiên không phải chờ."""
+    # Pre-initialize RAG resources once per process to avoid lazy re-init on every request
+    try:
+        from app.services.rag_service import RAGService
+        RAGService._init_resources()
+        print("RAGService resources pre-initialized.")
+    except Exception as e:
+        print(f"Warning: RAGService init skipped: {e}")
+    # Dựng sẵn template DOCX (styles nén một lần) cho request soạn thảo đầu tiên
+    try:
+        from app.services.docx_renderer import warm_up
+        warm_up()
+    except Exception as e:
+        print(f"Warning: DOCX template warm-up skipped: {e}")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Logic khi server khởi động
     print("--- Server Starting ---")
+    warmup_task = None
     try:
         from app.db.init import init_db
 
         init_db()
         print("Database connection initialized.")
-        # Pre-initialize RAG resources once per process to avoid lazy re-init on every request
-        try:
-            from app.services.rag_service import RAGService
-            RAGService._init_resources()
-            print("RAGService resources pre-initialized.")
-        except Exception as e:
-            print(f"Warning: RAGService init skipped: {e}")
+        # background: server nhận request ngay, warm-up chạy trong thread; blocking: chờ warm-up xong mới nhận request
+        if settings.STARTUP_WARMUP == "background":
+            warmup_task = asyncio.create_task(asyncio.to_thread(_warm_up))
+        elif settings.STARTUP_WARMUP == "blocking":
+            _warm_up()
     except Exception as e:
         print(f"WARNING: Database initialization failed: {e}")
 
+    # Worker job nền chạy chung process (môi trường 1 process); production chạy `python worker.py`
+    worker, worker_task = None, None
+    if settings.JOB_INPROCESS_WORKER:
+        from app.services.job_queue import JobWorker
+        worker = JobWorker()
+        worker_task = asyncio.create_task(worker.run())
+
+    # Dọn kho file sinh ra (TTL + quota)
+    from app.services.artifact_store import ArtifactStore
+    sweeper_task = asyncio.create_task(ArtifactStore().run_sweeper())
+
     yield
     # Shutdown
-    pass
+    sweeper_task.cancel()
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    try:
+        from app.services.conversation_store import ConversationStore
+        await ConversationStore().flush()
+    except Exception as e:
+        print(f"Warning: conversation flush failed: {e}")
+    if worker is not None:
+        worker.stop()
+        worker_task.cancel()
+    try:
+        from app.services.pdf_ingest import PdfIngestService
+        PdfIngestService().shutdown()
+    except Exception as e:
+        print(f"Warning: PDF ingest shutdown failed: {e}")
 
 app = FastAPI(title="ViLaw Backend API", version="1.0", lifespan=lifespan)
 
 
+# Admission control cho các endpoint nặng (thêm trước CORS để response 429/503 vẫn có CORS headers)
+app.add_middleware(AdmissionMiddleware)
+# Đo ngoài admission control: latency gồm cả thời gian chờ slot, request bị 429/503 cũng được đếm
+app.add_middleware(MetricsMiddleware, known_paths=ADMISSION_ROUTES.keys())
+# Span gốc của mỗi request (trace_id ở header X-Trace-Id), log request chậm, profile theo lệnh admin
+app.add_middleware(TracingMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -42,6 +97,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Conversation-Id", "X-Next-Cursor", "X-Trace-Id"],
 )
 
 
@@ -51,6 +107,9 @@ app.include_router(documents.router, prefix="/api/v1/documents", tags=["Document
 app.include_router(procedures.router, prefix="/api/v1/procedures", tags=["Procedures"])
 app.include_router(upload.router, prefix="/api/v1", tags=["Upload"])
 app.include_router(db_viewer.router, prefix="/api/v1", tags=["DB Viewer"])
+app.include_router(jobs.router, prefix="/api/v1/jobs", tags=["Jobs"])
+app.include_router(artifacts.router, prefix="/api/v1/artifacts", tags=["Artifacts"])
+app.include_router(diagnostics.router, prefix="/api/v1/diagnostics", tags=["Diagnostics"], dependencies=[Depends(require_admin)])
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -64,6 +123,13 @@ def health_check():
     return {"status": "ok", "message": "ViLaw Server is running on Render"}
 
 
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        """Metrics dạng text của Prometheus; mỗi worker (serve_prefork.py) có bộ đếm riêng."""
+        return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 if __name__ == "__main__":
     # Render sẽ cung cấp PORT qua biến môi trường. Nếu không có (chạy local), dùng 8000
     port = int(os.environ.get("PORT", 8000))
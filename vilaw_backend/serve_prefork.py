@@ -0,0 +1,310 @@
+"""
+Chạy API với nhiều worker theo mô hình pre-fork: process master nạp index BM25 (snapshot RAG),
+LLM client và template DOCX một lần, `gc.freeze()` rồi fork các worker uvicorn dùng chung socket.
+Worker đọc index qua trang bộ nhớ copy-on-write của master thay vì mỗi worker tự build/nạp một bản.
+
+- Giám sát: mỗi worker gửi heartbeat từ event loop (callback_notify của uvicorn) qua pipe;
+  worker chết được fork lại, worker treo quá PREFORK_WORKER_TIMEOUT bị kill rồi fork lại.
+- Nạp lại index: `kill -HUP <master>` (hoặc tự động khi job rag_refresh ghi snapshot mới) => master nạp
+  snapshot mới, freeze lại rồi thay lần lượt từng worker (worker mới sẵn sàng mới tắt êm một worker cũ).
+- SIGTERM/SIGINT: tắt êm mọi worker (chờ request đang chạy tối đa PREFORK_GRACEFUL_TIMEOUT giây).
+- Trạng thái theo request nằm trong DB dùng chung (job batch/OCR qua hàng đợi job, artifact, hội thoại:
+  ConversationStore tắt cache/ghi sau trong worker); RequestScheduler chia giới hạn cho số worker.
+  Không chạy với DB trong RAM (mỗi worker một DB riêng).
+
+Usage:
+  python serve_prefork.py                           # PREFORK_WORKERS worker, cổng $PORT (mặc định 8000)
+  python serve_prefork.py --workers 4 --port 8000
+  kill -HUP <pid master>                            # nạp lại index
+Chỉ chạy trên Linux/macOS (cần os.fork).
+"""
+import argparse
+import gc
+import os
+import select
+import signal
+import socket
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import uvicorn
+
+from app.core.config import settings
+
+
+@dataclass
+class WorkerProcess:
+    pid: int
+    generation: int
+    beat_fd: int
+    started_at: float
+    last_beat: Optional[float] = None   # None: chưa sẵn sàng (lifespan chưa xong)
+    stopping_at: Optional[float] = None
+
+
+class PreforkMaster:
+    def __init__(self, app, host: str, port: int, workers: int):
+        self.app = app
+        self.workers_count = workers
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(2048)
+        self.sock.set_inheritable(True)
+        self.workers: Dict[int, WorkerProcess] = {}
+        self.generation = 0
+        self.next_spawn_at = 0.0
+        self.spawn_backoff = 0.5
+        self.reload_requested = False
+        self.shutdown_requested = False
+
+    # --- Tài nguyên dùng chung ---
+
+    def load_shared_state(self):
+        """Nạp mọi thứ worker sẽ dùng chung rồi đóng băng heap để GC không chạm vào (tránh copy-on-write)."""
+        from app.db.init import init_db
+        from app.db.session import engine
+        from app.services.conversation_store import ConversationStore
+        from app.services.docx_renderer import warm_up
+        from app.services.rag_service import RAGService
+        from app.services.scheduler import RequestScheduler
+
+        started = time.perf_counter()
+        init_db()
+        RAGService._init_resources()
+        RAGService.auto_reload = False
+        # Worker khác nhau phục vụ cùng một hội thoại => đọc/ghi thẳng DB; admission chia giới hạn theo worker
+        ConversationStore.cache_enabled = False
+        RequestScheduler.processes = self.workers_count
+        warm_up()
+        # Connection SQLite không được dùng chung qua fork
+        engine.dispose()
+        self._freeze()
+        print(f"Prefork master: đã nạp index ({len(RAGService._doc_texts)} văn bản) trong "
+              f"{time.perf_counter() - started:.1f}s")
+
+    def reload_shared_state(self) -> bool:
+        from app.services.rag_service import RAGService
+
+        gc.unfreeze()
+        try:
+            if not RAGService._load_snapshot():
+                RAGService.build_snapshot()
+                RAGService._load_snapshot()
+        except Exception as e:
+            print(f"Prefork master: nạp lại index lỗi, giữ worker hiện tại: {e}")
+            self._freeze()
+            return False
+        self._freeze()
+        self.generation += 1
+        print(f"Prefork master: index mới ({len(RAGService._doc_texts)} văn bản), thay worker sang thế hệ {self.generation}")
+        return True
+
+    @staticmethod
+    def _freeze():
+        gc.collect()
+        gc.freeze()
+
+    def _snapshot_changed(self) -> bool:
+        from app.services.rag_service import RAGService
+
+        try:
+            return os.path.getmtime(settings.RAG_SNAPSHOT_PATH) != RAGService._snapshot_mtime
+        except OSError:
+            return False
+
+    # --- Worker ---
+
+    def spawn(self):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            for worker in self.workers.values():
+                os.close(worker.beat_fd)
+            code = 0
+            try:
+                self._run_worker(write_fd)
+            except BaseException as e:
+                print(f"Prefork worker {os.getpid()}: lỗi {e!r}")
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(write_fd)
+        os.set_blocking(read_fd, False)
+        self.workers[pid] = WorkerProcess(pid, self.generation, read_fd, time.monotonic())
+        print(f"Prefork master: fork worker {pid} (thế hệ {self.generation})")
+
+    def _run_worker(self, beat_fd: int):
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        os.set_blocking(beat_fd, False)
+        master_pid = os.getppid()
+        # Warm-up đã làm ở master
+        settings.STARTUP_WARMUP = "off"
+
+        server = None
+
+        async def heartbeat():
+            if os.getppid() != master_pid:
+                server.should_exit = True  # master đã chết
+                return
+            try:
+                os.write(beat_fd, b".")
+            except BlockingIOError:
+                pass
+            except BrokenPipeError:
+                server.should_exit = True
+
+        config = uvicorn.Config(
+            self.app,
+            lifespan="on",
+            callback_notify=heartbeat,
+            timeout_notify=settings.PREFORK_HEARTBEAT_INTERVAL,
+            timeout_graceful_shutdown=settings.PREFORK_GRACEFUL_TIMEOUT,
+        )
+        server = uvicorn.Server(config)
+        server.run(sockets=[self.sock])
+
+    def stop_worker(self, worker: WorkerProcess, sig=signal.SIGTERM):
+        if worker.stopping_at is None:
+            worker.stopping_at = time.monotonic()
+        try:
+            os.kill(worker.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    # --- Vòng lặp giám sát ---
+
+    def _read_heartbeats(self, timeout: float):
+        fds = {w.beat_fd: w for w in self.workers.values()}
+        try:
+            readable, _, _ = select.select(list(fds), [], [], timeout)
+        except InterruptedError:
+            return
+        now = time.monotonic()
+        for fd in readable:
+            try:
+                data = os.read(fd, 1024)
+            except BlockingIOError:
+                continue
+            if data:
+                fds[fd].last_beat = now
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker.beat_fd)
+            if worker.stopping_at is None:
+                print(f"Prefork master: worker {pid} thoát bất thường (status {status}), fork lại")
+                if worker.last_beat is None:
+                    # Chết ngay lúc khởi động => lùi thời gian fork lại, tránh vòng lặp fork liên tục
+                    self.next_spawn_at = time.monotonic() + self.spawn_backoff
+                    self.spawn_backoff = min(self.spawn_backoff * 2, 30)
+
+    def _check_timeouts(self):
+        now = time.monotonic()
+        for worker in list(self.workers.values()):
+            if worker.stopping_at is not None:
+                if now - worker.stopping_at > settings.PREFORK_GRACEFUL_TIMEOUT + 5:
+                    self.stop_worker(worker, signal.SIGKILL)
+                continue
+            last_seen = worker.last_beat if worker.last_beat is not None else worker.started_at
+            if now - last_seen > settings.PREFORK_WORKER_TIMEOUT:
+                print(f"Prefork master: worker {worker.pid} không có heartbeat {now - last_seen:.0f}s, kill")
+                self.stop_worker(worker, signal.SIGKILL)
+
+    def _maintain(self):
+        """Giữ đủ worker; khi có thế hệ mới thì thay từng worker: worker mới sẵn sàng mới tắt một worker cũ."""
+        live = [w for w in self.workers.values() if w.stopping_at is None]
+        booting = [w for w in live if w.last_beat is None]
+        old = sorted((w for w in live if w.generation < self.generation), key=lambda w: w.started_at)
+        if booting:
+            return
+        self.spawn_backoff = 0.5
+        if old and len(live) > self.workers_count:
+            print(f"Prefork master: tắt êm worker {old[0].pid} (thế hệ {old[0].generation})")
+            self.stop_worker(old[0])
+        elif (old or len(live) < self.workers_count) and time.monotonic() >= self.next_spawn_at:
+            self.spawn()
+
+    def _request_reload(self, *_):
+        self.reload_requested = True
+
+    def _request_shutdown(self, *_):
+        self.shutdown_requested = True
+
+    def run(self):
+        signal.signal(signal.SIGHUP, self._request_reload)
+        signal.signal(signal.SIGTERM, self._request_shutdown)
+        signal.signal(signal.SIGINT, self._request_shutdown)
+        print(f"Prefork master {os.getpid()}: {self.workers_count} worker trên {self.sock.getsockname()}")
+
+        last_watch = time.monotonic()
+        while not self.shutdown_requested:
+            self._read_heartbeats(timeout=0.5)
+            self._reap()
+            if self.shutdown_requested:
+                break
+            if settings.PREFORK_WATCH_SNAPSHOT and time.monotonic() - last_watch > 5:
+                last_watch = time.monotonic()
+                self.reload_requested = self.reload_requested or self._snapshot_changed()
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload_shared_state()
+            self._check_timeouts()
+            self._maintain()
+
+        self.shutdown()
+
+    def shutdown(self):
+        print("Prefork master: tắt các worker...")
+        for worker in self.workers.values():
+            self.stop_worker(worker)
+        deadline = time.monotonic() + settings.PREFORK_GRACEFUL_TIMEOUT + 5
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for worker in self.workers.values():
+            self.stop_worker(worker, signal.SIGKILL)
+        self.sock.close()
+
+
+def _in_memory_database(url: str) -> bool:
+    return url.startswith("sqlite") and (url.rstrip("/") in ("sqlite:", "sqlite://") or ":memory:" in url
+                                         or "mode=memory" in url)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=settings.PREFORK_WORKERS)
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("serve_prefork.py cần os.fork (Linux/macOS); trên Windows dùng `python main.py`.")
+    if _in_memory_database(settings.DATABASE_URL):
+        sys.exit("serve_prefork.py cần DATABASE_URL dùng chung giữa các worker (job, hội thoại, artifact); "
+                 "DB SQLite trong RAM là riêng của từng process.")
+
+    from main import app
+
+    master = PreforkMaster(app, args.host, args.port, args.workers)
+    master.load_shared_state()
+    master.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Benchmark renderer DOCX (app/services/docx_renderer.py) so với cách dựng bằng python-docx cũ.
+
+Bản cũ (`legacy_render` bên dưới, giữ nguyên logic _save_docx trước đây) tạo Document mới cho
+mỗi văn bản, thêm từng đoạn/run và nén lại toàn bộ package (styles.xml ~800KB) mỗi lần.
+Script in ms/văn bản và số văn bản/giây cho từng độ dài hợp đồng, chạy tuần tự và song song
+nhiều thread, đồng thời kiểm tra file mới mở lại được bằng python-docx với cùng định dạng.
+
+Usage:
+  python tools/bench_docx_render.py --iterations 50
+  python tools/bench_docx_render.py --clauses 10 50 200 --threads 4
+"""
+import argparse
+import io
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from docx import Document  # noqa: E402
+from docx.enum.text import WD_ALIGN_PARAGRAPH  # noqa: E402
+from docx.shared import Pt  # noqa: E402
+
+from app.services.docx_renderer import render_docx, warm_up  # noqa: E402
+
+HEADER = (
+    "CỘNG HÒA XÃ HỘI CHỦ NGHĨA VIỆT NAM\n"
+    "Độc lập - Tự do - Hạnh phúc\n\n"
+    "HỢP ĐỒNG THUÊ NHÀ\n\n"
+    "Căn cứ Bộ luật Dân sự 2015;\n"
+    "Bên A: Nguyễn Văn A, CCCD số 001099000001\n"
+    "Bên B: Trần Thị B, CCCD số 001099000002\n"
+)
+CLAUSE = (
+    "Điều {n}: Quyền và nghĩa vụ\n"
+    "Các bên có trách nhiệm thực hiện đúng các cam kết đã thoả thuận trong hợp đồng này, "
+    "bảo mật thông tin và phối hợp giải quyết phát sinh trên tinh thần thiện chí & hợp tác <tốt>.\n"
+)
+FOOTER = "ĐẠI DIỆN BÊN A\nĐẠI DIỆN BÊN B\n"
+
+
+def build_content(clauses: int) -> str:
+    return HEADER + "".join(CLAUSE.format(n=i) for i in range(1, clauses + 1)) + FOOTER
+
+
+def legacy_render(content: str) -> bytes:
+    doc = Document()
+    style = doc.styles['Normal']
+    style.font.name = 'Times New Roman'
+    style.font.size = Pt(12)
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        p = doc.add_paragraph()
+        run = p.add_run(line)
+        run.font.name = 'Times New Roman'
+        if "CỘNG HÒA XÃ HỘI" in line.upper():
+            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            run.bold = True
+            run.font.size = Pt(13)
+        elif "Độc lập" in line and "Tự do" in line:
+            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            run.bold = True
+            run.font.size = Pt(13)
+        elif len(line) < 100 and line.isupper() and "ĐIỀU" not in line:
+            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            run.bold = True
+            run.font.size = Pt(14)
+            p.paragraph_format.space_before = Pt(12)
+            p.paragraph_format.space_after = Pt(12)
+        elif re.match(r"^(Điều|Khoản)\s+\d+[:\.]", line, re.IGNORECASE):
+            run.bold = True
+            p.paragraph_format.space_before = Pt(6)
+        elif line.startswith("Bên A") or line.startswith("Bên B") or line.startswith("ĐẠI DIỆN"):
+            run.bold = True
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def summarize(data: bytes) -> list:
+    """(text, in đậm, căn giữa, cỡ chữ) của từng đoạn — để so kết quả hai renderer."""
+    doc = Document(io.BytesIO(data))
+    rows = []
+    for p in doc.paragraphs:
+        run = p.runs[0]
+        size = run.font.size.pt if run.font.size else None
+        rows.append((p.text, bool(run.bold), p.alignment == WD_ALIGN_PARAGRAPH.CENTER, size))
+    return rows
+
+
+def bench(render, content: str, iterations: int, threads: int):
+    start = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(threads) as pool:
+            sizes = list(pool.map(lambda _: len(render(content)), range(iterations)))
+    else:
+        sizes = [len(render(content)) for _ in range(iterations)]
+    elapsed = time.perf_counter() - start
+    return elapsed / iterations * 1000, iterations / elapsed, sizes[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--clauses", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    warm_up()
+    sample = build_content(5)
+    if summarize(render_docx(sample)) != summarize(legacy_render(sample)):
+        sys.exit("Kết quả renderer mới khác bản cũ (text/in đậm/căn giữa/cỡ chữ)")
+    print("Kiểm tra: định dạng các đoạn khớp với bản python-docx cũ")
+
+    print(f"{'điều':>6} {'renderer':>10} {'ms/văn bản':>11} {'văn bản/s':>10} {'KB':>7}")
+    for clauses in args.clauses:
+        content = build_content(clauses)
+        results = {}
+        for name, render in (("legacy", legacy_render), ("new", render_docx)):
+            ms, per_sec, size = bench(render, content, args.iterations, args.threads)
+            results[name] = per_sec
+            print(f"{clauses:>6} {name:>10} {ms:>11.2f} {per_sec:>10.1f} {size / 1024:>7.1f}")
+        print(f"{'':>6} {'speedup':>10} {results['new'] / results['legacy']:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Benchmark pipeline OCR (OCRService.process_bytes) với model Gemini giả lập.
+
+Model stub mô phỏng chi phí upstream: thời gian = --base-ms + payload / --bandwidth-mbps,
+nên đo được ảnh hưởng của bước tiền xử lý ảnh (app/services/image_preprocess.py) lên
+latency end-to-end mà không cần gọi API thật. So sánh OCR_PREPROCESS tắt / bật.
+
+Mặc định sinh ảnh chụp giả lập 4000x3000 (~12MP) có chữ và nhiễu; có thể truyền ảnh thật.
+DB SQLite được tạo trong thư mục tạm nên không ảnh hưởng vilaw_db.sqlite3.
+
+Usage:
+  python tools/bench_ocr_pipeline.py --iterations 5
+  python tools/bench_ocr_pipeline.py --image samples/hop_dong.jpg --bandwidth-mbps 20
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubModel:
+    """Thay cho genai.GenerativeModel: ngủ theo kích thước payload rồi trả JSON cố định."""
+
+    def __init__(self, base_ms: float, bandwidth_mbps: float):
+        self.base_ms = base_ms
+        self.bandwidth_mbps = bandwidth_mbps
+        self.payload_bytes = []
+
+    def generate_content(self, parts):
+        image = parts[1]
+        if isinstance(image, dict):
+            size = len(image["data"])
+        else:
+            buffer = io.BytesIO()
+            image.save(buffer, format=image.format or "PNG")  # SDK tự encode PIL.Image trước khi gửi
+            size = buffer.tell()
+        self.payload_bytes.append(size)
+        time.sleep(self.base_ms / 1000 + size * 8 / (self.bandwidth_mbps * 1_000_000))
+        return StubResponse(json.dumps({
+            "document_type": "Hợp đồng",
+            "entities": [{"role": "Bên A", "name": "Công ty ABC"}],
+            "clauses": [{"number": "1", "text": "Điều khoản mẫu"}],
+            "handwritten_notes": "",
+        }, ensure_ascii=False))
+
+
+def build_sample_image() -> bytes:
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(0)
+    image = Image.new("RGB", (4000, 3000), (236, 230, 218))
+    draw = ImageDraw.Draw(image)
+    for y in range(120, 2900, 60):
+        line = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz ") for _ in range(120))
+        draw.text((150, y), line, fill=(30, 30, 40))
+    # Nhiễu hạt như ảnh chụp điện thoại => JPEG lớn giống thực tế
+    noise = Image.effect_noise((4000, 3000), 24).convert("RGB")
+    image = Image.blend(image, noise, 0.15)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+async def run_case(service, model, content: bytes, iterations: int, label: str):
+    timings = []
+    model.payload_bytes.clear()
+    for i in range(iterations):
+        # Thêm byte cuối khác nhau để sha256 khác nhau => không trúng cache dedup
+        payload = content + f"bench-{label}-{i}-{time.time_ns()}".encode()
+        start = time.perf_counter()
+        result = await service.process_bytes(payload, f"bench_{i}.jpg", "image/jpeg")
+        timings.append((time.perf_counter() - start) * 1000)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+    return {
+        "mean_ms": statistics.mean(timings),
+        "p95_ms": max(timings) if len(timings) < 20 else sorted(timings)[int(len(timings) * 0.95) - 1],
+        "payload_kb": statistics.mean(model.payload_bytes) / 1024,
+    }
+
+
+async def bench(args, content: bytes):
+    from app.core.config import settings
+    from app.db.init import init_db
+    from app.services.ocr_service import OCRService
+
+    init_db()
+    service = OCRService()
+    model = StubModel(args.base_ms, args.bandwidth_mbps)
+    service.model = model
+
+    print(f"Input: {len(content) / 1024:.0f} KB, base {args.base_ms:g} ms, bandwidth {args.bandwidth_mbps:g} Mbps")
+    print(f"{'case':>14}{'mean ms':>10}{'p95 ms':>10}{'payload KB':>12}")
+    results = {}
+    for label, enabled in (("raw", False), ("preprocess", True)):
+        settings.OCR_PREPROCESS = enabled
+        results[label] = await run_case(service, model, content, args.iterations, label)
+        r = results[label]
+        print(f"{label:>14}{r['mean_ms']:>10.0f}{r['p95_ms']:>10.0f}{r['payload_kb']:>12.0f}")
+
+    stats = OCRService.preprocess_stats
+    if stats["images"]:
+        print(f"Preprocess: {stats['total_ms'] / stats['images']:.0f} ms/ảnh, "
+              f"{stats['original_bytes'] / 1024 / stats['images']:.0f} KB -> "
+              f"{stats['processed_bytes'] / 1024 / stats['images']:.0f} KB")
+    print(f"Speedup: {results['raw']['mean_ms'] / results['preprocess']['mean_ms']:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", default=None, help="Ảnh đầu vào (mặc định sinh ảnh 12MP giả lập)")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--base-ms", type=float, default=800, help="Thời gian xử lý cố định của model")
+    parser.add_argument("--bandwidth-mbps", type=float, default=10, help="Băng thông upload giả lập")
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            content = f.read()
+    else:
+        content = build_sample_image()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # DATABASE_URL là đường dẫn tương đối
+        asyncio.run(bench(args, content))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Benchmark bộ rule pre-screen của Risk Checker (app/services/risk_rules.py).
+
+Sinh hợp đồng giả lập với số điều khoản khác nhau, chạy RiskRuleEngine.evaluate nhiều lần
+và in thời gian trung bình / p95 / số văn bản mỗi giây. Đồng thời kiểm tra nhanh rằng các
+rule chính vẫn bắt được lỗi trên văn bản mẫu, và mọi template của Drafter (app/services/templates.py)
+điền đủ thông tin bắt buộc không bị rule nào bắn (Drafter rà soát template bằng screening="fast").
+
+Usage:
+  python tools/bench_risk_rules.py --iterations 200
+  python tools/bench_risk_rules.py --rules path/to/custom_rules.json
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.risk_rules import RiskRuleEngine  # noqa: E402
+from app.services.templates import TEMPLATE_SPECS, render_template  # noqa: E402
+
+
+SAMPLE = (
+    "HỢP ĐỒNG LAO ĐỘNG\n"
+    "Bên A: Công ty TNHH ABC\n"
+    "Bên B: Nguyễn Văn A\n"
+    "Điều 1: Lương. Bên A trả cho bên B mức lương 2 triệu đồng/tháng.\n"
+    "Điều 2: Thời gian làm việc 12 tiếng/ngày, kể cả thứ bảy và chủ nhật.\n"
+    "Điều 3: Thời gian thử việc 3 tháng.\n"
+    "Điều 4: Nếu Bên B nghỉ việc trước hạn phải nộp phạt 50% tổng lương đã nhận.\n"
+)
+EXPECTED = {
+    "missing_signature", "missing_date", "missing_party_identification",
+    "minimum_wage_millions", "working_hours_daily", "probation_months", "labor_monetary_penalty",
+}
+# Câu hợp lệ không được làm rule bắn nhầm: (văn bản, loại hợp đồng, rule không được bắn)
+FALSE_POSITIVES = [
+    ("Thời giờ làm việc từ 8 giờ đến 17 giờ mỗi ngày.", "Hợp đồng lao động", "working_hours_daily"),
+    ("Mức lương 25.000 đồng/giờ, trả vào cuối tháng.", "Hợp đồng lao động", "minimum_wage_vnd"),
+    ("Tiền lương 300.000 đồng mỗi ngày công.", "Hợp đồng lao động", "minimum_wage_vnd"),
+    ("Bên thuê chậm trả tiền thuê bị phạt 100% tiền thuê tháng đó.", "Hợp đồng thuê nhà", "commercial_penalty_cap"),
+    ("Người sử dụng lao động không được phạt tiền, cắt lương thay cho việc xử lý kỷ luật lao động.",
+     "Hợp đồng lao động", "labor_monetary_penalty"),
+]
+EXTRA_EXPECTED = [
+    ("Người lao động làm việc 10 giờ/ngày.", "Hợp đồng lao động", "working_hours_daily"),
+    ("Bên mua chậm thanh toán bị phạt 20% giá trị đơn hàng.", "Hợp đồng mua bán hàng hoá", "commercial_penalty_cap"),
+]
+
+FILLER = (
+    "Điều {n}: Quyền và nghĩa vụ. Các bên có trách nhiệm thực hiện đúng các cam kết đã thoả thuận "
+    "trong hợp đồng này, bảo mật thông tin và phối hợp giải quyết phát sinh trên tinh thần thiện chí.\n"
+)
+FOOTER = "Hà Nội, ngày 01 tháng 02 năm 2025\nĐẠI DIỆN BÊN A (Ký, ghi rõ họ tên)\nĐẠI DIỆN BÊN B (Ký, ghi rõ họ tên)\n"
+
+
+def build_contract(clauses: int) -> str:
+    body = "".join(FILLER.format(n=i) for i in range(5, 5 + clauses))
+    return SAMPLE + body + FOOTER
+
+
+def template_findings(engine: RiskRuleEngine):
+    """Rule bắn trên template đã điền đủ trường bắt buộc (ngày mặc định như DrafterService)."""
+    findings = []
+    for name, spec in TEMPLATE_SPECS.items():
+        metadata = {key: f"[{key}]" for key in spec.required}
+        metadata["date"] = "01/02/2025"
+        fired = engine.evaluate(render_template(name, metadata), name).fired_rules
+        findings.extend(f"{rule_id} ({name})" for rule_id in fired)
+    return findings
+
+
+def bench(engine: RiskRuleEngine, content: str, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        engine.evaluate(content, "Hợp đồng lao động")
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) >= 20 else timings[-1]
+    return statistics.mean(timings), p95
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--rules", default=None, help="File rule JSON (mặc định theo settings.RISK_RULES_PATH)")
+    args = parser.parse_args()
+
+    load_start = time.perf_counter()
+    engine = RiskRuleEngine(args.rules) if args.rules else RiskRuleEngine()
+    print(f"Loaded {len(engine.rules)} rules in {(time.perf_counter() - load_start) * 1000:.2f} ms")
+
+    fired = set(engine.evaluate(SAMPLE, "Hợp đồng lao động").fired_rules)
+    missing = EXPECTED - fired
+    for text, contract_type, rule_id in EXTRA_EXPECTED:
+        if rule_id not in engine.evaluate(text, contract_type).fired_rules:
+            missing.add(f"{rule_id} ({text})")
+    false_positives = [f"{rule_id} ({text})" for text, contract_type, rule_id in FALSE_POSITIVES
+                       if rule_id in engine.evaluate(text, contract_type).fired_rules]
+    print(f"Sanity check: {'OK' if not missing else 'THIẾU ' + ', '.join(sorted(missing))}")
+    if false_positives:
+        print(f"Bắn nhầm: {', '.join(false_positives)}")
+    template_issues = template_findings(engine)
+    print(f"Templates: {'OK' if not template_issues else 'RULE BẮN ' + ', '.join(template_issues)}")
+
+    print(f"{'clauses':>8}{'chars':>10}{'mean ms':>10}{'p95 ms':>10}{'docs/s':>10}")
+    for clauses in (10, 50, 200, 1000):
+        content = build_contract(clauses)
+        mean, p95 = bench(engine, content, args.iterations)
+        print(f"{clauses:>8}{len(content):>10}{mean:>10.3f}{p95:>10.3f}{1000 / mean:>10.0f}")
+
+    if missing or false_positives or template_issues:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""Benchmark đọc/ghi đồng thời trên SQLite: profile mặc định cũ so với profile đã tinh chỉnh.
+
+- baseline: journal_mode mặc định (DELETE), synchronous=FULL, không có index user_procedures.user_id /
+  ocr_documents.created_at / chat_history.user_id (như DB cũ)
+- tuned: PRAGMA trong app/db/session.py (WAL, synchronous=NORMAL, busy_timeout, mmap, cache) + migration index
+
+Mỗi profile chạy trong process riêng trên DB tạm: seed dữ liệu, rồi các thread ghi (lưu OCR, cập nhật thủ tục)
+và thread đọc (/procedures/dashboard, /db/ocr-documents) chạy song song trong `--seconds` giây.
+
+Usage:
+  python tools/bench_sqlite.py
+  python tools/bench_sqlite.py --writers 4 --readers 8 --seconds 10
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NEW_INDEXES = ["ix_user_procedures_user_id", "ix_ocr_documents_created_at", "ix_chat_history_user_id"]
+
+
+def child(args):
+    sys.path.insert(0, ROOT)
+    from datetime import datetime, timedelta
+    from sqlalchemy import text
+    from app.db.init import init_db
+    from app.db.session import SessionLocal, engine
+    from app.db.models import OCRDocument, UserProcedure
+
+    init_db()
+    with engine.begin() as conn:
+        if args.profile == "baseline":
+            for name in NEW_INDEXES:
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        journal = conn.execute(text("PRAGMA journal_mode")).scalar()
+
+    db = SessionLocal()
+    start = datetime.utcnow() - timedelta(days=365)
+    db.bulk_insert_mappings(OCRDocument, [
+        {"filename": f"doc{i}.pdf", "ocr_text": "x" * 500, "created_at": start + timedelta(minutes=i)}
+        for i in range(args.seed_docs)
+    ])
+    db.bulk_insert_mappings(UserProcedure, [
+        {"user_id": i % args.users, "title": f"Thủ tục {i}", "status": "In Progress", "data": {"required_documents": []}}
+        for i in range(args.seed_procedures)
+    ])
+    db.commit()
+    db.close()
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    results = {"read": [], "write": [], "errors": 0}
+
+    def record(kind, started):
+        with lock:
+            results[kind].append((time.perf_counter() - started) * 1000)
+
+    def writer():
+        rnd = random.Random()
+        while not stop.is_set():
+            started = time.perf_counter()
+            session = SessionLocal()
+            try:
+                if rnd.random() < 0.5:
+                    session.add(OCRDocument(filename="new.png", ocr_text="y" * 2000, created_at=datetime.utcnow()))
+                else:
+                    session.query(UserProcedure).filter(UserProcedure.id == rnd.randint(1, args.seed_procedures)) \
+                        .update({"status": rnd.choice(["In Progress", "Done"])})
+                session.commit()
+                record("write", started)
+            except Exception:
+                session.rollback()
+                with lock:
+                    results["errors"] += 1
+            finally:
+                session.close()
+
+    def reader():
+        rnd = random.Random()
+        while not stop.is_set():
+            started = time.perf_counter()
+            session = SessionLocal()
+            try:
+                if rnd.random() < 0.5:
+                    session.query(UserProcedure.id, UserProcedure.title, UserProcedure.status) \
+                        .filter(UserProcedure.user_id == rnd.randrange(args.users)).all()
+                else:
+                    session.query(OCRDocument.id, OCRDocument.filename, OCRDocument.created_at) \
+                        .order_by(OCRDocument.created_at.desc()).limit(50).all()
+                record("read", started)
+            except Exception:
+                with lock:
+                    results["errors"] += 1
+            finally:
+                session.close()
+
+    threads = [threading.Thread(target=writer) for _ in range(args.writers)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    def summary(timings):
+        timings.sort()
+        if not timings:
+            return {"ops_per_sec": 0, "p50_ms": None, "p95_ms": None}
+        return {
+            "ops_per_sec": round(len(timings) / args.seconds, 1),
+            "p50_ms": round(timings[len(timings) // 2], 2),
+            "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+        }
+
+    print(json.dumps({
+        "profile": args.profile, "journal_mode": journal, "errors": results["errors"],
+        "read": summary(results["read"]), "write": summary(results["write"]),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=6)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--seed-docs", type=int, default=20000)
+    parser.add_argument("--seed-procedures", type=int, default=20000)
+    parser.add_argument("--profile", choices=["baseline", "tuned"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile:
+        child(args)
+        return
+
+    rows = []
+    for profile in ("baseline", "tuned"):
+        with tempfile.TemporaryDirectory() as workdir:
+            env = dict(
+                os.environ,
+                DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.sqlite3')}",
+                SQLITE_TUNED="true" if profile == "tuned" else "false",
+                DB_POOL_SIZE=str(args.writers + args.readers),
+                DB_SLOW_QUERY_MS="1000000",
+            )
+            cmd = [sys.executable, os.path.abspath(__file__), "--profile", profile] + [
+                f"--{k.replace('_', '-')}={v}" for k, v in vars(args).items() if k != "profile"
+            ]
+            out = subprocess.run(cmd, env=env, cwd=workdir, capture_output=True, text=True)
+            if out.returncode != 0:
+                sys.exit(out.stderr)
+            rows.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{args.writers} thread ghi, {args.readers} thread đọc, {args.seconds}s")
+    print(f"{'profile':>9} {'journal':>8} {'đọc/s':>9} {'đọc p95':>9} {'ghi/s':>8} {'ghi p95':>9} {'lỗi':>5}")
+    for r in rows:
+        print(f"{r['profile']:>9} {r['journal_mode']:>8} {r['read']['ops_per_sec']:>9} {str(r['read']['p95_ms']):>9} "
+              f"{r['write']['ops_per_sec']:>8} {str(r['write']['p95_ms']):>9} {r['errors']:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Sinh template cho bộ phân loại giấy tờ cục bộ (app/services/doc_classifier.py).
+
+Thư mục ảnh mẫu có dạng <input>/<Loại giấy tờ>/*.jpg, VD:
+  refs/CCCD/cccd_mat_truoc_01.jpg
+  refs/Bằng lái xe/gplx_pet_01.png
+Mỗi ảnh mẫu (đã crop sát thẻ) thành một template gồm dHash, histogram màu và tỉ lệ khung.
+Sau khi build, script chạy lại classifier trên chính các ảnh mẫu (leave-one-out) để báo
+độ chính xác và số ảnh rơi xuống LLM với ngưỡng hiện tại.
+
+Usage:
+  python tools/build_doc_templates.py refs/
+  python tools/build_doc_templates.py refs/ --replace --out app/data/doc_templates.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+from app.services.doc_classifier import DocumentClassifier, extract_features  # noqa: E402
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def build_templates(input_dir: str) -> list:
+    templates = []
+    for doc_type in sorted(os.listdir(input_dir)):
+        type_dir = os.path.join(input_dir, doc_type)
+        if not os.path.isdir(type_dir):
+            continue
+        for filename in sorted(os.listdir(type_dir)):
+            if not filename.lower().endswith(IMAGE_EXTS):
+                continue
+            with open(os.path.join(type_dir, filename), "rb") as f:
+                features = extract_features(f.read())
+            if features.texture < settings.DOC_CLASSIFIER_MIN_TEXTURE:
+                print(f"  Bỏ {doc_type}/{filename}: ảnh quá ít chi tiết (texture {features.texture:.3f}), "
+                      "classifier sẽ không dùng ảnh như vậy")
+                continue
+            templates.append({
+                "type": doc_type,
+                "name": os.path.splitext(filename)[0],
+                "source": f"reference:{doc_type}/{filename}",
+                "aspect": round(features.aspect, 4),
+                "mean_color": [round(c, 4) for c in features.mean_color],
+                "color_hist": [round(h, 4) for h in features.color_hist],
+                "dhash": f"{features.dhash:016x}",
+            })
+    return templates
+
+
+def evaluate(out_path: str, input_dir: str, templates: list):
+    """Leave-one-out: bỏ template của chính ảnh đó rồi phân loại lại."""
+    correct = unsure = wrong = 0
+    timings = []
+    for template in templates:
+        if not template["source"].startswith("reference:"):
+            continue
+        with open(out_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        data["templates"] = [t for t in data["templates"] if t.get("source") != template["source"]]
+        tmp_path = out_path + ".loo.json"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        classifier = DocumentClassifier(tmp_path)
+        os.remove(tmp_path)
+
+        with open(os.path.join(input_dir, template["source"].split(":", 1)[1]), "rb") as f:
+            content = f.read()
+        start = time.perf_counter()
+        result = classifier.classify(content)
+        timings.append((time.perf_counter() - start) * 1000)
+        if result.type is None:
+            unsure += 1
+        elif result.type == template["type"]:
+            correct += 1
+        else:
+            wrong += 1
+            print(f"  SAI: {template['source']} -> {result.type} ({result.confidence:.2f})")
+    total = correct + unsure + wrong
+    if total:
+        print(f"Leave-one-out: đúng {correct}/{total}, cần LLM {unsure}, sai {wrong}, "
+              f"trung bình {sum(timings) / total:.1f} ms/ảnh (ngưỡng {settings.DOC_CLASSIFIER_THRESHOLD})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_dir")
+    parser.add_argument("--out", default=settings.DOC_CLASSIFIER_TEMPLATES_PATH)
+    parser.add_argument("--replace", action="store_true", help="Xoá toàn bộ template cũ")
+    args = parser.parse_args()
+
+    new_templates = build_templates(args.input_dir)
+    if not new_templates:
+        sys.exit(f"Không tìm thấy ảnh mẫu trong {args.input_dir}/<Loại giấy tờ>/")
+
+    data = {"version": 1, "templates": []}
+    if not args.replace and os.path.exists(args.out):
+        with open(args.out, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        sources = {t["source"] for t in new_templates}
+        data["templates"] = [t for t in data.get("templates", []) if t.get("source") not in sources]
+    data["templates"].extend(new_templates)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"Đã ghi {len(new_templates)} template mới ({len(data['templates'])} tổng) vào {args.out}")
+    evaluate(args.out, args.input_dir, new_templates)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Kiểm tra hồi quy thời gian khởi động (chạy trong CI / trước khi deploy; exit code 1 nếu vượt).
+
+Đây là script dòng lệnh, không phải test pytest: chỉ đo `import main` trong process mới, không kiểm tra
+hành vi lúc chạy (VD: request chat trong lúc warm-up nền chưa xong - xem RAGService.ensure_ready).
+
+- `import main` (dựng app + đăng ký router) phải nằm trong STARTUP_IMPORT_BUDGET_MS
+  (lấy lần nhanh nhất trong `--runs` process mới để bớt nhiễu).
+- Không dependency nặng nào trong HEAVY_MODULES được import lúc khởi động: chúng phải được
+  import ở lần dùng đầu tiên (get_llm, OCRService.model, RAGService, docx_renderer...).
+  Vi phạm được in kèm chuỗi import để biết module app nào kéo vào.
+
+Usage:
+  python tools/check_startup_budget.py
+  python tools/check_startup_budget.py --budget-ms 1500 --runs 5
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.import_profile import import_chain, profile_imports  # noqa: E402
+
+# SDK / thư viện NLP chỉ cần khi thật sự gọi LLM, OCR, tách từ hoặc dựng DOCX
+HEAVY_MODULES = [
+    "langchain_openai",
+    "openai",
+    "google.generativeai",
+    "underthesea",
+    "docx",
+    "pdfplumber",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Mặc định: settings.STARTUP_IMPORT_BUDGET_MS")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.budget_ms is None:
+        from app.core.config import settings
+        args.budget_ms = settings.STARTUP_IMPORT_BUDGET_MS
+
+    timings = []
+    records = []
+    for _ in range(args.runs):
+        records = profile_imports(args.module)
+        total = next(r for r in records if r.name == args.module)
+        timings.append(total.cumulative_us / 1000)
+    best = min(timings)
+
+    failures = []
+    if best > args.budget_ms:
+        failures.append(f"import {args.module} mất {best:.0f} ms > ngân sách {args.budget_ms:.0f} ms")
+    for record in records:
+        if record.name in HEAVY_MODULES:
+            failures.append(f"{record.name} bị import lúc khởi động ({record.cumulative_us / 1000:.0f} ms): "
+                            + " -> ".join(import_chain(record)))
+
+    print(f"import {args.module}: {', '.join(f'{t:.0f}' for t in timings)} ms (tốt nhất {best:.0f} ms, "
+          f"ngân sách {args.budget_ms:.0f} ms)")
+    if failures:
+        print("FAIL")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+    print("OK: không import dependency nặng lúc khởi động")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Báo cáo thời gian import lúc khởi động (dựa trên `python -X importtime`).
+
+Chạy `import <module>` trong process mới (không có cache module) rồi in:
+- các module tốn nhiều thời gian nhất (tính cả module con),
+- tổng thời gian theo package gốc (thời gian riêng, không đếm trùng),
+- chuỗi import từ code app tới từng dependency nặng (`--why langchain_openai`).
+
+Usage:
+  python tools/import_profile.py
+  python tools/import_profile.py --module app.api.v1.contracts --top 40
+  python tools/import_profile.py --why google.generativeai --why underthesea
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class ImportRecord:
+    name: str
+    depth: int
+    self_us: int
+    cumulative_us: int
+    parent: Optional["ImportRecord"] = None
+
+
+def profile_imports(module: str = "main", env: dict = None) -> List[ImportRecord]:
+    """Import `module` trong process con với -X importtime, trả về danh sách module theo thứ tự log."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} lỗi:\n{proc.stderr[-3000:]}")
+    records = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        records.append(ImportRecord(name.strip(), depth, int(self_us), int(cumulative_us)))
+    # importtime ghi module con trước module cha: cha là dòng gần nhất phía sau có depth nhỏ hơn
+    pending: List[ImportRecord] = []
+    for record in records:
+        while pending and pending[-1].depth > record.depth:
+            pending.pop().parent = record
+        pending.append(record)
+    return records
+
+
+def import_chain(record: ImportRecord) -> List[str]:
+    chain = []
+    while record is not None:
+        chain.append(record.name)
+        record = record.parent
+    return list(reversed(chain))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--why", action="append", default=[], help="In chuỗi import dẫn tới module này")
+    args = parser.parse_args()
+
+    records = profile_imports(args.module)
+    total = next((r for r in records if r.name == args.module), records[-1])
+    print(f"import {args.module}: {total.cumulative_us / 1000:.0f} ms ({len(records)} module)\n")
+
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for r in sorted(records, key=lambda r: r.cumulative_us, reverse=True)[:args.top]:
+        print(f"{r.cumulative_us / 1000:>14.1f} {r.self_us / 1000:>8.1f}  {'  ' * r.depth}{r.name}")
+
+    by_package = defaultdict(int)
+    for r in records:
+        by_package[r.name.split(".", 1)[0]] += r.self_us
+    print(f"\n{'self ms':>8}  package")
+    for package, self_us in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:>8.1f}  {package}")
+
+    for name in args.why:
+        record = next((r for r in records if r.name == name), None)
+        print(f"\n{name}: " + (" -> ".join(import_chain(record)) if record else "không được import"))
+
+
+if __name__ == "__main__":
+    main()
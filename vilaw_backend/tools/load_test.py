@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""Async load generator cho toàn bộ API của ViLaw backend.
+
+Mỗi "virtual user" lặp lại các kịch bản (chat SSE, draft, check-risk, procedures guide,
+document analyze, admin upload) cho tới khi hết thời gian chạy. Kết quả (p50/p95/p99,
+time-to-first-byte, khoảng trễ giữa các chunk stream, error rate, throughput) được
+ghi ra file JSON để so sánh giữa các bản build. Cần cài thêm: pip install httpx
+
+Usage examples:
+  python load_test.py --base http://localhost:8000 --concurrency 20 --ramp-up 10 --duration 60
+  python load_test.py --routes chat,check-risk --weights chat=4 --label pr-123 --out results.json
+  python load_test.py --routes chat --duration 30 --compare baseline.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+from test_chat_stream_simple import DEFAULT_BASE, EXAMPLES
+
+
+CHAT_QUESTIONS = [
+    "Người lao động nghỉ việc không báo trước thì có phải bồi thường không?",
+    "Thời gian thử việc tối đa theo Bộ luật Lao động là bao lâu?",
+    "Hợp đồng thuê nhà có bắt buộc phải công chứng không?",
+    "Mức phạt vi phạm hợp đồng thương mại tối đa là bao nhiêu?",
+]
+
+PROCEDURE_QUERIES = [
+    "Thủ tục làm hộ chiếu phổ thông lần đầu",
+    "Thủ tục đăng ký kết hôn",
+    "Thủ tục cấp lại căn cước công dân bị mất",
+]
+
+RISK_SAMPLE = {
+    "contract_type": "Hợp đồng lao động",
+    "content": (
+        "Điều 1: Lương. Bên A trả cho bên B mức lương 2 triệu đồng/tháng.\n"
+        "Điều 2: Thời gian làm việc 12 tiếng/ngày, kể cả thứ bảy và chủ nhật.\n"
+        "Điều 3: Nếu Bên B nghỉ việc trước hạn phải nộp phạt 50% tổng lương đã nhận."
+    ),
+}
+
+UPLOAD_SAMPLE = [
+    {"title": "Điều 1. Phạm vi điều chỉnh (load test)", "content": "Văn bản mẫu dùng cho kiểm thử tải."},
+]
+
+ALL_ROUTES = ["chat", "draft", "check-risk", "procedures", "analyze", "upload"]
+
+
+@dataclass
+class Sample:
+    route: str
+    started_at: float
+    latency: float
+    status: int = 0
+    ok: bool = False
+    ttfb: Optional[float] = None
+    chunk_gaps: List[float] = field(default_factory=list)
+    bytes_received: int = 0
+    error: Optional[str] = None
+
+
+def _sample_png() -> bytes:
+    """Ảnh PNG nhỏ cho endpoint /documents/analyze (tạo một lần, dùng lại)."""
+    try:
+        from PIL import Image, ImageDraw
+
+        img = Image.new("RGB", (640, 400), "white")
+        draw = ImageDraw.Draw(img)
+        draw.text((20, 20), "CONG HOA XA HOI CHU NGHIA VIET NAM", fill="black")
+        draw.text((20, 60), "CAN CUOC CONG DAN - LOAD TEST", fill="black")
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        return buf.getvalue()
+    except ImportError:
+        # PNG 1x1 trắng nếu không có Pillow
+        return bytes.fromhex(
+            "89504e470d0a1a0a0000000d4948445200000001000000010802000000907753de"
+            "0000000c4944415408d763f8ffff3f0005fe02fea7d6a4f40000000049454e44ae426082"
+        )
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.base = args.base.rstrip("/")
+        self.routes = args.routes
+        self.weights = [args.weights.get(r, 1.0) for r in self.routes]
+        self.concurrency = args.concurrency
+        self.ramp_up = args.ramp_up
+        self.duration = args.duration
+        self.timeout = args.req_timeout
+        self.think_time = args.think_time
+        self.samples: List[Sample] = []
+        self._png = _sample_png() if "analyze" in self.routes else b""
+        self._deadline = 0.0
+
+    # --- Kịch bản cho từng route ---
+
+    def _build_request(self, route: str) -> dict:
+        if route == "chat":
+            return {
+                "method": "POST",
+                "url": "/api/v1/chat/stream",
+                "json": {"message": random.choice(CHAT_QUESTIONS), "conversation_id": f"load-{random.randint(1, 10**6)}"},
+            }
+        if route == "draft":
+            doc_type = random.choice(list(EXAMPLES))
+            metadata = dict(EXAMPLES[doc_type])
+            summary = metadata.pop("summary", "")
+            return {
+                "method": "POST",
+                "url": "/api/v1/contracts/draft",
+                "json": {"document_type": doc_type, "summary": summary, "metadata": metadata},
+            }
+        if route == "check-risk":
+            return {"method": "POST", "url": "/api/v1/contracts/check-risk", "json": RISK_SAMPLE}
+        if route == "procedures":
+            return {"method": "GET", "url": "/api/v1/procedures/guide", "params": {"query": random.choice(PROCEDURE_QUERIES)}}
+        if route == "analyze":
+            return {
+                "method": "POST",
+                "url": "/api/v1/documents/analyze",
+                "files": {"file": ("loadtest_cccd.png", self._png, "image/png")},
+            }
+        if route == "upload":
+            payload = json.dumps(UPLOAD_SAMPLE, ensure_ascii=False).encode("utf-8")
+            return {
+                "method": "POST",
+                "url": "/api/v1/db/upload",
+                "files": {"file": ("loadtest_upload.json", payload, "application/json")},
+            }
+        raise ValueError(f"Unknown route: {route}")
+
+    async def _run_one(self, client: httpx.AsyncClient, route: str) -> Sample:
+        req = self._build_request(route)
+        method, url = req.pop("method"), req.pop("url")
+        start = time.perf_counter()
+        sample = Sample(route=route, started_at=time.time(), latency=0.0)
+        try:
+            # Dùng stream cho mọi request để đo TTFB thống nhất
+            async with client.stream(method, url, **req) as resp:
+                sample.status = resp.status_code
+                last = None
+                async for chunk in resp.aiter_raw():
+                    now = time.perf_counter()
+                    if last is None:
+                        sample.ttfb = now - start
+                    else:
+                        sample.chunk_gaps.append(now - last)
+                    last = now
+                    sample.bytes_received += len(chunk)
+            sample.ok = 200 <= sample.status < 400
+            if not sample.ok:
+                sample.error = f"HTTP {sample.status}"
+        except Exception as e:
+            sample.error = f"{type(e).__name__}: {e}"
+        sample.latency = time.perf_counter() - start
+        return sample
+
+    async def _user(self, client: httpx.AsyncClient, delay: float):
+        await asyncio.sleep(delay)
+        while time.perf_counter() < self._deadline:
+            route = random.choices(self.routes, weights=self.weights)[0]
+            self.samples.append(await self._run_one(client, route))
+            if self.think_time:
+                await asyncio.sleep(self.think_time)
+
+    async def run(self) -> float:
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        timeout = httpx.Timeout(self.timeout)
+        started = time.perf_counter()
+        self._deadline = started + self.ramp_up + self.duration
+        async with httpx.AsyncClient(base_url=self.base, limits=limits, timeout=timeout) as client:
+            step = self.ramp_up / self.concurrency if self.concurrency else 0
+            await asyncio.gather(*(self._user(client, i * step) for i in range(self.concurrency)))
+        return time.perf_counter() - started
+
+
+# --- Thống kê ---
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Percentile nội suy tuyến tính (giống numpy 'linear')."""
+    if not values:
+        return None
+    data = sorted(values)
+    k = (len(data) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(data) - 1)
+    return data[lo] + (data[hi] - data[lo]) * (k - lo)
+
+
+def _dist(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict[str, dict]:
+    by_route: Dict[str, List[Sample]] = {}
+    for s in samples:
+        by_route.setdefault(s.route, []).append(s)
+    by_route["__all__"] = list(samples)
+
+    summary = {}
+    for route, items in by_route.items():
+        errors = [s for s in items if not s.ok]
+        statuses: Dict[str, int] = {}
+        for s in items:
+            key = str(s.status) if s.status else "exception"
+            statuses[key] = statuses.get(key, 0) + 1
+        gaps = [g for s in items for g in s.chunk_gaps]
+        summary[route] = {
+            "requests": len(items),
+            "errors": len(errors),
+            "error_rate": len(errors) / len(items) if items else 0.0,
+            "throughput_rps": len(items) / elapsed if elapsed else 0.0,
+            "latency": _dist([s.latency for s in items if s.ok]),
+            "ttfb": _dist([s.ttfb for s in items if s.ok and s.ttfb is not None]),
+            "chunk_gap": _dist(gaps),
+            "bytes_received": sum(s.bytes_received for s in items),
+            "status_codes": statuses,
+            "sample_errors": sorted({s.error for s in errors if s.error})[:5],
+        }
+    return summary
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _fmt(v: Optional[float]) -> str:
+    return "-" if v is None else f"{v * 1000:8.1f}ms"
+
+
+def print_summary(summary: Dict[str, dict]):
+    print(f"{'route':<12}{'req':>6}{'err%':>7}{'rps':>8}{'p50':>11}{'p95':>11}{'p99':>11}{'ttfb p95':>11}{'gap p99':>11}")
+    for route, s in summary.items():
+        print(
+            f"{route:<12}{s['requests']:>6}{s['error_rate'] * 100:>6.1f}%{s['throughput_rps']:>8.2f}"
+            f"{_fmt(s['latency']['p50']):>11}{_fmt(s['latency']['p95']):>11}{_fmt(s['latency']['p99']):>11}"
+            f"{_fmt(s['ttfb']['p95']):>11}{_fmt(s['chunk_gap']['p99']):>11}"
+        )
+
+
+def print_comparison(current: Dict[str, dict], baseline_path: str):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f).get("summary", {})
+    print(f"\nSo sánh với {baseline_path}:")
+    print(f"{'route':<12}{'p95 base':>11}{'p95 now':>11}{'Δp95':>9}{'rps base':>10}{'rps now':>9}{'err base':>10}{'err now':>9}")
+    for route, cur in current.items():
+        base = baseline.get(route)
+        if not base:
+            continue
+        b95, c95 = base["latency"]["p95"], cur["latency"]["p95"]
+        delta = f"{(c95 - b95) / b95 * 100:+.1f}%" if b95 and c95 else "-"
+        print(
+            f"{route:<12}{_fmt(b95):>11}{_fmt(c95):>11}{delta:>9}"
+            f"{base['throughput_rps']:>10.2f}{cur['throughput_rps']:>9.2f}"
+            f"{base['error_rate'] * 100:>9.1f}%{cur['error_rate'] * 100:>8.1f}%"
+        )
+
+
+def _parse_weights(raw: Optional[str]) -> Dict[str, float]:
+    weights = {}
+    for part in (raw or "").split(","):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            weights[k.strip()] = float(v)
+    return weights
+
+
+def build_parser(parser: Optional[argparse.ArgumentParser] = None) -> argparse.ArgumentParser:
+    parser = parser or argparse.ArgumentParser(description="Async load test cho ViLaw backend")
+    parser.add_argument("--base", default=DEFAULT_BASE, help="Base URL of backend")
+    parser.add_argument("--routes", default=",".join(ALL_ROUTES), help=f"Danh sách route, chọn trong: {','.join(ALL_ROUTES)}")
+    parser.add_argument("--weights", default="", help="Trọng số theo route, ví dụ: chat=5,draft=1")
+    parser.add_argument("--concurrency", type=int, default=10, help="Số virtual user chạy song song")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="Thời gian (giây) để khởi động đủ số user")
+    parser.add_argument("--duration", type=float, default=30.0, help="Thời gian (giây) chạy tải sau ramp-up")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Nghỉ giữa hai request của một user (giây)")
+    parser.add_argument("--req-timeout", type=float, default=120.0, help="HTTP request timeout in seconds")
+    parser.add_argument("--label", default=None, help="Nhãn build (mặc định: git commit hiện tại)")
+    parser.add_argument("--out", default="load_test_results.json", help="File JSON kết quả")
+    parser.add_argument("--raw", action="store_true", help="Ghi cả từng sample vào file kết quả")
+    parser.add_argument("--compare", default=None, help="File kết quả baseline để so sánh")
+    return parser
+
+
+def run_from_args(args) -> dict:
+    args.routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = [r for r in args.routes if r not in ALL_ROUTES]
+    if unknown:
+        raise SystemExit(f"Route không hợp lệ: {unknown}")
+    args.weights = _parse_weights(args.weights)
+
+    test = LoadTest(args)
+    print(f"Load test {args.routes} @ {args.base}: {args.concurrency} users, ramp-up {args.ramp_up}s, duration {args.duration}s")
+    elapsed = asyncio.run(test.run())
+    summary = summarize(test.samples, elapsed)
+
+    result = {
+        "meta": {
+            "label": args.label or _git_commit(),
+            "base": args.base,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "elapsed_s": elapsed,
+            "config": {
+                "routes": args.routes,
+                "weights": args.weights,
+                "concurrency": args.concurrency,
+                "ramp_up": args.ramp_up,
+                "duration": args.duration,
+                "think_time": args.think_time,
+            },
+        },
+        "summary": summary,
+    }
+    if args.raw:
+        result["samples"] = [asdict(s) for s in test.samples]
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print_summary(summary)
+    print(f"\nĐã ghi kết quả vào {args.out}")
+    if args.compare:
+        print_comparison(summary, args.compare)
+    return result
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    run_from_args(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -4,8 +4,10 @@
 Usage examples:
   python test_chat_stream_simple.py --base http://localhost:8000 --action draft_all
   python test_chat_stream_simple.py --base http://localhost:8000 --action draft --type "Đơn Khiếu Nại"
+  python test_chat_stream_simple.py --base http://localhost:8000 --action load --concurrency 20 --duration 60
 
 This script sends example metadata for four document types and prints brief response info.
+`--action load` runs the async load generator in load_test.py (all remaining flags are passed through).
 """
 import argparse
 import json
@@ -86,14 +88,21 @@ def post_draft(base_url: str, document_type: str, metadata: dict, timeout: int =
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--base", default=DEFAULT_BASE, help="Base URL of backend")
-    parser.add_argument("--action", default="draft_all", choices=["draft_all", "draft"], help="Action to run")
+    parser.add_argument("--action", default="draft_all", choices=["draft_all", "draft", "load"], help="Action to run")
     parser.add_argument("--type", help="Document type (if action=draft)")
     parser.add_argument("--metadata", help="JSON string of metadata (optional)")
     parser.add_argument("--req-timeout", type=int, default=120, help="HTTP request timeout in seconds (default 120)")
-    args = parser.parse_args()
+    args, extra = parser.parse_known_args()
 
     base = args.base
 
+    if args.action == "load":
+        from load_test import build_parser, run_from_args
+        load_args = build_parser().parse_args(["--base", base, "--req-timeout", str(args.req_timeout)] + extra)
+        run_from_args(load_args)
+        return
+    if extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
 
     if args.action == "draft_all":
         for doc_type, meta in EXAMPLES.items():
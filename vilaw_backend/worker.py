@@ -0,0 +1,35 @@
+"""
+Worker xử lý job nền (bảng `jobs` trong SQLite): PDF ingest, build lại index RAG...
+Chạy song song với API để request không phải gánh việc nặng; có thể chạy nhiều process.
+
+Usage:
+  python worker.py                          # mọi job type, JOB_WORKER_CONCURRENCY job cùng lúc
+  python worker.py --types pdf_ingest --concurrency 4
+Khi đã chạy worker riêng, đặt JOB_INPROCESS_WORKER=false cho process API.
+"""
+import argparse
+import asyncio
+import signal
+
+from app.db.init import init_db
+from app.services.job_queue import JobWorker
+
+
+async def main(args):
+    init_db()
+    worker = JobWorker(concurrency=args.concurrency, types=args.types)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        # Dừng nhận job mới và chờ các job đang chạy xong (kill -9: job được nhận lại khi hết lease)
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+    from app.services.pdf_ingest import PdfIngestService
+    PdfIngestService().shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=None, help="Số job chạy đồng thời")
+    parser.add_argument("--types", nargs="*", default=None, help="Chỉ nhận các job type này")
+    asyncio.run(main(parser.parse_args()))